@@ -1,12 +1,61 @@
+"""The application factory.
+
+    from app import create_app
+    app = create_app()  # APP_SETTINGS, or create_app('config.TestingConfig')
+
+Importing the package only sets up ``db``; the models, views and the
+extensions they need load with the first ``create_app``.
+"""
 import os
+
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 
+from database import Database
+
+db = Database()
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_object(config or os.environ['APP_SETTINGS'])
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    # forks the hash pool first, before anything starts a thread
+    import hashing
+    hashing.init_app(app)
 
-app = Flask(__name__)
+    import json_provider
+    import response_cache
+    import revocation
+    from auth import auth, jwt
+    from models import user_cache
+    from pagination import _count_cache
+    from tokens import token_cache
+    from views import api
 
-app.config.from_object(os.environ['APP_SETTINGS'])
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+    # the process wide caches take the sizes of the app
+    user_cache.configure(app.config['USER_CACHE_SIZE'],
+                         app.config['USER_CACHE_TTL'])
+    token_cache.configure(app.config['JWT_VERIFY_CACHE_SIZE'],
+                          app.config['JWT_VERIFY_CACHE_TTL'])
+    _count_cache.configure(app.config['API_COUNT_CACHE_SIZE'],
+                           app.config['API_COUNT_CACHE_TTL'])
+    json_provider.init_app(app)
+    response_cache.init_app(app)
+    revocation.init_app(app)
+    jwt.init_app(app)
+    app.register_blueprint(auth)
+    app.register_blueprint(api)
 
-from views import *
\ No newline at end of file
+    if app.config['INSTRUMENTATION']:
+        import instrumentation
+        instrumentation.init_app(app, db)
+    # after the instrumentation: after_request hooks run last registered
+    # first, so the compression is timed, and before_request hooks in order,
+    # so the requests the rate limits reject are recorded
+    import compression
+    import rate_limit
+    compression.init_app(app)
+    rate_limit.init_app(app)
+    return app
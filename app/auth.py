@@ -0,0 +1,130 @@
+"""auth.py -- sign up, login, logout and token refresh."""
+from functools import wraps
+
+from flask import Blueprint, current_app, request, session
+from flask_jwt_extended import JWTManager, \
+    create_access_token, create_refresh_token, get_jwt_identity, \
+    get_jwt_claims
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from json_provider import jsonify
+from models import User, find_user
+from hashing import verify_password, needs_rehash
+from tokens import access_token_required, refresh_token_required, \
+    raw_header_token
+from revocation import revoke_encoded_token
+
+auth = Blueprint('auth', __name__)
+jwt = JWTManager()
+
+
+def jwt_only():
+    return current_app.config['AUTH_MODE'] == 'jwt'
+
+
+@jwt.user_claims_loader
+def add_claims_to_access_token(identity):
+    user = find_user(username=identity)
+    return {'user_id': user.id if user else None}
+
+
+def current_user_id():
+    # the token is already verified in jwt mode, otherwise use the session
+    if jwt_only():
+        return get_jwt_claims().get('user_id')
+    return session.get('user_id')
+
+
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user_id = session.get('user_id')
+        if not user_id or find_user(user_id=user_id) is None:
+            return jsonify({"message": "Please login to continue", "next": request.path}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_auth_required(f):
+    """The access token, and the login session unless AUTH_MODE is jwt."""
+    with_token = access_token_required(f)
+    with_session = access_token_required(login_required(f))
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if jwt_only():
+            return with_token(*args, **kwargs)
+        return with_session(*args, **kwargs)
+    return decorated_function
+
+
+@auth.route('/sign_up', methods=['POST'])
+def sign_up():
+    # TODO - better/generic exception handling
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "Please input the username and password."})
+    new_user = User(username=data['username'], password=data['password'])
+    db.session.add(new_user)
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        return jsonify({"message": "The username already in DB."}), 409
+    except Exception as e:
+        return jsonify({"message": e.message})
+    return jsonify({"message": "User Created Successfully.", "username": data['username']})
+
+
+@auth.route('/login', methods=['POST'])
+def login():
+    username = request.json.get('username', None)
+    password = request.json.get('password', None)
+    # not through find_user, a password changed by another process must
+    # count right away
+    user = db.session.query(User.id, User.password) \
+        .filter(User.username == username).first()
+    if not user or not verify_password(user.password, password):
+        return jsonify({"msg": "Bad username or password"}), 401
+    if needs_rehash(user.password):
+        User.query.get(user.id).set_password(password)
+        db.session.commit()
+
+    if not jwt_only():
+        session['user_id'] = user.id
+        session['logged_in'] = True
+    # Use create_access_token() and create_refresh_token() to create our
+    # access and refresh tokens
+    ret = {
+        'access_token': create_access_token(identity=username),
+        'refresh_token': create_refresh_token(identity=username)
+    }
+    return jsonify(ret), 200
+
+
+@auth.route('/logout', methods=['GET', 'POST'])
+def logout():
+    session.pop('logged_in', None)
+    session.pop('user_id', None)
+    # revoke the access token of the header and the refresh token of the body
+    revoke_encoded_token(raw_header_token())
+    data = request.get_json(silent=True) or {}
+    revoke_encoded_token(data.get('refresh_token'))
+    ret = {
+        'message': 'Logged out successfully.'
+    }
+    return jsonify(ret), 200
+
+# Refresh token endpoint. This will generate a new access token from
+# the refresh token, but will mark that access token as non-fresh
+# (so that it cannot access any endpoint protected via the
+# fresh_jwt_required decorator)
+
+
+@auth.route('/refresh', methods=['POST'])
+@refresh_token_required
+def refresh():
+    current_user = get_jwt_identity()
+    new_token = create_access_token(identity=current_user, fresh=False)
+    ret = {'access_token': new_token}
+    return jsonify(ret), 200
@@ -0,0 +1,276 @@
+"""bulk.py -- batched create/update/delete endpoints."""
+from flask import current_app, request, json
+from flask.views import MethodView
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from json_provider import jsonify
+
+
+def _is_id(value):
+    # JSON booleans are ints too
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+# the integers a column type stores, as in PostgreSQL
+_INTEGER_BITS = {'SmallInteger': 16, 'Integer': 32, 'BigInteger': 64}
+
+
+def _invalid(name, column, value):
+    """Why ``value`` cannot be stored in ``column``, None if it can."""
+    if value is None:
+        return None if column.nullable else '{} cannot be null.'.format(name)
+    python_type = column.type.python_type
+    if python_type in (int, long):
+        bits = _INTEGER_BITS.get(type(column.type).__name__, 64)
+        if not _is_id(value) or not -2 ** (bits - 1) <= value < 2 ** (bits - 1):
+            return '{} must be an integer of {} bits.'.format(name, bits)
+    elif python_type is str:
+        if not isinstance(value, basestring):
+            return '{} must be a string.'.format(name)
+        length = column.type.length
+        if length is not None and len(value) > length:
+            return '{} is longer than {} characters.'.format(name, length)
+    return None
+
+
+def get_bulk_data():
+    """Rows of a JSON array or an application/x-ndjson body, None if invalid."""
+    if request.mimetype == 'application/x-ndjson':
+        try:
+            return [json.loads(line) for line in
+                    request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            return None
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'ids' in data:
+        data = data['ids']
+    if not isinstance(data, list):
+        return None
+    return data
+
+
+def _chunks(items):
+    size = current_app.config['API_BULK_CHUNK_SIZE']
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _conflict(index, message):
+    return {'index': index, 'status': 409, 'message': message}
+
+
+def _not_found(index, row_id):
+    return {'index': index, 'id': row_id, 'status': 404,
+            'message': 'Not found.'}
+
+
+class BulkAPI(MethodView):
+    """Batch counterpart of a ``register_api`` resource.
+
+    Subclasses set the ``model``, its writable ``fields``, the ``required``
+    ones on create and the ``unique`` column. Every row of the batch is
+    validated before anything is written, rows are then written in chunks
+    of API_BULK_CHUNK_SIZE per transaction and unique conflicts are reported
+    per row instead of failing the batch.
+    """
+    model = None
+    fields = ()
+    required = ()
+    unique = None
+
+    def defaults(self):
+        """Values set on every created row."""
+        return {}
+
+    def scope(self, query):
+        """Restricts the rows that can be updated or deleted."""
+        return query
+
+    def _validate(self, rows, for_update=False):
+        if rows is None:
+            return [{'message': 'Provide a JSON array or NDJSON body.'}]
+        if len(rows) > current_app.config['API_BULK_MAX_ROWS']:
+            return [{'message': 'At most {} rows per batch.'.format(
+                current_app.config['API_BULK_MAX_ROWS'])}]
+        errors = []
+        allowed = set(self.fields) | ({'id'} if for_update else set())
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                errors.append({'index': index, 'message': 'Row must be an object.'})
+                continue
+            unknown = set(row) - allowed
+            if unknown:
+                errors.append({'index': index, 'message': 'Unknown field(s): {}.'.format(
+                    ', '.join(sorted(unknown)))})
+            # the types are checked here, a value the database refuses would
+            # fail the batch after its first chunks are committed
+            for name in sorted(allowed.intersection(row)):
+                message = _invalid(name, self.model.__table__.c[name], row[name])
+                if message:
+                    errors.append({'index': index, 'message': message})
+            if for_update:
+                if 'id' not in row:
+                    errors.append({'index': index, 'message': 'Must provide id.'})
+                if not all(row[k] for k in self.required if k in row):
+                    errors.append({'index': index, 'message': '{} cannot be empty.'.format(
+                        ', '.join(self.required))})
+            elif not all(row.get(k) for k in self.required):
+                errors.append({'index': index, 'message': 'Must provide {}.'.format(
+                    ', '.join(self.required))})
+        return errors
+
+    def _taken(self, values):
+        """Unique values already stored, as value -> id."""
+        column = getattr(self.model, self.unique)
+        if not values:
+            return {}
+        return dict(db.session.query(column, self.model.id)
+                    .filter(column.in_(values)))
+
+    def _write(self, statement, params):
+        """Executes one chunk; on a race with another writer falls back to
+        one row per transaction and returns the indexes that conflicted."""
+        try:
+            db.session.execute(statement, [p for _, p in params])
+            db.session.commit()
+            return set()
+        except IntegrityError:
+            db.session.rollback()
+        conflicts = set()
+        for index, param in params:
+            try:
+                db.session.execute(statement, param)
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                conflicts.add(index)
+        return conflicts
+
+    def _response(self, results, message):
+        failed = sum(1 for r in results if 'status' in r)
+        ret = {
+            'message': message,
+            'data': results,
+            'succeeded': len(results) - failed,
+            'failed': failed
+        }
+        return jsonify(ret), 200
+
+    def post(self):
+        rows = get_bulk_data()
+        errors = self._validate(rows)
+        if errors:
+            return jsonify({'message': 'Invalid rows.', 'errors': errors}), 422
+        table = self.model.__table__
+        defaults = self.defaults()
+        results = [None] * len(rows)
+        seen = set()
+        for chunk in _chunks(list(enumerate(rows))):
+            taken = self._taken([row[self.unique] for _, row in chunk])
+            params = []
+            for index, row in chunk:
+                value = row[self.unique]
+                if value in taken or value in seen:
+                    results[index] = _conflict(
+                        index, '{} already exists.'.format(self.unique))
+                    continue
+                seen.add(value)
+                param = dict((k, None) for k in self.fields)
+                param.update(defaults)
+                param.update(row)
+                params.append((index, param))
+            if not params:
+                continue
+            conflicts = self._write(table.insert(), params)
+            # one query maps the chunk back to the generated ids
+            ids = self._taken([p[self.unique] for _, p in params])
+            for index, param in params:
+                if index in conflicts:
+                    results[index] = _conflict(
+                        index, '{} already exists.'.format(self.unique))
+                else:
+                    results[index] = {'index': index,
+                                      'id': ids.get(param[self.unique])}
+        return self._response(results, 'Bulk create done.')
+
+    def put(self):
+        rows = get_bulk_data()
+        errors = self._validate(rows, for_update=True)
+        if errors:
+            return jsonify({'message': 'Invalid rows.', 'errors': errors}), 422
+        table = self.model.__table__
+        results = [None] * len(rows)
+        seen = set()
+        for chunk in _chunks(list(enumerate(rows))):
+            chunk_ids = [row['id'] for _, row in chunk]
+            existing = set(row_id for (row_id,) in self.scope(
+                db.session.query(self.model.id)).filter(
+                    self.model.id.in_(chunk_ids)))
+            taken = self._taken(
+                [row[self.unique] for _, row in chunk if self.unique in row])
+            self.before_update(existing)
+            # partial updates, one executemany per set of updated fields
+            groups = {}
+            for index, row in chunk:
+                if row['id'] not in existing:
+                    results[index] = _not_found(index, row['id'])
+                    continue
+                value = row.get(self.unique)
+                if value is not None and (
+                        taken.get(value, row['id']) != row['id'] or value in seen):
+                    results[index] = _conflict(
+                        index, '{} already exists.'.format(self.unique))
+                    continue
+                if value is not None:
+                    seen.add(value)
+                param = dict(('b_' + k, v) for k, v in row.items())
+                groups.setdefault(tuple(sorted(row)), []).append((index, param))
+                results[index] = {'index': index, 'id': row['id']}
+            for keys, params in groups.items():
+                values = dict((k, bindparam('b_' + k)) for k in keys if k != 'id')
+                if not values:
+                    continue
+                statement = table.update().where(
+                    table.c.id == bindparam('b_id')).values(**values)
+                for index in self._write(statement, params):
+                    results[index] = _conflict(
+                        index, '{} already exists.'.format(self.unique))
+        return self._response(results, 'Bulk update done.')
+
+    def delete(self):
+        ids = get_bulk_data()
+        if ids is None:
+            return jsonify({'message': 'Provide a list of ids.'}), 422
+        id_column = self.model.__table__.c.id
+        errors = [{'index': index, 'message': message}
+                  for index, message in enumerate(
+                      _invalid('id', id_column, i) for i in ids) if message]
+        if errors:
+            return jsonify({'message': 'Invalid ids.', 'errors': errors}), 422
+        results = []
+        for chunk in _chunks(ids):
+            existing = set(row_id for (row_id,) in self.scope(
+                db.session.query(self.model.id)).filter(
+                    self.model.id.in_(chunk)))
+            if existing:
+                self.before_delete(existing)
+                db.session.execute(self.model.__table__.delete().where(
+                    self.model.id.in_(existing)))
+                db.session.commit()
+            for row_id in chunk:
+                index = len(results)
+                if row_id in existing:
+                    results.append({'index': index, 'id': row_id})
+                else:
+                    results.append(_not_found(index, row_id))
+        return self._response(results, 'Bulk delete done.')
+
+    def before_update(self, ids):
+        """Hook called with the ids of a chunk before it is updated."""
+        pass
+
+    def before_delete(self, ids):
+        """Hook to clear rows referencing the deleted ``ids``."""
+        pass
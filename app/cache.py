@@ -0,0 +1,123 @@
+"""cache.py -- bounded in-process caches."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """Thread safe LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Counts hits and misses so the size can be tuned, see ``stats``.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] <= time.time():
+                self.misses += 1
+                return default
+            # re-insert as most recently used
+            self._data[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry and entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def configure(self, maxsize, ttl):
+        """Applies the settings of an app, see create_app."""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize
+        }
+
+
+class FakeRedis(object):
+    """In-process stand-in for the parts of redis-py the shared stores use."""
+
+    def __init__(self):
+        self._values = {}
+        self._zsets = {}
+
+    def _entry(self, name):
+        entry = self._values.get(name)
+        if entry and entry[1] and entry[1] <= time.time():
+            del self._values[name]
+            entry = None
+        return entry
+
+    def get(self, name):
+        entry = self._entry(name)
+        return entry and entry[0]
+
+    def mget(self, names):
+        return [self.get(name) for name in names]
+
+    def set(self, name, value, ex=None):
+        self._values[name] = (value, ex and time.time() + ex)
+
+    def incr(self, name):
+        entry = self._entry(name)
+        value = int(entry[0] if entry else 0) + 1
+        self._values[name] = (str(value).encode('ascii'), entry and entry[1])
+        return value
+
+    def expire(self, name, seconds):
+        entry = self._entry(name)
+        if entry is None:
+            return False
+        self._values[name] = (entry[0], time.time() + seconds)
+        return True
+
+    def exists(self, name):
+        return int(self._entry(name) is not None)
+
+    def zadd(self, name, mapping):
+        self._zsets.setdefault(name, {}).update(mapping)
+        return len(mapping)
+
+    def zrangebyscore(self, name, low, high):
+        low, high = float(low), float(high)
+        return [member for member, score in sorted(
+            self._zsets.get(name, {}).items(), key=lambda item: item[1])
+            if low <= score <= high]
+
+    def zremrangebyscore(self, name, low, high):
+        zset = self._zsets.get(name, {})
+        removed = self.zrangebyscore(name, low, high)
+        for member in removed:
+            del zset[member]
+        return len(removed)
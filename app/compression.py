@@ -0,0 +1,91 @@
+"""compression.py -- negotiated gzip/brotli compression of responses.
+
+Responses of COMPRESSION_MIMETYPES of at least COMPRESSION_MIN_SIZE bytes
+are compressed with the first of COMPRESSION_ENCODINGS the client accepts:
+'br' (needs the brotli package, at COMPRESSION_BROTLI_QUALITY) is both
+faster and smaller than 'gzip' (zlib, at COMPRESSION_LEVEL) for our JSON.
+An empty COMPRESSION_ENCODINGS turns compression off.
+
+Cached responses (response_cache.py) are compressed in every encoding once,
+when they are stored, and served as they are; the after_request hook only
+compresses what is rendered per request. Streamed responses are left alone.
+A compressed response gets its own ETag, ``<etag>-<encoding>``.
+"""
+import zlib
+
+from flask import current_app, request
+
+from instrumentation import timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def available(config):
+    """The COMPRESSION_ENCODINGS this process can produce, in order."""
+    return [encoding for encoding in config['COMPRESSION_ENCODINGS']
+            if encoding == 'gzip' or (encoding == 'br' and brotli is not None)]
+
+
+def compress(body, encoding, config):
+    with timed('compress'):
+        if encoding == 'br':
+            return brotli.compress(
+                body, quality=config['COMPRESSION_BROTLI_QUALITY'])
+        # a gzip container straight from zlib, no GzipFile around a buffer
+        compressor = zlib.compressobj(config['COMPRESSION_LEVEL'],
+                                      zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush()
+
+
+def variants(body):
+    """``body`` by encoding: 'identity' and, when it is large enough, every
+    available encoding."""
+    config = current_app.config
+    bodies = {'identity': body}
+    if len(body) >= config['COMPRESSION_MIN_SIZE']:
+        for encoding in available(config):
+            bodies[encoding] = compress(body, encoding, config)
+    return bodies
+
+
+def negotiate(encodings):
+    """The first of ``encodings`` the request accepts, else None."""
+    accepted = request.accept_encodings
+    for encoding in encodings:
+        if accepted[encoding]:
+            return encoding
+    return None
+
+
+def variant_etag(etag, encoding):
+    return etag if encoding == 'identity' else '%s-%s' % (etag, encoding)
+
+
+def init_app(app):
+
+    @app.after_request
+    def compress_response(response):
+        config = app.config
+        if response.direct_passthrough or response.is_streamed or \
+                'Content-Encoding' in response.headers or \
+                response.status_code in (204, 206, 304) or \
+                response.mimetype not in config['COMPRESSION_MIMETYPES']:
+            return response
+        if response.calculate_content_length() < config['COMPRESSION_MIN_SIZE']:
+            return response
+        encodings = available(config)
+        if not encodings:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(encodings)
+        if encoding is None:
+            return response
+        response.set_data(compress(response.get_data(), encoding, config))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(variant_etag(etag, encoding), weak)
+        return response
@@ -0,0 +1,193 @@
+"""database.py -- engine setup: pool options, pool metrics, replica reads.
+
+The pool is configured per config class with the SQLALCHEMY_POOL_* keys of
+Flask-SQLAlchemy. SQLALCHEMY_POOL_PRE_PING tests every connection on
+checkout and transparently replaces the ones a failover closed.
+
+With SQLALCHEMY_REPLICA_URI set, the queries of GET/HEAD requests go to the
+replica; writes, flushes, everything outside a GET and the requests that
+called ``read_from_primary`` go to the primary.
+"""
+import threading
+import time
+
+from flask import g, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, exc, select
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = 'replica'
+
+
+class PoolMetrics(object):
+    """Counters fed by the pool events of one engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def waited(self, seconds):
+        with self._lock:
+            self.wait_time += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def stats(self):
+        pool = self.engine.pool
+        stats = {
+            'connects': self.connects,
+            'checkouts': self.checkouts,
+            'checkins': self.checkins,
+            'invalidations': self.invalidations,
+            'timeouts': self.timeouts,
+            'wait_time': round(self.wait_time, 6),
+            'max_wait': round(self.max_wait, 6),
+            'pool': type(pool).__name__
+        }
+        # only queue pools have a size
+        for name in ('size', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long checkouts wait for a connection."""
+
+    metrics = None
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            return QueuePool._do_get(self)
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.count('timeouts')
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.waited(time.time() - start)
+
+    def recreate(self):
+        # dispose() recreates the pool, e.g. after a disconnect
+        pool = QueuePool.recreate(self)
+        pool.metrics = self.metrics
+        return pool
+
+
+def _counter(metrics, name):
+    def listener(*args):
+        metrics.count(name)
+    return listener
+
+
+def _ping(connection, branch):
+    # the pessimistic disconnect handling recipe, a closed connection is
+    # invalidated by the failing SELECT and the retry reconnects
+    if branch:
+        return
+    should_close_with_result = connection.should_close_with_result
+    connection.should_close_with_result = False
+    try:
+        connection.scalar(select([1]))
+    except exc.DBAPIError as e:
+        if not e.connection_invalidated:
+            raise
+        connection.scalar(select([1]))
+    finally:
+        connection.should_close_with_result = should_close_with_result
+
+
+def read_from_primary():
+    """Sends the rest of the queries of the request to the primary, for
+    reads that must see the latest commits."""
+    g.read_from_primary = True
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._reads_from_replica(clause):
+            return self.db.get_engine(self.app, bind=REPLICA)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def _reads_from_replica(self, clause):
+        return (self.app.config['SQLALCHEMY_REPLICA_URI'] and
+                not self._flushing and
+                not isinstance(clause, UpdateBase) and
+                has_request_context() and
+                request.method in ('GET', 'HEAD') and
+                not g.get('read_from_primary'))
+
+
+class Database(SQLAlchemy):
+    """SQLAlchemy with pool metrics, pre-ping and replica routing."""
+
+    def __init__(self, *args, **kwargs):
+        self.pool_metrics = {}
+        self._metrics_lock = threading.Lock()
+        super(Database, self).__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_POOL_PRE_PING', False)
+        app.config.setdefault('SQLALCHEMY_REPLICA_URI', None)
+        if app.config['SQLALCHEMY_REPLICA_URI']:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds[REPLICA] = app.config['SQLALCHEMY_REPLICA_URI']
+            app.config['SQLALCHEMY_BINDS'] = binds
+        super(Database, self).init_app(app)
+
+    def create_session(self, options):
+        return RoutingSession(self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        super(Database, self).apply_driver_hacks(app, info, options)
+        if info.drivername.startswith('sqlite'):
+            # sqlite gets a NullPool/StaticPool, which take no sizes
+            for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(key, None)
+        else:
+            options.setdefault('poolclass', TimedQueuePool)
+
+    def get_engine(self, app, bind=None):
+        engine = super(Database, self).get_engine(app, bind)
+        name = bind or 'primary'
+        metrics = self.pool_metrics.get(name)
+        if metrics is None or metrics.engine is not engine:
+            with self._metrics_lock:
+                metrics = self.pool_metrics.get(name)
+                if metrics is None or metrics.engine is not engine:
+                    self.pool_metrics[name] = self._instrument(app, engine)
+        return engine
+
+    def _instrument(self, app, engine):
+        metrics = PoolMetrics(engine)
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.metrics = metrics
+        for name, counter in (('connect', 'connects'),
+                              ('checkout', 'checkouts'),
+                              ('checkin', 'checkins'),
+                              ('invalidate', 'invalidations')):
+            event.listen(engine.pool, name, _counter(metrics, counter))
+        if app.config['SQLALCHEMY_POOL_PRE_PING']:
+            event.listen(engine, 'engine_connect', _ping)
+        return metrics
+
+    def pool_stats(self):
+        return dict((name, metrics.stats())
+                    for name, metrics in self.pool_metrics.items())
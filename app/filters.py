@@ -0,0 +1,148 @@
+"""filters.py -- query string filters, search and sorting for collections.
+
+A ``FilterSet`` declares what a collection accepts:
+
+- ``age=30``, and ``age__gte=20``/``__gt``/``__lte``/``__lt`` on ranged fields
+- ``email__startswith=ann`` and ``email__contains=ann`` on searched fields,
+  ``q=ann`` looks for a substring in any of them (case insensitive)
+- ``sort=-age,last_name``, ``-`` for descending
+
+Everything becomes WHERE/ORDER BY clauses of the collection's query. The
+searched columns are indexed for it: trigram GIN indexes on PostgreSQL,
+NOCASE indexes on SQLite, which serve prefix searches only. SQLite does not
+use them for a LIKE with an ESCAPE clause, so prefixes are searched with a
+range of the NOCASE column there.
+"""
+from sqlalchemy import DDL, event
+
+from app import db
+
+RANGES = {
+    'gte': lambda column, value: column >= value,
+    'gt': lambda column, value: column > value,
+    'lte': lambda column, value: column <= value,
+    'lt': lambda column, value: column < value,
+}
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _like(column, pattern):
+    # SQLite's LIKE ignores the case already, ILIKE compiles to lower() there
+    if db.engine.dialect.name == 'sqlite':
+        return column.like(pattern, escape='\\')
+    return column.ilike(pattern, escape='\\')
+
+
+def _fold(term):
+    # NOCASE folds ASCII letters only
+    return u''.join(c.lower() if c < u'\x80' else c for c in term)
+
+
+def _startswith(column, prefix):
+    if db.engine.dialect.name != 'sqlite' or not prefix or \
+            prefix[-1] == u'\uffff':
+        return _like(column, _escape_like(prefix) + '%')
+    # prefix <= column < the prefix with its last character incremented,
+    # compared as the index compares them
+    lower = _fold(prefix)
+    upper = lower[:-1] + unichr(ord(lower[-1]) + 1)
+    column = column.collate('NOCASE')
+    return db.and_(column >= lower, column < upper)
+
+
+# names of the indexes search_indexes creates, not in the metadata
+SEARCH_INDEXES = set()
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """The include_object hook of autogenerate (migrations/env.py), which
+    would drop the search indexes as missing from the metadata."""
+    return not (type_ == 'index' and name in SEARCH_INDEXES)
+
+
+def search_indexes(table, columns):
+    """Creates the search indexes of ``columns`` with the table (create_all);
+    the migrations create them on existing databases."""
+    # gin_trgm_ops comes with the pg_trgm extension
+    event.listen(table, 'before_create', DDL(
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        .execute_if(dialect='postgresql'))
+    for name in columns:
+        SEARCH_INDEXES.update(['ix_{}_{}_trgm'.format(table.name, name),
+                               'ix_{}_{}_nocase'.format(table.name, name)])
+        event.listen(table, 'after_create', DDL(
+            'CREATE INDEX ix_%(table)s_{0}_trgm ON %(table)s '
+            'USING gin ({0} gin_trgm_ops)'.format(name))
+            .execute_if(dialect='postgresql'))
+        event.listen(table, 'after_create', DDL(
+            'CREATE INDEX ix_%(table)s_{0}_nocase ON %(table)s '
+            '({0} COLLATE NOCASE)'.format(name))
+            .execute_if(dialect='sqlite'))
+
+
+class FilterSet(object):
+
+    def __init__(self, model, exact=(), ranged=(), search=()):
+        self.model = model
+        self.exact = set(exact) | set(ranged)
+        self.ranged = set(ranged)
+        self.search = tuple(search)
+        self.sortable = set(column.name for column in model.__table__.columns)
+
+    def _column(self, name):
+        return getattr(self.model, name)
+
+    def _value(self, name, raw):
+        try:
+            return self._column(name).type.python_type(raw)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid value for {}.'.format(name))
+
+    def criteria(self, args):
+        """WHERE clauses of the request ``args``, ValueError if invalid."""
+        clauses = []
+        for key, raw in args.items(multi=True):
+            name, _, op = key.partition('__')
+            if not op and name in self.exact:
+                clauses.append(self._column(name) == self._value(name, raw))
+            elif op in RANGES and name in self.ranged:
+                clauses.append(RANGES[op](self._column(name),
+                                          self._value(name, raw)))
+            elif op == 'startswith' and name in self.search:
+                clauses.append(_startswith(self._column(name), raw))
+            elif op == 'contains' and name in self.search:
+                pattern = '%' + _escape_like(raw) + '%'
+                clauses.append(_like(self._column(name), pattern))
+            elif key == 'q' and self.search and raw:
+                pattern = '%' + _escape_like(raw) + '%'
+                clauses.append(db.or_(*[_like(self._column(name), pattern)
+                                        for name in self.search]))
+            elif op:
+                raise ValueError('Unknown filter {}.'.format(key))
+        return clauses
+
+    def ordering(self, args):
+        """ORDER BY clauses of ``sort``, None for the default id order."""
+        if not args.get('sort'):
+            return None
+        clauses = []
+        for name in args['sort'].split(','):
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name not in self.sortable:
+                raise ValueError('Cannot sort by {}.'.format(name))
+            column = self._column(name)
+            clauses.append(column.desc() if descending else column.asc())
+        return clauses
+
+    def apply(self, query, args):
+        return query.filter(*self.criteria(args))
+
+    def key(self, args):
+        """Canonical form of the filters of ``args``, for cache keys."""
+        return '&'.join('{}={}'.format(k, v) for k, v in sorted(
+            args.items(multi=True)) if k.partition('__')[0] in self.exact or
+            k.partition('__')[0] in self.search or k == 'q')
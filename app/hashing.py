@@ -0,0 +1,84 @@
+"""hashing.py -- password hashing outside of the request threads.
+
+Hashing is CPU bound and holds the GIL, so with PASSWORD_HASH_POOL_SIZE > 0
+it runs in a process pool and the request thread only waits on the result.
+At most PASSWORD_HASH_MAX_PENDING hashes are queued at once. The pool forks
+from create_app, before the process runs any thread of its own: forking a
+process with threads running can leave the children holding locks nobody
+will release. Python 2 has no spawn start method, so the app must be created
+in the worker process (gunicorn without --preload).
+
+Under gevent the pool's result threads would block the event loop, the hash
+runs in gevent's native thread pool instead (hashlib's pbkdf2 releases the
+GIL).
+"""
+import sys
+import threading
+from multiprocessing import Pool
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from instrumentation import timed
+
+_pool = None
+_pending = None
+_lock = threading.Lock()
+
+
+def _green():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def init_app(app):
+    global _pool, _pending
+    shutdown()
+    if app.config['PASSWORD_HASH_POOL_SIZE'] and not _green():
+        with _lock:
+            _pending = threading.BoundedSemaphore(
+                app.config['PASSWORD_HASH_MAX_PENDING'])
+            _pool = Pool(app.config['PASSWORD_HASH_POOL_SIZE'])
+
+
+def _run(fn, *args):
+    with timed('hash'):
+        if not current_app.config['PASSWORD_HASH_POOL_SIZE']:
+            return fn(*args)
+        if _green():
+            import gevent
+            return gevent.get_hub().threadpool.apply(fn, args)
+        pool = _pool
+        if pool is None:
+            raise RuntimeError('The hash pool is shut down, or was never '
+                               'started by create_app')
+        with _pending:
+            return pool.apply(fn, args)
+
+
+def shutdown():
+    """Stops the pool, e.g. before a worker process exits."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password,
+                current_app.config['PASSWORD_HASH_METHOD'],
+                current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """True when ``pwhash`` was made with other method/cost/salt settings."""
+    method, _, rest = pwhash.partition('$')
+    salt = rest.partition('$')[0]
+    return (method != current_app.config['PASSWORD_HASH_METHOD'] or
+            len(salt) != current_app.config['PASSWORD_SALT_LENGTH'])
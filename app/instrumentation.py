@@ -0,0 +1,261 @@
+"""instrumentation.py -- per request timings, SQL statistics and profiles.
+
+Enabled with INSTRUMENTATION, every request records its wall time, the time
+and number of its SQL statements, and the time spent encoding JSON, hashing
+passwords and compressing responses:
+
+- a ``Server-Timing`` header (``app``, ``db``, ``json``, ``hash``,
+  ``compress``), shown by the browser dev tools
+- a statement run INSTRUMENTATION_REPEAT_THRESHOLD times or more in one
+  request is logged, it is usually a query per row (N+1)
+- Prometheus text metrics at METRICS_PATH, with the pool and cache stats.
+  Counters are per process, every gunicorn worker has its own
+- with PROFILE_DIR set, PROFILE_SAMPLE_RATE of the requests run under
+  cProfile and those slower than PROFILE_SLOW_MS are dumped there, see
+  ``python -m pstats <file>``
+"""
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TIMINGS = ('db', 'json', 'hash', 'compress')
+
+logger = logging.getLogger(__name__)
+
+
+class RequestRecord(object):
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.start = time.time()
+        self.timings = dict((name, 0.0) for name in TIMINGS)
+        self.statements = defaultdict(int)
+        self.profiler = None
+
+    def add(self, name, seconds):
+        self.timings[name] += seconds
+
+    def repeated(self, threshold):
+        return dict((statement, count)
+                    for statement, count in self.statements.items()
+                    if count >= threshold)
+
+
+class Metrics(object):
+    """Per endpoint counters, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.durations = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.duration_sums = defaultdict(float)
+        self.seconds = defaultdict(float)
+        self.statements = defaultdict(int)
+        self.repeated = defaultdict(int)
+        self.profiles = 0
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, status, elapsed, record, repeated):
+        key = (endpoint, method)
+        with self._lock:
+            self.requests[key + (status,)] += 1
+            self.durations[key][bisect.bisect_left(BUCKETS, elapsed)] += 1
+            self.duration_sums[key] += elapsed
+            for name, seconds in record.timings.items():
+                self.seconds[(name, endpoint)] += seconds
+            self.statements[endpoint] += sum(record.statements.values())
+            self.repeated[endpoint] += len(repeated)
+
+    def render(self, pools, caches):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in samples:
+                labels = ','.join('%s="%s"' % pair for pair in labels)
+                lines.append('%s%s %r' % (
+                    name, '{%s}' % labels if labels else '', float(value)))
+
+        def by_endpoint(values):
+            return [((('endpoint', endpoint),), value)
+                    for endpoint, value in sorted(values.items())]
+
+        with self._lock:
+            metric('http_requests_total', 'counter', 'Requests served.',
+                   [((('endpoint', e), ('method', m), ('status', s)), n)
+                    for (e, m, s), n in sorted(self.requests.items())])
+            lines.append('# HELP http_request_duration_seconds Wall time.')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (endpoint, method), counts in sorted(self.durations.items()):
+                labels = 'endpoint="%s",method="%s"' % (endpoint, method)
+                total = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                    total += count
+                    lines.append('http_request_duration_seconds_bucket'
+                                 '{%s,le="%s"} %d' % (labels, bound, total))
+                lines.append('http_request_duration_seconds_sum{%s} %r' % (
+                    labels, self.duration_sums[(endpoint, method)]))
+                lines.append('http_request_duration_seconds_count{%s} %d' % (
+                    labels, total))
+            for name in TIMINGS:
+                metric('http_request_%s_seconds_total' % name, 'counter',
+                       'Time spent in %s.' % name, by_endpoint(dict(
+                           (endpoint, seconds) for (kind, endpoint), seconds
+                           in self.seconds.items() if kind == name)))
+            metric('http_request_sql_statements_total', 'counter',
+                   'SQL statements run.', by_endpoint(self.statements))
+            metric('http_request_repeated_statements_total', 'counter',
+                   'Statements repeated past the threshold in a request.',
+                   by_endpoint(self.repeated))
+            metric('profiles_written_total', 'counter',
+                   'cProfile dumps of slow requests.', [((), self.profiles)])
+
+        for key, kind in (('connects', 'counter'), ('checkouts', 'counter'),
+                          ('checkins', 'counter'), ('invalidations', 'counter'),
+                          ('timeouts', 'counter'), ('wait_time', 'counter'),
+                          ('max_wait', 'gauge'), ('size', 'gauge'),
+                          ('checkedout', 'gauge'), ('overflow', 'gauge')):
+            name = 'db_pool_' + key + ('_total' if kind == 'counter' else '')
+            metric(name, kind, 'Connection pool %s.' % key.replace('_', ' '),
+                   [((('bind', bind),), stats[key])
+                    for bind, stats in sorted(pools.items()) if key in stats])
+        for key, name, kind in (('hits', 'cache_hits_total', 'counter'),
+                                ('misses', 'cache_misses_total', 'counter'),
+                                ('size', 'cache_entries', 'gauge'),
+                                ('maxsize', 'cache_max_entries', 'gauge')):
+            metric(name, kind, 'In-process cache %s.' % key,
+                   [((('cache', cache),), stats[key])
+                    for cache, stats in sorted(caches.items())])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _record():
+    if has_request_context():
+        return getattr(g, '_instrumentation', None)
+    return None
+
+
+@contextmanager
+def timed(name):
+    """Adds the time of the block to the ``name`` timing of the request."""
+    record = _record()
+    if record is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        record.add(name, time.time() - start)
+
+
+def _timed_encoder(base):
+    class TimedJSONEncoder(base):
+        def encode(self, o):
+            with timed('json'):
+                return base.encode(self, o)
+    return TimedJSONEncoder
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _record() is not None:
+        conn.info.setdefault('instrumentation_start', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    record = _record()
+    starts = conn.info.get('instrumentation_start')
+    if record is not None and starts:
+        record.add('db', time.time() - starts.pop())
+        record.statements[statement] += 1
+
+
+def _caches():
+    from models import user_cache
+    from pagination import _count_cache
+    from tokens import token_cache
+    return {'user': user_cache.stats(), 'token': token_cache.stats(),
+            'count': _count_cache.stats()}
+
+
+def init_app(app, db):
+    profile_dir = app.config['PROFILE_DIR']
+    if profile_dir:
+        # only the profiled apps pay for the import
+        import cProfile
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+
+    app.json_encoder = _timed_encoder(app.json_encoder)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_record():
+        g._instrumentation = record = RequestRecord()
+        if profile_dir and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+            record.profiler = cProfile.Profile()
+            record.profiler.enable()
+
+    @app.after_request
+    def finish_record(response):
+        record = _record()
+        if record is None:
+            return response
+        elapsed = time.time() - record.start
+        endpoint = request.endpoint or 'unmatched'
+        repeated = record.repeated(
+            app.config['INSTRUMENTATION_REPEAT_THRESHOLD'])
+        for statement, count in repeated.items():
+            logger.warning('%s %s ran a statement %d times: %s',
+                           request.method, request.path, count,
+                           ' '.join(statement.split())[:300])
+        metrics.observe(endpoint, request.method, response.status_code,
+                        elapsed, record, repeated)
+        statements = sum(record.statements.values())
+        response.headers['Server-Timing'] = ', '.join(
+            ['app;dur=%.2f' % (elapsed * 1000),
+             'db;dur=%.2f;desc="%d statements, %d repeated"' % (
+                 record.timings['db'] * 1000, statements, len(repeated))] +
+            ['%s;dur=%.2f' % (name, record.timings[name] * 1000)
+             for name in TIMINGS[1:]])
+        if record.profiler is not None:
+            record.profiler.disable()
+            if elapsed * 1000 >= app.config['PROFILE_SLOW_MS']:
+                record.profiler.dump_stats(os.path.join(
+                    profile_dir, '%s-%s-%s-%dms-%d.prof' % (
+                        time.strftime('%Y%m%dT%H%M%S'), request.method,
+                        endpoint, elapsed * 1000, os.getpid())))
+                with metrics._lock:
+                    metrics.profiles += 1
+            record.profiler = None
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request is skipped when the view raised
+        record = _record()
+        if record is not None and record.profiler is not None:
+            record.profiler.disable()
+
+    def prometheus_metrics():
+        return Response(metrics.render(db.pool_stats(), _caches()),
+                        mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule(app.config['METRICS_PATH'], 'metrics',
+                     prometheus_metrics)
@@ -0,0 +1,129 @@
+"""json_provider.py -- JSON encoding and decoding of the API.
+
+JSON_BACKEND picks the library: 'json' (the standard library),
+'simplejson', or 'auto', which encodes with the standard library and decodes
+with simplejson when its C speedups are built (each is the faster of the two
+at it, see benchmarks/bench_json.py). The C encoders only run for output
+that is neither indented nor sorted, so JSON_SORT_KEYS and
+JSONIFY_PRETTYPRINT_REGULAR are off outside development. Dates and times
+are encoded as ISO 8601 strings.
+
+``jsonify`` encodes straight to the bytes of the response body, and
+``JSONRequest.get_json`` hands the raw body to the decoder instead of
+decoding it to unicode first.
+"""
+import datetime
+import decimal
+import inspect
+import json
+import uuid
+
+from flask import Request, current_app
+
+_missing = object()
+
+
+def _import_backend(name):
+    """The modules encoding and decoding for JSON_BACKEND ``name``."""
+    if name == 'json':
+        return json, json
+    if name == 'simplejson':
+        import simplejson
+        return simplejson, simplejson
+    if name != 'auto':
+        raise RuntimeError('Unknown JSON_BACKEND {!r}'.format(name))
+    try:
+        import simplejson
+    except ImportError:
+        return json, json
+    # pure Python simplejson is slower than the standard library
+    if simplejson._import_c_make_encoder() is None:
+        return json, json
+    return json, simplejson
+
+
+def _encoder(module):
+    options = set(inspect.getargspec(module.JSONEncoder.__init__).args)
+
+    class APIJSONEncoder(module.JSONEncoder):
+
+        def __init__(self, **kwargs):
+            # flask.json (sessions, flask_jwt_extended errors) dumps through
+            # simplejson when it is installed, with options the standard
+            # library does not take
+            module.JSONEncoder.__init__(self, **dict(
+                (k, v) for k, v in kwargs.items() if k in options))
+
+        def default(self, o):
+            if isinstance(o, (datetime.date, datetime.time)):
+                return o.isoformat()
+            if isinstance(o, decimal.Decimal):
+                return float(o)
+            if isinstance(o, uuid.UUID):
+                return str(o)
+            return module.JSONEncoder.default(self, o)
+    return APIJSONEncoder
+
+
+encoder = _encoder(json)
+decoding = json
+
+
+def init_app(app):
+    global encoder, decoding
+    encoding, decoding = _import_backend(app.config['JSON_BACKEND'])
+    encoder = _encoder(encoding)
+    app.json_encoder = encoder
+    app.json_decoder = decoding.JSONDecoder
+    app.request_class = JSONRequest
+
+
+def dumps(obj):
+    """Compact JSON of ``obj``, for storage outside a request."""
+    return encoder(separators=(',', ':')).encode(obj)
+
+
+def loads(s):
+    return decoding.loads(s)
+
+
+def jsonify(data):
+    """A JSON response of ``data``.
+
+    Goes through the app's encoder class, so the instrumentation still times
+    it, and skips the trailing newline flask.jsonify appends to the body.
+    """
+    config = current_app.config
+    if config['JSONIFY_PRETTYPRINT_REGULAR']:
+        indent, separators = 2, (', ', ': ')
+    else:
+        indent, separators = None, (',', ':')
+    body = current_app.json_encoder(
+        ensure_ascii=config['JSON_AS_ASCII'], sort_keys=config['JSON_SORT_KEYS'],
+        indent=indent, separators=separators).encode(data)
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+    return current_app.response_class(body, mimetype=config['JSONIFY_MIMETYPE'])
+
+
+class JSONRequest(Request):
+    """Parses JSON bodies with the decoding backend of the app."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        rv = getattr(self, '_cached_json', _missing)
+        if cache and rv is not _missing:
+            return rv
+        if not (force or self.is_json):
+            return None
+        try:
+            rv = decoding.loads(
+                self.get_data(cache=cache),
+                encoding=self.mimetype_params.get('charset') or 'utf-8')
+        except ValueError as e:
+            if silent:
+                rv = None
+            else:
+                rv = self.on_json_loading_failed(e)
+        if cache:
+            self._cached_json = rv
+        return rv
@@ -1,6 +1,28 @@
 """models.py -- event listner also added."""
+import datetime
+import json
+from collections import namedtuple
+
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from cache import TTLCache
+from serializers import Serializer
+from filters import FilterSet, search_indexes
+from hashing import hash_password, verify_password
+
+
+def _is_id(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def _unique_ids(ids):
+    # keeps the request order, drops duplicates and anything but integers
+    seen = set()
+    out = []
+    for each_id in ids:
+        if _is_id(each_id) and each_id not in seen:
+            seen.add(each_id)
+            out.append(each_id)
+    return out
 
 
 class BaseMixin(object):
@@ -9,6 +31,21 @@ class BaseMixin(object):
     updated_on = db.Column(
         db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
+    @classmethod
+    def resolve_ids(cls, ids, *criteria):
+        """The stored ``ids`` with a single IN query, and the missing ones.
+
+        Rows that do not match ``criteria``, e.g. of another owner, count as
+        missing.
+        """
+        wanted = _unique_ids(ids)
+        found = set()
+        if wanted:
+            found = set(i for (i,) in db.session.query(cls.id)
+                        .filter(cls.id.in_(wanted), *criteria))
+        return ([i for i in wanted if i in found],
+                [i for i in ids if not _is_id(i) or i not in found])
+
 
 class User(BaseMixin, db.Model):
     __tablename__ = 'users'
@@ -22,10 +59,10 @@ class User(BaseMixin, db.Model):
     clients = db.relationship('Client', backref='owner', lazy='dynamic')
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return verify_password(self.password, password)
 
     def __str__(self):
         return "User(id={id}, username={username})".format(id=self.id, username=self.username)
@@ -51,15 +88,24 @@ class Client(BaseMixin, db.Model):
     height = db.Column(db.Integer, nullable=True)
 
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    plan_id = db.Column(db.Integer, db.ForeignKey('plans.id'))
+    plan_id = db.Column(db.Integer, db.ForeignKey('plans.id'), index=True)
+
+    # the listing of one trainer's clients, all of them or those of a plan,
+    # in id order for the keyset pagination
+    __table_args__ = (
+        db.Index('ix_clients_owner_id_id', 'owner_id', 'id'),
+        db.Index('ix_clients_owner_id_plan_id_id', 'owner_id', 'plan_id', 'id'),
+    )
 
     def __str__(self):
         return "Client(id={id}, firstname={firstname})".format(id=self.id, username=self.firstname)
 
 
+# the primary keys rule out duplicate memberships and index the owner side,
+# the member side gets its own index for the reverse lookups
 day_association_table = db.Table('day_association_table',
-                                 db.Column('plan_id', db.Integer, db.ForeignKey('plans.id')),
-                                 db.Column('day_id', db.Integer, db.ForeignKey('days.id'))
+                                 db.Column('plan_id', db.Integer, db.ForeignKey('plans.id'), primary_key=True),
+                                 db.Column('day_id', db.Integer, db.ForeignKey('days.id'), primary_key=True, index=True)
                                  )
 
 
@@ -79,8 +125,8 @@ class Plan(BaseMixin, db.Model):
 
 
 exercise_association_table = db.Table('exercise_association_table',
-                                      db.Column('day_id', db.Integer, db.ForeignKey('days.id')),
-                                      db.Column('exercise_id', db.Integer, db.ForeignKey('exercises.id'))
+                                      db.Column('day_id', db.Integer, db.ForeignKey('days.id'), primary_key=True),
+                                      db.Column('exercise_id', db.Integer, db.ForeignKey('exercises.id'), primary_key=True, index=True)
                                       )
 
 
@@ -89,7 +135,7 @@ class Day(BaseMixin, db.Model):
 
     def __init__(self, name, exercises=None):
         self.name = name
-        self.exercises = exercises
+        self.exercises = exercises or []
 
     name = db.Column(db.String(120), unique=True, nullable=False)
     exercises = db.relationship("Exercise", secondary=exercise_association_table,
@@ -113,24 +159,174 @@ class Exercise(BaseMixin, db.Model):
         return "Exercise(id={id}, name={name})".format(id=self.id, name=self.name)
 
 
+def sync_association(table, owner_column, member_column, owner_id, member_ids):
+    """Makes ``member_ids`` the members of ``owner_id`` in an association table.
+
+    Only the stored member ids are read, and only the rows that changed are
+    deleted/inserted, instead of replacing the whole collection. Returns
+    whether anything changed.
+    """
+    current = set(i for (i,) in db.session.execute(
+        db.select([member_column]).where(owner_column == owner_id)))
+    wanted = set(member_ids)
+    removed = current - wanted
+    added = wanted - current
+    if removed:
+        db.session.execute(table.delete().where(
+            db.and_(owner_column == owner_id, member_column.in_(removed))))
+    if added:
+        db.session.execute(table.insert(), [
+            {owner_column.name: owner_id, member_column.name: i}
+            for i in added])
+    return bool(removed or added)
+
+
+def sync_plan_clients(plan_id, owner_id, client_ids):
+    """Makes ``client_ids`` the clients of ``owner_id`` in ``plan_id``
+    without loading them; the clients of other owners are left alone.
+
+    The newly assigned clients get a plan_assigned notification.
+    """
+    clients = Client.__table__
+    released = clients.update().where(db.and_(
+        clients.c.plan_id == plan_id, clients.c.owner_id == owner_id))
+    if client_ids:
+        released = released.where(~clients.c.id.in_(client_ids))
+    db.session.execute(released.values(plan_id=None))
+    if client_ids:
+        assigned = [i for (i,) in db.session.execute(
+            db.select([clients.c.id]).where(db.and_(
+                clients.c.id.in_(client_ids),
+                clients.c.owner_id == owner_id,
+                db.or_(clients.c.plan_id.is_(None),
+                       clients.c.plan_id != plan_id))))]
+        if assigned:
+            db.session.execute(clients.update().where(
+                clients.c.id.in_(assigned)).values(plan_id=plan_id))
+            enqueue_notifications(db.session, 'plan_assigned', [
+                {'client_id': i, 'plan_id': plan_id} for i in assigned])
+
+
+# serializers, nested variants are used in the day and plan documents
+Client.serializer = Serializer(('id', 'email', 'first_name', 'last_name', 'age',
+                                'weight', 'height', 'owner_id', 'plan_id'))
+Client.plan_serializer = Serializer(('id', 'email', 'first_name', 'last_name',
+                                     'age', 'weight', 'height'))
+Exercise.serializer = Serializer(('id', 'name', 'activity'))
+Day.serializer = Serializer(('id', 'name'), exercises=Exercise.serializer)
+Plan.serializer = Serializer(('id', 'name'), days=Day.serializer)
+
+# query string filters of the collections, see filters.py
+Client.filters = FilterSet(Client, exact=('plan_id',),
+                           ranged=('age', 'weight', 'height'),
+                           search=('email', 'first_name', 'last_name'))
+Exercise.filters = FilterSet(Exercise, search=('name', 'activity'))
+search_indexes(Client.__table__, Client.filters.search)
+search_indexes(Exercise.__table__, Exercise.filters.search)
+
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    jti = db.Column(db.String(36), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __str__(self):
+        return "RevokedToken(jti={jti})".format(jti=self.jti)
+
+
+class Notification(db.Model):
+    """Outbox row, written in the transaction of the change it announces and
+    delivered later by the outbox workers (see outbox.py)."""
+    __tablename__ = 'notifications'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False,
+                                default=datetime.datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    # the outbox worker that claimed the row last
+    claimed_by = db.Column(db.String(32), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_notifications_pending', 'sent_at', 'next_attempt_at'),
+    )
+
+    def __str__(self):
+        return "Notification(id={id}, kind={kind})".format(id=self.id, kind=self.kind)
+
+
+class PlanDocument(db.Model):
+    """The plan -> days -> exercises document of a plan, kept up to date by
+    plan_documents.py."""
+    __tablename__ = 'plan_documents'
+
+    plan_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    document = db.Column(db.Text, nullable=False)
+    built_on = db.Column(db.DateTime, server_default=db.func.now())
+
+    def __str__(self):
+        return "PlanDocument(plan_id={plan_id})".format(plan_id=self.plan_id)
+
+
+def enqueue_notifications(connection, kind, payloads):
+    """Adds outbox rows through ``connection`` (a Connection or the session),
+    so they commit or roll back with the change."""
+    connection.execute(Notification.__table__.insert(), [
+        {'kind': kind, 'payload': json.dumps(payload)} for payload in payloads])
+
+
 from sqlalchemy import event
 
-# TODO - Implement mailing
-# User some Queue to take care of mailing
 # Whenever a user is assigned to a workout plan, he(she) should receive an email confirmation
-@event.listens_for(Client.plan_id, 'set')
-def receive_user_set_for_plan(target, value, oldvalue, initiator):
-    # query the Plan from plan_id
-    # send mail to the client.email
-    receiver = target.email
-    subject = "You are assigned to {}".format(target.plan.name)
-    print receiver, subject
-    # Use Flask-Mail to send email
-    print "TODO -- Mail Sending"
-
-# Whenever a plan is modified, the user(s) connected should be notified of the change by mail.*
-@event.listens_for(Plan, 'before_update')
-def receive_after_plan_update(mapper, connection, target):
-    # get the client_ids of the plan updated
-    # get the Client object, send mail to all their email
-    print "TODO -- Send Plan ids to queue to get clients and mail them"
+@event.listens_for(Client, 'after_insert')
+@event.listens_for(Client, 'after_update')
+def receive_user_set_for_plan(mapper, connection, target):
+    if target.plan_id is not None and \
+            db.inspect(target).attrs.plan_id.history.added:
+        enqueue_notifications(connection, 'plan_assigned', [
+            {'client_id': target.id, 'plan_id': target.plan_id}])
+
+# Whenever a plan is modified, the user(s) connected should be notified of the
+# change by mail; PlanAPI.put enqueues it, the workers fan out to the clients
+
+
+# auth lookups -- the fields login_required and the token claims need, cached
+# per process and keyed by username and by id. Other processes only see a
+# change once their entry expires (USER_CACHE_TTL), so the password hash is
+# not cached: login reads it from the database.
+CachedUser = namedtuple('CachedUser', 'id username')
+user_cache = TTLCache(0, 0)  # sized by create_app
+
+
+def find_user(username=None, user_id=None):
+    """CachedUser by username or id, None if there is no such user."""
+    key = ('username', username) if user_id is None else ('id', user_id)
+    cached = user_cache.get(key)
+    if cached is not None:
+        return cached
+    query = db.session.query(User.id, User.username)
+    if user_id is None:
+        row = query.filter(User.username == username).first()
+    else:
+        row = query.filter(User.id == user_id).first()
+    if row is None:
+        return None
+    cached = CachedUser(*row)
+    user_cache.set(('username', cached.username), cached)
+    user_cache.set(('id', cached.id), cached)
+    return cached
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def receive_user_changed(mapper, connection, target):
+    user_cache.pop(('id', target.id))
+    user_cache.pop(('username', target.username))
+    # a renamed user is still cached under the old name
+    for old_username in db.inspect(target).attrs.username.history.deleted:
+        user_cache.pop(('username', old_username))
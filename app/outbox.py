@@ -0,0 +1,256 @@
+"""outbox.py -- delivers the notifications outbox.
+
+Started with ``./manage.py outbox``. Each worker thread claims a batch of due
+notifications, sends it through the MAIL_TRANSPORT and marks the rows sent.
+A row is claimed by an UPDATE that only matches while it is still due and
+moves its next attempt OUTBOX_CLAIM_TIMEOUT seconds ahead, so on any
+database a row goes to one worker, of this process or another; the rows of
+a worker that dies come due again after the timeout. A failed notification
+is retried with exponential backoff, up to OUTBOX_MAX_ATTEMPTS times.
+"""
+import datetime
+import json
+import logging
+import smtplib
+import threading
+import uuid
+from collections import defaultdict, namedtuple
+from email.mime.text import MIMEText
+
+from flask import current_app
+
+from app import db
+from models import Notification, Client, Plan
+
+logger = logging.getLogger(__name__)
+
+Message = namedtuple('Message', 'to subject body')
+
+
+class FileTransport(object):
+    """Appends the messages to a file, a stand-in for development."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send_batch(self, batch):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                for _, messages in batch:
+                    for message in messages:
+                        f.write(u'To: {}\nSubject: {}\n\n{}\n\n'.format(
+                            message.to, message.subject,
+                            message.body).encode('utf-8'))
+        return {}
+
+
+class SMTPTransport(object):
+    """Sends a batch over one SMTP connection.
+
+    ``python -m smtpd -n -c DebuggingServer localhost:1025`` prints the mails
+    locally instead of sending them.
+    """
+
+    def __init__(self, host, port, sender):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def send_batch(self, batch):
+        """Sends the ``(key, messages)`` of ``batch``, returns the errors of
+        the keys that failed.
+
+        A key whose recipients were all refused fails; when only some were,
+        it counts as sent and the refusals are logged, a retry would mail
+        the accepted recipients again."""
+        failed = {}
+        batch = [(key, messages) for key, messages in batch if messages]
+        if not batch:
+            return failed
+        smtp = smtplib.SMTP(self.host, self.port)
+        try:
+            for i, (key, messages) in enumerate(batch):
+                try:
+                    refused = {}
+                    for message in messages:
+                        mime = MIMEText(message.body, 'plain', 'utf-8')
+                        mime['Subject'] = message.subject
+                        mime['From'] = self.sender
+                        mime['To'] = message.to
+                        try:
+                            smtp.sendmail(self.sender, [message.to],
+                                          mime.as_string())
+                        except smtplib.SMTPRecipientsRefused as e:
+                            refused.update(e.recipients)
+                    if len(refused) == len(set(m.to for m in messages)):
+                        failed[key] = smtplib.SMTPRecipientsRefused(refused)
+                    elif refused:
+                        logger.warning('notification %s refused for %r',
+                                       key, refused)
+                except smtplib.SMTPServerDisconnected as e:
+                    # the rest of the batch goes nowhere either
+                    for each_key, _ in batch[i:]:
+                        failed[each_key] = e
+                    break
+                except smtplib.SMTPException as e:
+                    failed[key] = e
+        finally:
+            try:
+                smtp.quit()
+            except smtplib.SMTPServerDisconnected:
+                smtp.close()
+        return failed
+
+
+def get_transport():
+    if current_app.config['MAIL_TRANSPORT'] == 'smtp':
+        return SMTPTransport(current_app.config['MAIL_SERVER'], current_app.config['MAIL_PORT'],
+                             current_app.config['MAIL_SENDER'])
+    return FileTransport(current_app.config['MAIL_OUTBOX_FILE'])
+
+
+def _messages(rows):
+    """Messages of each outbox row, with one query per table for the batch."""
+    payloads = dict((row.id, json.loads(row.payload)) for row in rows)
+    plan_ids = set(p['plan_id'] for p in payloads.values())
+    client_ids = set(p['client_id'] for p in payloads.values() if 'client_id' in p)
+    updated_ids = set(payloads[row.id]['plan_id'] for row in rows
+                      if row.kind == 'plan_updated')
+
+    plans = dict(db.session.query(Plan.id, Plan.name).filter(Plan.id.in_(plan_ids)))
+    emails = {}
+    if client_ids:
+        emails = dict(db.session.query(Client.id, Client.email)
+                      .filter(Client.id.in_(client_ids)))
+    # plan changes fan out to every client of the plan
+    plan_emails = defaultdict(list)
+    if updated_ids:
+        for plan_id, email in db.session.query(Client.plan_id, Client.email) \
+                .filter(Client.plan_id.in_(updated_ids)):
+            plan_emails[plan_id].append(email)
+
+    out = {}
+    announced = set()
+    for row in rows:
+        payload = payloads[row.id]
+        name = plans.get(payload['plan_id'])
+        out[row.id] = []
+        if name is None:
+            # the plan was deleted meanwhile
+            continue
+        if row.kind == 'plan_assigned' and payload['client_id'] in emails:
+            out[row.id] = [Message(emails[payload['client_id']],
+                                   u'You are assigned to {}'.format(name),
+                                   u'You are now following the plan {}.'.format(name))]
+        elif row.kind == 'plan_updated' and payload['plan_id'] not in announced:
+            # several changes to a plan in one batch make one mail
+            announced.add(payload['plan_id'])
+            out[row.id] = [Message(email, u'{} was updated'.format(name),
+                                   u'Your plan {} has changed.'.format(name))
+                           for email in plan_emails[payload['plan_id']]]
+    return out
+
+
+def _retry_delay(attempts):
+    delay = current_app.config['OUTBOX_RETRY_BASE'] * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, current_app.config['OUTBOX_RETRY_MAX']))
+
+
+def claim(batch_size):
+    """Claims up to ``batch_size`` due notifications for this worker."""
+    config = current_app.config
+    now = datetime.datetime.utcnow()
+    notifications = Notification.__table__
+    due = db.and_(
+        notifications.c.sent_at.is_(None),
+        notifications.c.next_attempt_at <= now,
+        notifications.c.attempts < config['OUTBOX_MAX_ATTEMPTS'])
+    ids = [i for (i,) in db.session.execute(
+        db.select([notifications.c.id]).where(due)
+        .order_by(notifications.c.id).limit(batch_size))]
+    if not ids:
+        db.session.rollback()
+        return []
+    # the rows another worker claimed meanwhile are no longer due
+    claimed_by = uuid.uuid4().hex
+    db.session.execute(notifications.update().where(
+        db.and_(notifications.c.id.in_(ids), due)).values(
+        claimed_by=claimed_by,
+        next_attempt_at=now + datetime.timedelta(
+            seconds=config['OUTBOX_CLAIM_TIMEOUT'])))
+    db.session.commit()
+    return Notification.query.filter(
+        Notification.id.in_(ids), Notification.claimed_by == claimed_by) \
+        .order_by(Notification.id).all()
+
+
+def drain(transport, batch_size):
+    """Delivers one batch of due notifications, returns its size."""
+    rows = claim(batch_size)
+    if not rows:
+        return 0
+    messages = _messages(rows)
+    try:
+        failed = transport.send_batch(
+            [(row.id, messages[row.id]) for row in rows])
+    except Exception as e:
+        # e.g. no connection to the mail server
+        failed = dict((row.id, e) for row in rows)
+    now = datetime.datetime.utcnow()
+    for row in rows:
+        error = failed.get(row.id)
+        if error is None:
+            row.sent_at = now
+            continue
+        row.attempts += 1
+        row.last_error = repr(error)
+        row.next_attempt_at = now + _retry_delay(row.attempts)
+        logger.warning('notification %s failed (attempt %s): %r',
+                       row.id, row.attempts, error)
+    db.session.commit()
+    return len(rows)
+
+
+class OutboxWorker(threading.Thread):
+
+    def __init__(self, app, transport, stop):
+        super(OutboxWorker, self).__init__()
+        self.daemon = True
+        self.app = app
+        self.transport = transport
+        self.stop = stop
+
+    def run(self):
+        batch_size = self.app.config['OUTBOX_BATCH_SIZE']
+        while not self.stop.is_set():
+            with self.app.app_context():
+                try:
+                    count = drain(self.transport, batch_size)
+                except Exception:
+                    logger.exception('outbox batch failed')
+                    db.session.rollback()
+                    count = 0
+                finally:
+                    db.session.remove()
+            if count < batch_size:
+                self.stop.wait(self.app.config['OUTBOX_POLL_INTERVAL'])
+
+
+def run_workers(workers):
+    """Runs ``workers`` outbox threads of the current app until
+    interrupted."""
+    app = current_app._get_current_object()
+    stop = threading.Event()
+    transport = get_transport()
+    threads = [OutboxWorker(app, transport, stop) for _ in range(workers)]
+    for each in threads:
+        each.start()
+    try:
+        while any(each.is_alive() for each in threads):
+            # a timeout keeps the main thread interruptible
+            threads[0].join(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for each in threads:
+            each.join()
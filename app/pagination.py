@@ -0,0 +1,229 @@
+"""pagination.py -- keyset pagination and field projection for collections."""
+import base64
+import datetime
+import json
+
+from flask import current_app, request
+from sqlalchemy import event, false, type_coerce
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.dml import UpdateBase
+
+from app import db
+from cache import TTLCache
+
+# (collection key, table version) -> count; the key starts with the table,
+# then the owner and the filters
+_count_cache = TTLCache(0, 0)  # sized by create_app
+# table -> writes seen by this process, so a write changes the keys of the
+# table's counts; other processes see it after API_COUNT_CACHE_TTL
+_count_versions = {}
+
+
+def _is_int(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def _isoformat(value):
+    # the timestamps PostgreSQL returns, it parses them back
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def encode_cursor(value):
+    """The cursor of the last id, or of the sort values and id of a
+    sorted page."""
+    return base64.urlsafe_b64encode(json.dumps(
+        value, separators=(',', ':'), default=_isoformat)).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor.')
+
+
+def _is_int_column(column):
+    return column.type.python_type in (int, long)
+
+
+def _valid_value(column, value):
+    if value is None:
+        return True
+    return _is_int(value) if _is_int_column(column) else \
+        isinstance(value, basestring)
+
+
+def _sort_column(clause):
+    """The column and direction of a FilterSet.ordering clause.
+
+    Columns other than integers are typed as strings, so that their values
+    go to the cursor and back into the comparisons as the database returns
+    them: SQLite compares timestamps as the text it stores.
+    """
+    column = clause.element
+    if not _is_int_column(column):
+        column = type_coerce(column, db.String)
+    return column, clause.modifier is operators.desc_op
+
+
+def _beyond(column, value, descending, nulls_high):
+    """Rows of ``column`` strictly after ``value`` in the sort order."""
+    nulls_after = nulls_high != descending
+    if value is None:
+        return false() if nulls_after else column.isnot(None)
+    beyond = column < value if descending else column > value
+    return db.or_(beyond, column.is_(None)) if nulls_after else beyond
+
+
+def _after(order_by, id_column, values):
+    """Rows after the cursor ``values`` in ``order_by``, then the id."""
+    # NULLs sort after every value on PostgreSQL, before them on SQLite
+    nulls_high = db.engine.dialect.name == 'postgresql'
+    clauses = []
+    equal = []
+    for clause, value in zip(order_by, values):
+        column, descending = _sort_column(clause)
+        clauses.append(db.and_(*equal + [
+            _beyond(column, value, descending, nulls_high)]))
+        equal.append(column.is_(None) if value is None else column == value)
+    clauses.append(db.and_(*equal + [id_column > values[-1]]))
+    return db.or_(*clauses)
+
+
+def _bump(table):
+    _count_versions[table] = _count_versions.get(table, 0) + 1
+
+
+@event.listens_for(Engine, 'after_execute')
+def receive_after_execute(conn, clauseelement, multiparams, params, result):
+    # bumped again on commit, a count taken before would be stored under
+    # the version of the statement
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    _bump(clauseelement.table.name)
+    if db.session.registry.has():
+        db.session().info.setdefault('counted_tables', set()).add(
+            clauseelement.table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def receive_after_commit(session):
+    for table in session.info.pop('counted_tables', ()):
+        _bump(table)
+
+
+@event.listens_for(Session, 'after_rollback')
+def receive_after_rollback(session):
+    session.info.pop('counted_tables', None)
+
+
+def cached_count(key, query):
+    """COUNT(*) of the query, cached for API_COUNT_CACHE_TTL seconds or
+    until the table is written to."""
+    key = (key, _count_versions.get(key.split(':', 1)[0], 0))
+    count = _count_cache.get(key)
+    if count is None:
+        count = query.order_by(None).count()
+        _count_cache.set(key, count)
+    return count
+
+
+class Page(object):
+    """Paging arguments of a collection GET.
+
+    Understands ``limit``, ``after`` (the opaque cursor returned as
+    ``next`` by the previous page), ``fields`` (comma separated) and
+    ``count`` (``0`` skips the COUNT(*) query). Pages are sorted by id, or
+    by ``order_by`` (FilterSet.ordering) and then the id.
+    """
+
+    def __init__(self, limit, after=None, fields=None, with_count=True,
+                 order_by=None):
+        self.limit = limit
+        self.after = after
+        self.fields = fields
+        self.with_count = with_count
+        self.order_by = order_by
+        self.next_cursor = None
+
+    @classmethod
+    def from_request(cls, allowed_fields, order_by=None):
+        args = request.args
+        try:
+            limit = int(args.get('limit', current_app.config['API_PAGE_SIZE']))
+        except ValueError:
+            raise ValueError('limit must be an integer.')
+        if limit < 1:
+            raise ValueError('limit must be positive.')
+        limit = min(limit, current_app.config['API_MAX_PAGE_SIZE'])
+
+        after = None
+        if args.get('after'):
+            after = decode_cursor(args['after'])
+            if not order_by:
+                if not _is_int(after):
+                    raise ValueError('Invalid cursor.')
+            elif not isinstance(after, list) or \
+                    len(after) != len(order_by) + 1 or \
+                    not _is_int(after[-1]) or \
+                    not all(_valid_value(clause.element, value)
+                            for clause, value in zip(order_by, after)):
+                raise ValueError('Invalid cursor.')
+
+        fields = None
+        if args.get('fields'):
+            requested = set(f for f in args['fields'].split(',') if f)
+            unknown = requested - set(allowed_fields)
+            if unknown:
+                raise ValueError('Unknown field(s): {}.'.format(
+                    ', '.join(sorted(unknown))))
+            # id is the keyset, always keep it; in the order of
+            # allowed_fields, without repeats
+            requested.add('id')
+            fields = tuple(f for f in allowed_fields if f in requested)
+
+        with_count = args.get('count', '1').lower() not in ('0', 'false')
+        return cls(limit, after, fields, with_count, order_by)
+
+    def wants(self, field):
+        return self.fields is None or field in self.fields
+
+    def fetch(self, query, id_column):
+        """Rows of the page; sets ``next_cursor`` when more rows remain.
+
+        Sorted pages are paged by keyset too, on the sort columns and the
+        id: the cursor holds their values in the last row, which the query
+        selects after its own columns, so it has to be a query of columns.
+        """
+        if self.order_by:
+            columns = [_sort_column(clause)[0] for clause in self.order_by]
+            query = query.add_columns(*[column.label('_sort_%d' % i)
+                                        for i, column in enumerate(columns)])
+            if self.after is not None:
+                query = query.filter(
+                    _after(self.order_by, id_column, self.after))
+            rows = query.order_by(*self.order_by + [id_column]) \
+                .limit(self.limit + 1).all()
+            if len(rows) > self.limit:
+                rows = rows[:self.limit]
+                self.next_cursor = encode_cursor(
+                    [getattr(rows[-1], '_sort_%d' % i)
+                     for i in range(len(columns))] + [rows[-1].id])
+            return rows
+        if self.after is not None:
+            query = query.filter(id_column > self.after)
+        rows = query.order_by(id_column).limit(self.limit + 1).all()
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            self.next_cursor = encode_cursor(rows[-1].id)
+        return rows
+
+    def response(self, data, count_key, count_query):
+        ret = {"data": data, "next": self.next_cursor}
+        if self.with_count:
+            ret["count"] = cached_count(count_key, count_query)
+        return ret
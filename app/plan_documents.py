@@ -0,0 +1,190 @@
+"""plan_documents.py -- precomputed plan documents.
+
+Off by default. With PLAN_DOCUMENTS on, the plan -> days -> exercises document of every plan
+is stored in plan_documents, so reading a plan is one keyed fetch. A change
+marks the plans it affects as stale, found by reverse lookups: a day marks
+the plans it belongs to, an exercise the plans of its days. Stale documents
+are rebuilt in the transaction of the change, just before it commits.
+Run ``manage.py plan_documents`` after turning it on.
+
+ORM changes are found by the flush listeners below. Statements run through
+``db.session.execute`` (association syncs, bulk endpoints) call
+``mark_stale`` themselves.
+"""
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+import json_provider
+from models import Plan, Day, Exercise, PlanDocument, \
+    day_association_table, exercise_association_table
+
+_plans = Plan.__table__
+_days = Day.__table__
+_exercises = Exercise.__table__
+_documents = PlanDocument.__table__
+
+
+def enabled(session=None):
+    # Flask-SQLAlchemy sessions know their app, the listeners get any session
+    app = getattr(session, 'app', None) or current_app
+    return app.config['PLAN_DOCUMENTS']
+
+
+def _plans_of_days(session, day_ids):
+    return [i for (i,) in session.execute(
+        db.select([day_association_table.c.plan_id]).where(
+            day_association_table.c.day_id.in_(day_ids)))]
+
+
+def _plans_of_exercises(session, exercise_ids):
+    joined = day_association_table.join(
+        exercise_association_table,
+        day_association_table.c.day_id == exercise_association_table.c.day_id)
+    return [i for (i,) in session.execute(
+        db.select([day_association_table.c.plan_id]).select_from(joined)
+        .where(exercise_association_table.c.exercise_id.in_(exercise_ids)))]
+
+
+def mark_stale(plan_ids=(), day_ids=(), exercise_ids=(), session=None):
+    """Marks the plans, and the plans including the days or exercises, for
+    a rebuild when the session commits. Call it before removing the
+    associations of deleted days/exercises."""
+    session = session or db.session()
+    if not enabled(session):
+        return
+    stale = session.info.setdefault('stale_plans', set())
+    stale.update(plan_ids)
+    if day_ids:
+        stale.update(_plans_of_days(session, day_ids))
+    if exercise_ids:
+        stale.update(_plans_of_exercises(session, exercise_ids))
+
+
+def build_documents(session, plan_ids):
+    """plan id -> document, three queries whatever the number of plans."""
+    documents = dict(
+        (plan_id, {'id': plan_id, 'name': name, 'days': []})
+        for plan_id, name in session.execute(
+            db.select([_plans.c.id, _plans.c.name])
+            .where(_plans.c.id.in_(plan_ids))))
+    if not documents:
+        return documents
+
+    days = session.execute(
+        db.select([day_association_table.c.plan_id, _days.c.id, _days.c.name])
+        .select_from(day_association_table.join(
+            _days, _days.c.id == day_association_table.c.day_id))
+        .where(day_association_table.c.plan_id.in_(documents))
+        .order_by(_days.c.id)).fetchall()
+    exercises_by_day = defaultdict(list)
+    day_ids = set(day_id for _, day_id, _ in days)
+    if day_ids:
+        for row in session.execute(
+                db.select([exercise_association_table.c.day_id,
+                           _exercises.c.id, _exercises.c.name,
+                           _exercises.c.activity])
+                .select_from(exercise_association_table.join(
+                    _exercises,
+                    _exercises.c.id == exercise_association_table.c.exercise_id))
+                .where(exercise_association_table.c.day_id.in_(day_ids))
+                .order_by(_exercises.c.id)):
+            exercises_by_day[row[0]].append(
+                Exercise.serializer.dump_row(row[1:]))
+    for plan_id, day_id, name in days:
+        documents[plan_id]['days'].append(
+            {'id': day_id, 'name': name,
+             'exercises': exercises_by_day[day_id]})
+    return documents
+
+
+def refresh(session, plan_ids):
+    """Rebuilds the documents of ``plan_ids``, drops those of deleted plans.
+
+    The plan rows are locked first, in id order, so transactions refreshing
+    the same plan take turns instead of both inserting its document; the
+    later one builds from what the earlier one committed. SQLite, which
+    has no FOR UPDATE, runs one writer at a time anyway."""
+    plan_ids = sorted(plan_ids)
+    session.execute(db.select([_plans.c.id]).where(_plans.c.id.in_(plan_ids))
+                    .order_by(_plans.c.id).with_for_update()).fetchall()
+    documents = build_documents(session, plan_ids)
+    session.execute(_documents.delete().where(
+        _documents.c.plan_id.in_(plan_ids)))
+    if documents:
+        session.execute(_documents.insert(), [
+            {'plan_id': plan_id, 'document': json_provider.dumps(document)}
+            for plan_id, document in documents.items()])
+
+
+def rebuild_all(batch_size=500):
+    """Rebuilds every document, e.g. after enabling PLAN_DOCUMENTS."""
+    session = db.session()
+    session.execute(_documents.delete())
+    count = 0
+    last_id = 0
+    while True:
+        plan_ids = [i for (i,) in session.execute(
+            db.select([_plans.c.id]).where(_plans.c.id > last_id)
+            .order_by(_plans.c.id).limit(batch_size))]
+        if not plan_ids:
+            break
+        refresh(session, plan_ids)
+        count += len(plan_ids)
+        last_id = plan_ids[-1]
+    session.commit()
+    return count
+
+
+def get_document(plan_id):
+    """The stored document of a plan, None when disabled or not built."""
+    if not enabled():
+        return None
+    row = db.session.query(PlanDocument.document) \
+        .filter(PlanDocument.plan_id == plan_id).first()
+    return row and json_provider.loads(row[0])
+
+
+def _mark_objects(session, objects):
+    plan_ids, day_ids, exercise_ids = set(), set(), set()
+    for obj in objects:
+        if isinstance(obj, Plan):
+            plan_ids.add(obj.id)
+        elif isinstance(obj, Day):
+            day_ids.add(obj.id)
+        elif isinstance(obj, Exercise):
+            exercise_ids.add(obj.id)
+    plan_ids.discard(None)
+    day_ids.discard(None)
+    exercise_ids.discard(None)
+    if plan_ids or day_ids or exercise_ids:
+        mark_stale(plan_ids, day_ids, exercise_ids, session=session)
+
+
+@event.listens_for(Session, 'before_flush')
+def receive_before_flush(session, flush_context, instances):
+    # deleted days/exercises lose their associations during the flush
+    if enabled(session) and session.deleted:
+        _mark_objects(session, session.deleted)
+
+
+@event.listens_for(Session, 'after_flush')
+def receive_after_flush(session, flush_context):
+    # new plans only have an id after the flush
+    if enabled(session):
+        _mark_objects(session, [obj for obj in session.new] +
+                      [obj for obj in session.dirty if session.is_modified(obj)])
+
+
+@event.listens_for(Session, 'before_commit')
+def receive_before_commit(session):
+    if not enabled(session):
+        return
+    # commit flushes after this hook, the pending changes mark plans too
+    session.flush()
+    plan_ids = session.info.pop('stale_plans', None)
+    if plan_ids:
+        refresh(session, plan_ids)
@@ -0,0 +1,157 @@
+"""rate_limit.py -- sliding window request limits per client IP and username.
+
+RATE_LIMITS maps an endpoint ('auth.login') or a blueprint ('api') to its
+rules, ``(key, requests, seconds)``: at most ``requests`` per ``seconds``
+for each client IP ('ip') or each ``username`` of the JSON body
+('username'). A request over any rule gets a 429 with Retry-After from a
+before_request hook, before the view touches the database or hashes a
+password. Rules are checked in order and a rejected request is not counted
+against the rules after the one it failed, so list 'ip' first; it is
+counted against the ones before, so a client that keeps hammering stays
+throttled.
+
+Each window is approximated from two fixed windows, the current count plus
+the previous one weighted by how much of it is still in the window, so a
+counter is O(1) in time and space. Counters live in a store
+(RATE_LIMIT_BACKEND): 'memory' for a single process or 'redis' for limits
+shared by every worker (RATE_LIMIT_REDIS_URL, 'fake://' uses FakeRedis).
+Behind RATE_LIMIT_PROXIES reverse proxies the client IP is taken from
+X-Forwarded-For.
+"""
+import math
+import threading
+import time
+
+from flask import current_app, request
+
+from cache import FakeRedis
+from json_provider import jsonify
+
+
+class MemoryStore(object):
+    """Counters of this process only."""
+
+    def __init__(self, purge_interval=60):
+        # key -> [window, count, previous count, expires_at]
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.purge_interval = purge_interval
+        self._next_purge = 0
+
+    def hit(self, key, seconds, now):
+        """Counts a request, returns the counts of the current and the
+        previous window."""
+        window = int(now // seconds)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter[0] < window - 1:
+                counter = self._counters[key] = [window, 0, 0, 0]
+            elif counter[0] == window - 1:
+                counter[:3] = [window, 0, counter[1]]
+            counter[1] += 1
+            counter[3] = (window + 2) * seconds
+            counts = counter[1], counter[2]
+            if now >= self._next_purge:
+                # idle clients, in one pass now and then
+                for name, idle in list(self._counters.items()):
+                    if idle[3] <= now:
+                        del self._counters[name]
+                self._next_purge = now + self.purge_interval
+            return counts
+
+    def __len__(self):
+        return len(self._counters)
+
+
+class RedisStore(object):
+    """Counters as expiring keys, one per key and window."""
+
+    def __init__(self, client, prefix='rate:'):
+        self.client = client
+        self.prefix = prefix
+
+    def hit(self, key, seconds, now):
+        window = int(now // seconds)
+        name = u'{}{}:{}'.format(self.prefix, key, window).encode('utf-8')
+        count = self.client.incr(name)
+        if count == 1:
+            # the previous window is still read during the next one
+            self.client.expire(name, 2 * seconds)
+        previous = u'{}{}:{}'.format(self.prefix, key, window - 1)
+        return count, int(self.client.get(previous.encode('utf-8')) or 0)
+
+
+def client_ip():
+    proxies = current_app.config['RATE_LIMIT_PROXIES']
+    if proxies:
+        # the address the first trusted proxy saw, what it was told before
+        # can be made up
+        route = request.access_route
+        return route[max(0, len(route) - proxies)]
+    return request.remote_addr
+
+
+def _username():
+    data = request.get_json(silent=True)
+    username = data.get('username') if isinstance(data, dict) else None
+    return username if isinstance(username, basestring) else None
+
+
+_KEYS = {'ip': client_ip, 'username': _username}
+
+
+class Limiter(object):
+
+    def __init__(self, store, rules):
+        self.store = store
+        self.rules = rules
+
+    def check(self, endpoint, blueprint):
+        """Seconds to wait when the request is over a limit, else None."""
+        # the endpoints of a blueprint rule share its budget
+        scope = endpoint if endpoint in self.rules else blueprint
+        now = time.time()
+        for key, requests, seconds in self.rules.get(scope, ()):
+            value = _KEYS[key]()
+            if value is None:
+                continue
+            name = u'{}:{}:{}:{}'.format(scope, key, seconds, value)
+            count, previous = self.store.hit(name, seconds, now)
+            elapsed = now % seconds / seconds
+            if count + previous * (1 - elapsed) > requests:
+                return int(math.ceil(seconds * (1 - elapsed)))
+        return None
+
+
+def _create_store(config):
+    backend = config['RATE_LIMIT_BACKEND']
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 'redis':
+        url = config['RATE_LIMIT_REDIS_URL']
+        if url == 'fake://':
+            return RedisStore(FakeRedis())
+        import redis
+        return RedisStore(redis.StrictRedis.from_url(url))
+    raise RuntimeError('Unknown RATE_LIMIT_BACKEND {!r}'.format(backend))
+
+
+limiter = None
+
+
+def init_app(app):
+    global limiter
+    limiter = None
+    if not app.config['RATE_LIMIT_BACKEND']:
+        return
+    limiter = app_limiter = Limiter(_create_store(app.config),
+                                    app.config['RATE_LIMITS'])
+
+    @app.before_request
+    def limit_request():
+        retry_after = app_limiter.check(request.endpoint, request.blueprint)
+        if retry_after is not None:
+            response = jsonify({'message': 'Too many requests, retry later.'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            return response
@@ -0,0 +1,204 @@
+"""response_cache.py -- cached GET responses with strong ETags.
+
+Bodies are cached by path, query string and the version of every table the
+endpoint reads. Any INSERT/UPDATE/DELETE on a table bumps its version when it
+is executed and again once the session commits, so a response rendered from
+the old rows is stored under a version that is never read again. The cache is
+in-process ('memory', for a single worker only) or shared ('redis',
+RESPONSE_CACHE_REDIS_URL, 'fake://' uses FakeRedis), see
+RESPONSE_CACHE_BACKEND.
+
+Cached handlers read from the primary even when a replica is configured: a
+replica lagging behind would render rows older than the versions the
+response is stored under.
+
+Every cached response carries the sha1 of its body as ETag, a matching
+``If-None-Match`` gets an empty 304. Entries keep the body in every encoding
+of compression.py, compressed once when the response is stored.
+"""
+import hashlib
+import threading
+from functools import wraps
+
+from flask import current_app, request, make_response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from app import db
+import compression
+from cache import TTLCache, FakeRedis
+from database import read_from_primary
+from streaming import wants_stream
+
+
+class MemoryBackend(object):
+    """Responses and table versions of this process only."""
+
+    def __init__(self, maxsize, ttl):
+        self.entries = TTLCache(maxsize, ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries.set(key, value)
+
+    def versions(self, tables):
+        return [self._versions.get(table, 0) for table in tables]
+
+    def bump(self, table):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+
+class RedisBackend(object):
+    """Responses as expiring keys and table versions as counters."""
+
+    def __init__(self, client, ttl, prefix='response:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    # b'<etag> <encoding>:<size>,... <bodies>'
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        etag, _, value = value.partition(b' ')
+        sizes, _, value = value.partition(b' ')
+        bodies = {}
+        start = 0
+        for item in sizes.decode('ascii').split(','):
+            encoding, _, size = item.partition(':')
+            bodies[encoding] = value[start:start + int(size)]
+            start += int(size)
+        return etag.decode('ascii'), bodies
+
+    def set(self, key, value):
+        etag, bodies = value
+        items = list(bodies.items())
+        sizes = ','.join('%s:%d' % (encoding, len(body))
+                         for encoding, body in items)
+        self.client.set(self.prefix + key, b' '.join(
+            [etag.encode('ascii'), sizes.encode('ascii'),
+             b''.join(body for _, body in items)]), ex=self.ttl)
+
+    def versions(self, tables):
+        return [int(version or 0) for version in self.client.mget(
+            [self.prefix + 'version:' + table for table in tables])]
+
+    def bump(self, table):
+        self.client.incr(self.prefix + 'version:' + table)
+
+
+def _create_backend(config):
+    backend = config['RESPONSE_CACHE_BACKEND']
+    if backend == 'memory':
+        # the other workers would keep serving what one of them changed
+        if config['WEB_WORKERS'] > 1:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND 'memory' is per "
+                               "process, use 'redis' with WEB_WORKERS > 1")
+        return MemoryBackend(config['RESPONSE_CACHE_SIZE'],
+                             config['RESPONSE_CACHE_TTL'])
+    if backend == 'redis':
+        url = config['RESPONSE_CACHE_REDIS_URL']
+        if url == 'fake://':
+            return RedisBackend(FakeRedis(), config['RESPONSE_CACHE_TTL'])
+        import redis
+        return RedisBackend(redis.StrictRedis.from_url(url),
+                            config['RESPONSE_CACHE_TTL'])
+    raise RuntimeError('Unknown RESPONSE_CACHE_BACKEND {!r}'.format(backend))
+
+
+backend = None
+
+
+def init_app(app):
+    global backend
+    backend = None
+    if app.config['RESPONSE_CACHE_BACKEND']:
+        backend = _create_backend(app.config)
+
+
+@event.listens_for(Engine, 'after_execute')
+def receive_after_execute(conn, clauseelement, multiparams, params, result):
+    # ORM flushes and the Core statements of sync_association/bulk both
+    # end up here
+    if backend is None or not isinstance(clauseelement, UpdateBase):
+        return
+    table = clauseelement.table.name
+    backend.bump(table)
+    if db.session.registry.has():
+        db.session().info.setdefault('changed_tables', set()).add(table)
+
+
+@event.listens_for(Session, 'after_commit')
+def receive_after_commit(session):
+    for table in session.info.pop('changed_tables', ()):
+        backend.bump(table)
+
+
+@event.listens_for(Session, 'after_rollback')
+def receive_after_rollback(session):
+    session.info.pop('changed_tables', None)
+
+
+def _cache_key(tables, vary):
+    args = sorted(request.args.items(multi=True))
+    versions = backend.versions(tables)
+    raw = u'{}?{}#{}'.format(request.path, args, versions)
+    if vary is not None:
+        raw += u'@{}'.format(vary())
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _conditional(etag, bodies):
+    encoding = compression.negotiate(
+        [e for e in compression.available(current_app.config) if e in bodies])
+    encoding = encoding or 'identity'
+    etag = compression.variant_etag(etag, encoding)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(bodies[encoding],
+                                              mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    if len(bodies) > 1:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    # authenticated data, clients revalidate with the ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def cached_response(*tables, **options):
+    """Caches the 200 responses of a GET handler reading ``tables``.
+
+    ``vary`` returns what else the response depends on, e.g. the user.
+    """
+    vary = options.pop('vary', None)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if backend is None or request.method != 'GET' or wants_stream():
+                return fn(*args, **kwargs)
+            key = _cache_key(tables, vary)
+            entry = backend.get(key)
+            if entry is None:
+                read_from_primary()
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = (hashlib.sha1(body).hexdigest(),
+                         compression.variants(body))
+                backend.set(key, entry)
+            return _conditional(*entry)
+        return wrapper
+    return decorator
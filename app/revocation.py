@@ -0,0 +1,253 @@
+"""revocation.py -- revoked tokens, keyed by jti.
+
+Revoked jtis are kept in a store (REVOCATION_BACKEND): 'memory' for a single
+process, 'sql' for the revoked_tokens table, or 'redis' for anything with the
+redis-py interface (REVOCATION_REDIS_URL, 'fake://' uses FakeRedis). Every
+revoked jti also goes in an in-process Bloom filter, so checking a token that
+was not revoked never reaches the store. Other processes' revocations are
+pulled into the filter every REVOCATION_SYNC_INTERVAL seconds, and entries
+are purged once their token has expired.
+"""
+import datetime
+import hashlib
+import math
+import struct
+import threading
+import time
+
+from flask import current_app
+from flask_jwt_extended.config import get_algorithm
+from flask_jwt_extended.exceptions import JWTDecodeError
+from flask_jwt_extended.utils import _decode_jwt, _get_secret_key
+from jwt import InvalidTokenError
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from cache import FakeRedis
+from models import RevokedToken
+
+
+class BloomFilter(object):
+    """Set membership with false positives but no false negatives."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing on the two halves of one md5
+        h1, h2 = struct.unpack('>QQ', hashlib.md5(key.encode('utf-8')).digest())
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+
+class MemoryStore(object):
+    """Revoked jtis of this process only."""
+
+    def __init__(self):
+        # jti -> (expires_at, revoked_at)
+        self._tokens = {}
+
+    def add(self, jti, expires_at, revoked_at):
+        self._tokens[jti] = (expires_at, revoked_at)
+
+    def contains(self, jti):
+        entry = self._tokens.get(jti)
+        return entry is not None and entry[0] > time.time()
+
+    def since(self, timestamp):
+        return [jti for jti, (_, revoked_at) in self._tokens.items()
+                if revoked_at >= timestamp]
+
+    def active(self):
+        now = time.time()
+        return [jti for jti, (expires_at, _) in self._tokens.items()
+                if expires_at > now]
+
+    def purge(self, now):
+        for jti, (expires_at, _) in list(self._tokens.items()):
+            if expires_at <= now:
+                self._tokens.pop(jti, None)
+
+
+def _utc(timestamp):
+    return datetime.datetime.utcfromtimestamp(timestamp)
+
+
+class SQLStore(object):
+    """Revoked jtis in the revoked_tokens table of the app database.
+
+    Writes go through a connection and transaction of their own, the
+    session of the request keeps whatever it has pending. Reads too: the
+    session would read from the replica on GET requests, which may not
+    have the revocation yet.
+    """
+
+    table = RevokedToken.__table__
+
+    def add(self, jti, expires_at, revoked_at):
+        values = {'expires_at': _utc(expires_at),
+                  'revoked_at': _utc(revoked_at)}
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(self.table.insert().values(jti=jti, **values))
+        except IntegrityError:
+            # revoked already
+            with db.engine.begin() as connection:
+                connection.execute(self.table.update().where(
+                    self.table.c.jti == jti).values(**values))
+
+    def _jtis(self, *criteria):
+        with db.engine.connect() as connection:
+            return [jti for (jti,) in connection.execute(
+                db.select([self.table.c.jti]).where(db.and_(*criteria)))]
+
+    def contains(self, jti):
+        return bool(self._jtis(
+            self.table.c.jti == jti,
+            self.table.c.expires_at > datetime.datetime.utcnow()))
+
+    def since(self, timestamp):
+        return self._jtis(self.table.c.revoked_at >= _utc(timestamp))
+
+    def active(self):
+        return self._jtis(
+            self.table.c.expires_at > datetime.datetime.utcnow())
+
+    def purge(self, now):
+        with db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(
+                self.table.c.expires_at <= _utc(now)))
+
+
+class RedisStore(object):
+    """Revoked jtis as expiring keys, plus a sorted set of revocation times."""
+
+    def __init__(self, client, prefix='revoked:'):
+        self.client = client
+        self.prefix = prefix
+        self.log = prefix + 'log'
+
+    def add(self, jti, expires_at, revoked_at):
+        ttl = max(1, int(math.ceil(expires_at - time.time())))
+        self.client.set(self.prefix + jti, 1, ex=ttl)
+        self.client.zadd(self.log, {jti: revoked_at})
+
+    def contains(self, jti):
+        return bool(self.client.exists(self.prefix + jti))
+
+    def since(self, timestamp):
+        return [jti.decode('utf-8') if isinstance(jti, bytes) else jti
+                for jti in self.client.zrangebyscore(self.log, timestamp, '+inf')]
+
+    def active(self):
+        return [jti for jti in self.since(0) if self.contains(jti)]
+
+    def purge(self, now):
+        # the keys expire by themselves, trim the log
+        max_age = current_app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds()
+        self.client.zremrangebyscore(self.log, '-inf', now - max_age)
+
+
+class Revocations(object):
+
+    def __init__(self, store, capacity, error_rate, sync_interval, max_age):
+        self.store = store
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+        self.bloom = None
+        self._synced_at = 0
+        self._next_sync = 0
+        self._next_rebuild = 0
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        self._sync()
+        self.store.add(jti, expires_at, time.time())
+        self.bloom.add(jti)
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self.bloom:
+            return False
+        return self.store.contains(jti)
+
+    def _sync(self):
+        now = time.time()
+        if now < self._next_sync:
+            return
+        with self._lock:
+            if now < self._next_sync:
+                return
+            if now >= self._next_rebuild:
+                # a Bloom filter cannot forget, rebuild it without the
+                # purged entries
+                self.store.purge(now)
+                bloom = BloomFilter(self.capacity, self.error_rate)
+                for jti in self.store.active():
+                    bloom.add(jti)
+                self.bloom = bloom
+                self._next_rebuild = now + self.max_age
+            else:
+                for jti in self.store.since(self._synced_at):
+                    self.bloom.add(jti)
+            # overlap a little, the store's clock is not ours
+            self._synced_at = now - 1
+            self._next_sync = now + self.sync_interval
+
+
+def _create_store(config):
+    backend = config['REVOCATION_BACKEND']
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 'sql':
+        return SQLStore()
+    if backend == 'redis':
+        url = config['REVOCATION_REDIS_URL']
+        if url == 'fake://':
+            return RedisStore(FakeRedis())
+        import redis
+        return RedisStore(redis.StrictRedis.from_url(url))
+    raise RuntimeError('Unknown REVOCATION_BACKEND {!r}'.format(backend))
+
+
+revocations = None
+
+
+def init_app(app):
+    global revocations
+    revocations = None
+    if app.config['REVOCATION_BACKEND']:
+        revocations = Revocations(
+            _create_store(app.config),
+            app.config['REVOCATION_BLOOM_CAPACITY'],
+            app.config['REVOCATION_BLOOM_ERROR_RATE'],
+            app.config['REVOCATION_SYNC_INTERVAL'],
+            app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds())
+
+
+def is_revoked(jti):
+    return revocations is not None and revocations.is_revoked(jti)
+
+
+def revoke_encoded_token(encoded_token):
+    """Revokes a token we issued until it expires, ignores anything else."""
+    if revocations is None or not encoded_token:
+        return False
+    try:
+        data = _decode_jwt(encoded_token, _get_secret_key(), get_algorithm())
+    except (InvalidTokenError, JWTDecodeError, ValueError):
+        return False
+    revocations.revoke(data['jti'], data['exp'])
+    return True
@@ -0,0 +1,81 @@
+"""serializers.py -- precompiled model serializers."""
+
+
+def _compile(fields, template):
+    """Generates ``dump(o)`` returning ``{field: <template>}`` as a dict display."""
+    items = ', '.join('%r: %s' % (field, template % {'field': field, 'index': i})
+                      for i, field in enumerate(fields))
+    namespace = {}
+    exec('def dump(o):\n    return {%s}\n' % items, namespace)
+    return namespace['dump']
+
+
+class Serializer(object):
+    """Dumps model objects (or column rows) to dicts.
+
+    The scalar fields are compiled into generated functions that build the
+    dict in one expression: from the loaded state of an ORM object (falling
+    back to attribute access when something is expired), or by index from a
+    row selected with ``columns``. ``nested`` maps a relationship name to
+    the serializer of its items.
+    """
+
+    def __init__(self, fields, **nested):
+        self.fields = tuple(fields)
+        self.nested = nested
+        self._dump_state = _compile(self.fields, 'o[%(field)r]')
+        self._dump_attrs = _compile(self.fields, 'o.%(field)s')
+        self._dump_row = _compile(self.fields, 'o[%(index)d]')
+        self._only = {}
+
+    def only(self, fields):
+        """Variant restricted to ``fields``, None returns self."""
+        if fields is None:
+            return self
+        # keyed by the known names alone, whatever their order or repeats,
+        # so there is at most one variant per subset of the fields
+        key = frozenset(f for f in fields
+                        if f in self.fields or f in self.nested)
+        variant = self._only.get(key)
+        if variant is None:
+            variant = Serializer(
+                [f for f in self.fields if f in key],
+                **dict((name, serializer) for name, serializer
+                       in self.nested.items() if name in key))
+            self._only[key] = variant
+        return variant
+
+    def columns(self, model):
+        """Mapped columns to SELECT for ``dump_row``."""
+        return [getattr(model, f) for f in self.fields]
+
+    def dump(self, obj):
+        try:
+            item = self._dump_state(obj.__dict__)
+        except KeyError:
+            # expired or deferred, let the ORM load it
+            item = self._dump_attrs(obj)
+        for name, serializer in self.nested.items():
+            item[name] = serializer.dump_many(getattr(obj, name))
+        return item
+
+    def dump_many(self, objs):
+        if self.nested:
+            return [self.dump(obj) for obj in objs]
+        dump_state = self._dump_state
+        items = []
+        # falls back per object, ``objs`` may be a generator
+        for obj in objs:
+            try:
+                items.append(dump_state(obj.__dict__))
+            except KeyError:
+                items.append(self.dump(obj))
+        return items
+
+    def dump_row(self, row):
+        """Dumps a row selected with ``columns``, skipping the ORM."""
+        return self._dump_row(row)
+
+    def dump_rows(self, rows):
+        dump_row = self._dump_row
+        return [dump_row(row) for row in rows]
@@ -0,0 +1,60 @@
+"""streaming.py -- NDJSON / chunked JSON array exports of whole collections."""
+from flask import Response, current_app, json, request, \
+    stream_with_context
+
+NDJSON = 'application/x-ndjson'
+
+
+def wants_stream():
+    """True for ``?stream=1`` or an ``Accept: application/x-ndjson``."""
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON]) == NDJSON
+
+
+def iter_column_rows(query):
+    """Rows of a column query through a server-side cursor."""
+    return query.yield_per(current_app.config['API_STREAM_BATCH_SIZE'])
+
+
+def iter_batches(query, id_column):
+    """Keyset batches of ``query``, for queries with eager loads.
+
+    ``yield_per`` cannot be combined with subquery eager loading, so nested
+    collections are walked in batches of API_STREAM_BATCH_SIZE instead.
+    """
+    batch_size = current_app.config['API_STREAM_BATCH_SIZE']
+    last_id = None
+    while True:
+        batch_query = query
+        if last_id is not None:
+            batch_query = batch_query.filter(id_column > last_id)
+        batch = batch_query.order_by(id_column).limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+        if len(batch) < batch_size:
+            return
+
+
+def stream_response(items):
+    """Streams the ``items`` dicts as NDJSON or as a JSON array."""
+    ndjson = request.accept_mimetypes.best_match(
+        ['application/json', NDJSON]) == NDJSON
+
+    def generate():
+        if ndjson:
+            for item in items:
+                yield json.dumps(item) + '\n'
+            return
+        yield '['
+        separator = ''
+        for item in items:
+            yield separator + json.dumps(item)
+            separator = ','
+        yield ']'
+
+    return Response(stream_with_context(generate()),
+                    mimetype=NDJSON if ndjson else 'application/json')
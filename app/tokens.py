@@ -0,0 +1,73 @@
+"""tokens.py -- access/refresh token checks for the API.
+
+A client reuses its access token until it expires, so with
+JWT_VERIFY_CACHE_SIZE > 0 the decoded claims of header tokens are kept by a
+digest of the raw token and the signature is checked once. An entry never
+outlives the token's ``exp``. Revocation is checked on every request, the
+cache only skips decoding and the signature check.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from flask import request, _app_ctx_stack as ctx_stack
+from flask_jwt_extended.config import get_jwt_header_name, \
+    get_jwt_header_type, get_token_location
+from flask_jwt_extended.exceptions import RevokedTokenError, WrongTokenError
+from flask_jwt_extended.utils import _decode_jwt_from_request
+
+from cache import TTLCache
+from revocation import is_revoked
+
+token_cache = TTLCache(0, 0)  # sized by create_app
+
+
+def raw_header_token():
+    """The token of the Authorization header, None if there is none."""
+    header = request.headers.get(get_jwt_header_name(), '')
+    parts = header.split()
+    if len(parts) == 2 and parts[0] == get_jwt_header_type():
+        return parts[1]
+    return None
+
+
+def _verify(token_type):
+    key = None
+    if token_type == 'access' and token_cache.maxsize and \
+            get_token_location() == 'headers':
+        raw_token = raw_header_token()
+        key = raw_token and hashlib.sha256(raw_token.encode('utf-8')).digest()
+    jwt_data = key and token_cache.get(key)
+    if jwt_data is None:
+        # raises the usual flask_jwt_extended errors
+        jwt_data = _decode_jwt_from_request(type=token_type)
+        if jwt_data['type'] != token_type:
+            raise WrongTokenError(
+                'Only {} tokens can access this endpoint'.format(token_type))
+        ttl = jwt_data['exp'] - time.time()
+        if key and ttl > 0:
+            token_cache.set(key, jwt_data, ttl=min(ttl, token_cache.ttl))
+    if is_revoked(jwt_data['jti']):
+        raise RevokedTokenError('Token has been revoked')
+    return jwt_data
+
+
+def access_token_required(fn):
+    """``jwt_required`` with the verified token cache and revocation."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        jwt_data = _verify('access')
+        ctx_stack.top.jwt_identity = jwt_data['identity']
+        ctx_stack.top.jwt_user_claims = jwt_data['user_claims']
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def refresh_token_required(fn):
+    """``jwt_refresh_token_required`` with revocation."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        jwt_data = _verify('refresh')
+        ctx_stack.top.jwt_identity = jwt_data['identity']
+        return fn(*args, **kwargs)
+    return wrapper
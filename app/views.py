@@ -1,130 +1,126 @@
 """views.py."""
-from sqlalchemy.exc import IntegrityError
-from flask import request, jsonify, session
-from functools import wraps
-from flask_jwt_extended import JWTManager, jwt_required, \
-    create_access_token, jwt_refresh_token_required, \
-    create_refresh_token, get_jwt_identity
+from collections import defaultdict
+from sqlalchemy.exc import IntegrityError, DBAPIError
+from sqlalchemy.orm import subqueryload
+from flask import Blueprint, request
 from flask.views import MethodView
 
-from app import app, db
-from models import User, Exercise, Day, Plan, Client
-
-jwt = JWTManager(app)
-
-
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not session.get('user_id'):
-            return jsonify({"message": "Please login to continue", "next": request.path}), 401
-        return f(*args, **kwargs)
-    return decorated_function
-
-DECORATORS = [login_required, jwt_required]
-
-
-@app.route('/sign_up', methods=['POST'])
-def sign_up():
-    # TODO - better/generic exception handling
-    data = request.get_json()
-    if not data:
-        return jsonify({"message": "Please input the username and password."})
-    new_user = User(username=data['username'], password=data['password'])
-    db.session.add(new_user)
-    try:
-        db.session.commit()
-    except IntegrityError as e:
-        return jsonify({"message": "The username already in DB."}), 409
-    except Exception as e:
-        return jsonify({"message": e.message})
-    return jsonify({"message": "User Created Successfully.", "username": data['username']})
-
-
-@app.route('/login', methods=['POST'])
-def login():
-    username = request.json.get('username', None)
-    password = request.json.get('password', None)
-    user = User.query.filter(User.username == username).scalar()
-    if not user or not user.check_password(password):
-        return jsonify({"msg": "Bad username or password"}), 401
-
-    session['user_id'] = user.id
-    session['logged_in'] = True
-    # Use create_access_token() and create_refresh_token() to create our
-    # access and refresh tokens
-    ret = {
-        'access_token': create_access_token(identity=username),
-        'refresh_token': create_refresh_token(identity=username)
-    }
-    return jsonify(ret), 200
-
-
-@app.route('/logout')
-def logout():
-    session.pop('logged_in', None)
-    session.pop('user_id', None)
-    ret = {
-        'message': 'Logged out successfully.'
-    }
-    return jsonify(ret), 200
-
-# Refresh token endpoint. This will generate a new access token from
-# the refresh token, but will mark that access token as non-fresh
-# (so that it cannot access any endpoint protected via the
-# fresh_jwt_required decorator)
-
-
-@app.route('/refresh', methods=['POST'])
-@jwt_refresh_token_required
-def refresh():
-    current_user = get_jwt_identity()
-    new_token = create_access_token(identity=current_user, fresh=False)
-    ret = {'access_token': new_token}
-    return jsonify(ret), 200
+from app import db
+from json_provider import jsonify
+from models import Exercise, Day, Plan, Client, \
+    day_association_table, exercise_association_table, sync_association, \
+    sync_plan_clients, enqueue_notifications
+from pagination import Page
+from auth import api_auth_required, current_user_id
+from bulk import BulkAPI
+from response_cache import cached_response
+import plan_documents
+from streaming import wants_stream, iter_column_rows, iter_batches, \
+    stream_response
+
+api = Blueprint('api', __name__)
+
+
+@api.route('/health', methods=['GET'])
+def health():
+    # pings every database, the pool metrics help to size the pools
+    ret = {'status': 'ok', 'databases': db.pool_stats()}
+    for name, metrics in db.pool_metrics.items():
+        try:
+            metrics.engine.scalar(db.select([1]))
+            ret['databases'][name]['status'] = 'ok'
+        except DBAPIError as e:
+            ret['status'] = ret['databases'][name]['status'] = 'unavailable'
+            ret['databases'][name]['error'] = str(e.orig)
+    return jsonify(ret), 200 if ret['status'] == 'ok' else 503
+
+
+def _set_day_exercises(day_id, exercise_ids):
+    # returns the exercise ids that do not exist
+    exercise_ids, missing = Exercise.resolve_ids(exercise_ids)
+    if sync_association(exercise_association_table,
+                        exercise_association_table.c.day_id,
+                        exercise_association_table.c.exercise_id,
+                        day_id, exercise_ids):
+        plan_documents.mark_stale(day_ids=[day_id])
+    return missing
+
+
+def _set_plan_members(plan_id, data):
+    # returns the client/day ids that do not exist, clients of other
+    # trainers are missing too, and whether the days changed
+    missing = {}
+    changed = False
+    if data.get('clients'):
+        owner_id = current_user_id()
+        client_ids, missing['clients'] = Client.resolve_ids(
+            data['clients'], Client.owner_id == owner_id)
+        sync_plan_clients(plan_id, owner_id, client_ids)
+    if data.get('days'):
+        day_ids, missing['days'] = Day.resolve_ids(data['days'])
+        changed = sync_association(day_association_table,
+                                   day_association_table.c.plan_id,
+                                   day_association_table.c.day_id,
+                                   plan_id, day_ids)
+        if changed:
+            plan_documents.mark_stale(plan_ids=[plan_id])
+    return dict((k, v) for k, v in missing.items() if v), changed
+
+
+def _get_clients_by_plan(plan_ids, owner_id):
+    # one IN query for the clients of every plan instead of a
+    # plan.clients query per plan
+    clients_by_plan = defaultdict(list)
+    if plan_ids:
+        clients = Client.query.filter(Client.plan_id.in_(plan_ids),
+                                      Client.owner_id == owner_id) \
+            .order_by(Client.id)
+        for each_client in clients:
+            clients_by_plan[each_client.plan_id].append(each_client)
+    return clients_by_plan
+
+
+def _owned_clients(query, criteria=()):
+    # a trainer only sees their own clients, served by the
+    # (owner_id, id) and (owner_id, plan_id, id) indexes
+    return query.filter(Client.owner_id == current_user_id(), *criteria)
 
 
 class ClientUserAPI(MethodView):
-    decorators = DECORATORS
+    decorators = [api_auth_required]
 
     def get(self, client_id):
+        serializer = Client.serializer
         if client_id is None:
-            # return a list of users
-            clients = Client.query.all()
-            data = []
-            count = 0
-            for each_client in clients:
-                count += 1
-                data.append(
-                    {
-                        'id': each_client.id,
-                        'email': each_client.email,
-                        'first_name': each_client.first_name,
-                        'last_name': each_client.last_name,
-                        'age': each_client.age,
-                        'weight': each_client.weight,
-                        'height': each_client.height,
-                        'owner_id': each_client.owner_id,
-                        'plan_id': each_client.plan_id
-                    }
-                )
-            return jsonify({"data": data, "count": count}), 200
+            try:
+                criteria = Client.filters.criteria(request.args)
+                order_by = Client.filters.ordering(request.args)
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 422
+            if wants_stream():
+                rows = iter_column_rows(_owned_clients(db.session.query(
+                    *serializer.columns(Client)), criteria)
+                    .order_by(*(order_by or []) + [Client.id]))
+                return stream_response(serializer.dump_row(row) for row in rows)
+            # return a page of the trainer's clients
+            try:
+                page = Page.from_request(serializer.fields, order_by)
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 422
+            serializer = serializer.only(page.fields)
+            rows = page.fetch(_owned_clients(db.session.query(
+                *serializer.columns(Client)), criteria), Client.id)
+            count_key = 'clients:{}:{}'.format(
+                current_user_id(), Client.filters.key(request.args))
+            return jsonify(page.response(
+                serializer.dump_rows(rows), count_key,
+                _owned_clients(Client.query, criteria))), 200
         else:
             # expose a single user
-            client = Client.query.filter_by(id=client_id).first()
+            client = Client.query.filter_by(
+                id=client_id, owner_id=current_user_id()).first()
             if client:
-                ret = {
-                    'id': client.id,
-                    'email': client.email,
-                    'first_name': client.first_name,
-                    'last_name': client.last_name,
-                    'age': client.age,
-                    'weight': client.weight,
-                    'height': client.height,
-                    'owner_id': client.owner_id,
-                    'plan_id': client.plan_id
-                }
-                return jsonify(ret), 200
+                return jsonify(serializer.dump(client)), 200
             ret = {
                 'message': 'Client not found.',
             }
@@ -145,7 +141,7 @@ class ClientUserAPI(MethodView):
                             age=data.get('age'),
                             weight=data.get('weight'),
                             height=data.get('height'),
-                            owner_id=session.get('user_id'))
+                            owner_id=current_user_id())
             try:
                 db.session.add(client)
                 db.session.commit()
@@ -169,7 +165,7 @@ class ClientUserAPI(MethodView):
     def delete(self, client_id):
         # delete a single user
         client = Client.query.filter_by(
-            id=client_id, owner_id=session.get('user_id')).first()
+            id=client_id, owner_id=current_user_id()).first()
         if not client:
             ret = {
                 'message': 'Client not found.',
@@ -187,7 +183,8 @@ class ClientUserAPI(MethodView):
         # update a single user
         data = request.get_json()
         if data:
-            client = Client.query.filter_by(id=client_id).first()
+            client = Client.query.filter_by(
+                id=client_id, owner_id=current_user_id()).first()
             if not client:
                 ret = {
                     'message': 'Client not found.',
@@ -230,32 +227,37 @@ class ClientUserAPI(MethodView):
 
 
 class ExerciseAPI(MethodView):
-    decorators = DECORATORS
+    decorators = [api_auth_required]
 
+    @cached_response('exercises')
     def get(self, exercise_id):
+        serializer = Exercise.serializer
         if exercise_id is None:
-            exercises = Exercise.query.all()
-            data = []
-            count = 0
-            for each_exercise in exercises:
-                count += 1
-                data.append(
-                    {
-                        'id': each_exercise.id,
-                        'name': each_exercise.name,
-                        'activity': each_exercise.activity
-                    }
-                )
-            return jsonify({"data": data, "count": count}), 200
+            try:
+                criteria = Exercise.filters.criteria(request.args)
+                order_by = Exercise.filters.ordering(request.args)
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 422
+            if wants_stream():
+                rows = iter_column_rows(db.session.query(
+                    *serializer.columns(Exercise)).filter(*criteria)
+                    .order_by(*(order_by or []) + [Exercise.id]))
+                return stream_response(serializer.dump_row(row) for row in rows)
+            try:
+                page = Page.from_request(serializer.fields, order_by)
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 422
+            serializer = serializer.only(page.fields)
+            rows = page.fetch(db.session.query(
+                *serializer.columns(Exercise)).filter(*criteria), Exercise.id)
+            count_key = 'exercises:' + Exercise.filters.key(request.args)
+            return jsonify(page.response(
+                serializer.dump_rows(rows), count_key,
+                Exercise.query.filter(*criteria))), 200
         else:
             exercise = Exercise.query.filter_by(id=exercise_id).first()
             if exercise:
-                ret = {
-                    'id': exercise.id,
-                    'name': exercise.name,
-                    'activity': exercise.activity
-                }
-                return jsonify(ret), 200
+                return jsonify(serializer.dump(exercise)), 200
             ret = {
                 'message': 'Exercise not found.',
             }
@@ -325,42 +327,35 @@ class ExerciseAPI(MethodView):
 
 
 class DaysAPI(MethodView):
-    decorators = DECORATORS
+    decorators = [api_auth_required]
 
+    @cached_response('days', 'exercise_association_table', 'exercises')
     def get(self, day_id):
-        def _get_exercises_data(day):
-            exercises = []
-            for each_ex in day.exercises:
-                temp_dat = {}
-                temp_dat['id'] = each_ex.id
-                temp_dat['name'] = each_ex.name
-                temp_dat['activity'] = each_ex.activity
-                exercises.append(temp_dat)
-            return exercises
-
+        serializer = Day.serializer
         if day_id is None:
-            days = Day.query.all()
-            data = []
-            count = 0
-            for each_day in days:
-                count += 1
-                data.append(
-                    {
-                        'id': each_day.id,
-                        'name': each_day.name,
-                        'exercises': _get_exercises_data(each_day)
-                    }
-                )
-            return jsonify({"data": data, "count": count}), 200
+            if wants_stream():
+                batches = iter_batches(
+                    Day.query.options(subqueryload(Day.exercises)), Day.id)
+                return stream_response(serializer.dump(each_day)
+                                       for batch in batches for each_day in batch)
+            try:
+                page = Page.from_request(serializer.fields + ('exercises',))
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 422
+            serializer = serializer.only(page.fields)
+            if not page.wants('exercises'):
+                rows = page.fetch(
+                    db.session.query(*serializer.columns(Day)), Day.id)
+                return jsonify(page.response(
+                    serializer.dump_rows(rows), 'days', Day.query)), 200
+            days = page.fetch(
+                Day.query.options(subqueryload(Day.exercises)), Day.id)
+            return jsonify(page.response(
+                serializer.dump_many(days), 'days', Day.query)), 200
         else:
             day = Day.query.filter_by(id=day_id).first()
             if day:
-                ret = {
-                    'id': day.id,
-                    'name': day.name,
-                    'exercises': _get_exercises_data(day)
-                }
-                return jsonify(ret), 200
+                return jsonify(serializer.dump(day)), 200
             ret = {
                 'message': 'Exercise not found.',
             }
@@ -374,20 +369,21 @@ class DaysAPI(MethodView):
                 'message': 'Provide data.',
             }
             return jsonify(ret), 422
-        exercises = []
-        if data.get('exercises'):
-            exercises = [Exercise.get(each_exercise)
-                         for each_exercise in data.get('exercises')]
-
-        day = Day(name=data['name'], exercises=filter(None, exercises))
+        day = Day(name=data['name'])
         db.session.add(day)
+        db.session.flush()
+        day_id = day.id
+        missing = []
+        if data.get('exercises'):
+            missing = _set_day_exercises(day_id, data['exercises'])
         db.session.commit()
-        db.session.refresh(day)
         ret = {
             'message': 'Day created successfully.',
-            'id': day.id,
+            'id': day_id,
             'name': data['name']
         }
+        if missing:
+            ret['missing'] = {'exercises': missing}
         return jsonify(ret), 200
 
     def delete(self, day_id):
@@ -419,18 +415,16 @@ class DaysAPI(MethodView):
             if data.get('name'):
                 day.name = data.get('name')
             # must provide all users to be present or None
+            missing = []
             if data.get('exercises'):
-                exercises = []
-                for each_id in data['exercises']:
-                    ex_obj = Exercise.query.get(each_id)
-                    if ex_obj:
-                        exercises.append(ex_obj)
-                day.exercises = exercises
+                missing = _set_day_exercises(day.id, data['exercises'])
             db.session.commit()
             ret = {
                 'message': 'Day updated successfully.',
-                'id': day.id
+                'id': day_id
             }
+            if missing:
+                ret['missing'] = {'exercises': missing}
             return jsonify(ret), 200
         ret = {
             'message': 'Provide data to update.',
@@ -439,64 +433,74 @@ class DaysAPI(MethodView):
 
 
 class PlanAPI(MethodView):
-    decorators = DECORATORS
+    decorators = [api_auth_required]
 
+    # plans embed their days, exercises and the clients of the trainer
+    @cached_response('plans', 'day_association_table', 'days',
+                     'exercise_association_table', 'exercises', 'clients',
+                     vary=current_user_id)
     def get(self, plan_id):
-        def _get_plan_days(plan):
-            out = []
-            for each_day in plan.days:
-                d_data = {}
-                d_data['id'] = each_day.id
-                d_data['name'] = each_day.name
-                d_data['exercises'] = []
-                for each_ex in each_day.exercises:
-                    d_data['exercises'].append({'id': each_ex.id,
-                                                'name': each_ex.name,
-                                                'activity': each_ex.activity
-                                                })
-                out.append(d_data)
-            return out
-
-        def _get_plan_clients(plan):
-            out = []
-            for each_client in plan.clients:
-                c_data = {}
-                c_data['id'] = each_client.id
-                c_data['email'] = each_client.email
-                c_data['first_name'] = each_client.first_name
-                c_data['last_name'] = each_client.last_name
-                c_data['age'] = each_client.age
-                c_data['weight'] = each_client.weight
-                c_data['height'] = each_client.height
-                out.append(c_data)
-            return out
+        serializer = Plan.serializer
+        owner_id = current_user_id()
+
+        def _dump_plans(plans, serializer, with_clients=True):
+            data = serializer.dump_many(plans)
+            if with_clients:
+                clients_by_plan = _get_clients_by_plan(
+                    [each_plan.id for each_plan in plans], owner_id)
+                for item in data:
+                    item['clients'] = Client.plan_serializer.dump_many(
+                        clients_by_plan[item['id']])
+            return data
+
+        def _stream_plans():
+            batches = iter_batches(Plan.query.options(
+                subqueryload(Plan.days).subqueryload(Day.exercises)), Plan.id)
+            for batch in batches:
+                for item in _dump_plans(batch, serializer):
+                    yield item
 
         if plan_id is None:
-            # return a list of plan
-            plans = Plan.query.all()
-            data = []
-            count = 0
-            for each_plan in plans:
-                count += 1
-                data.append(
-                    {
-                        'id': each_plan.id,
-                        'name': each_plan.name,
-                        'days': _get_plan_days(each_plan),
-                        'clients': _get_plan_clients(each_plan)
-                    }
-                )
-            return jsonify({"data": data, "count": count}), 200
+            if wants_stream():
+                return stream_response(_stream_plans())
+            # return a page of plans
+            try:
+                page = Page.from_request(
+                    serializer.fields + ('days', 'clients'))
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 422
+            serializer = serializer.only(page.fields)
+            with_clients = page.wants('clients')
+            if not page.wants('days') and not with_clients:
+                rows = page.fetch(
+                    db.session.query(*serializer.columns(Plan)), Plan.id)
+                return jsonify(page.response(
+                    serializer.dump_rows(rows), 'plans', Plan.query)), 200
+            query = Plan.query
+            if page.wants('days'):
+                query = query.options(
+                    subqueryload(Plan.days).subqueryload(Day.exercises))
+            plans = page.fetch(query, Plan.id)
+            return jsonify(page.response(
+                _dump_plans(plans, serializer, with_clients),
+                'plans', Plan.query)), 200
         else:
             # expose a single plan
-            plan = Plan.query.filter_by(id=plan_id).first()
+            ret = plan_documents.get_document(plan_id)
+            if ret is not None:
+                ret['clients'] = Client.plan_serializer.dump_rows(
+                    db.session.query(*Client.plan_serializer.columns(Client))
+                    .filter(Client.plan_id == plan_id,
+                            Client.owner_id == owner_id).order_by(Client.id))
+                return jsonify(ret), 200
+            plan = Plan.query.options(
+                subqueryload(Plan.days).subqueryload(Day.exercises)) \
+                .filter_by(id=plan_id).first()
             if plan:
-                ret = {
-                    'id': plan.id,
-                    'name': plan.name,
-                    'days': _get_plan_days(plan),
-                    'clients': _get_plan_clients(plan)
-                }
+                ret = serializer.dump(plan)
+                ret['clients'] = Client.plan_serializer.dump_many(
+                    plan.clients.filter(Client.owner_id == owner_id)
+                    .order_by(Client.id))
                 return jsonify(ret), 200
             ret = {
                 'message': 'Exercise not found.',
@@ -512,23 +516,18 @@ class PlanAPI(MethodView):
             }
             return jsonify(ret), 422
         plan = Plan(name=data['name'])
-        if data.get('clients'):
-            clients = [Client.get(each_client)
-                       for each_client in data.get('clients')]
-            plan.clients = filter(None, clients)
-
-        if data.get('days'):
-            days = [Day.query.get(each_day) for each_day in data.get('days')]
-            plan.days = filter(None, days)
-
         db.session.add(plan)
+        db.session.flush()
+        plan_id = plan.id
+        missing, _ = _set_plan_members(plan_id, data)
         db.session.commit()
-        db.session.refresh(plan)
         ret = {
-            'id': plan.id,
+            'id': plan_id,
             'message': 'Plan created successfully.',
             'name': data['name']
         }
+        if missing:
+            ret['missing'] = missing
         return jsonify(ret), 200
 
     def delete(self, plan_id):
@@ -557,23 +556,21 @@ class PlanAPI(MethodView):
                     'message': 'Plan not found.',
                 }
                 return jsonify(ret), 404
-            if data.get('name'):
-                plan.name = data.get('name')
-
-            if data.get('clients'):
-                clients = [Client.query.get(each_client)
-                           for each_client in data.get('clients')]
-                plan.clients = filter(None, clients)
-
-            if data.get('days'):
-                days = [Day.query.get(each_day)
-                        for each_day in data.get('days')]
-                plan.days = filter(None, days)
+            renamed = data.get('name') and data['name'] != plan.name
+            if renamed:
+                plan.name = data['name']
+            missing, changed = _set_plan_members(plan_id, data)
+            # the clients of the plan hear of it once, whatever changed
+            if renamed or changed:
+                enqueue_notifications(db.session, 'plan_updated',
+                                      [{'plan_id': plan_id}])
             db.session.commit()
             ret = {
                 'message': 'Plan updated successfully.',
-                'id': plan.id
+                'id': plan_id
             }
+            if missing:
+                ret['missing'] = missing
             return jsonify(ret), 200
         ret = {
             'message': 'Provide data to update.',
@@ -581,15 +578,50 @@ class PlanAPI(MethodView):
         return jsonify(ret), 422
 
 
+class ClientBulkAPI(BulkAPI):
+    decorators = [api_auth_required]
+    model = Client
+    fields = ('email', 'first_name', 'last_name', 'age', 'weight', 'height')
+    required = ('email', 'first_name', 'last_name')
+    unique = 'email'
+
+    def defaults(self):
+        return {'owner_id': current_user_id()}
+
+    def scope(self, query):
+        return query.filter(Client.owner_id == current_user_id())
+
+
+class ExerciseBulkAPI(BulkAPI):
+    decorators = [api_auth_required]
+    model = Exercise
+    fields = ('name', 'activity')
+    required = ('name',)
+    unique = 'name'
+
+    def before_update(self, ids):
+        plan_documents.mark_stale(exercise_ids=ids)
+
+    def before_delete(self, ids):
+        plan_documents.mark_stale(exercise_ids=ids)
+        db.session.execute(exercise_association_table.delete().where(
+            exercise_association_table.c.exercise_id.in_(ids)))
+
+
 def register_api(view, endpoint, url, pk='id', pk_type='int'):
     view_func = view.as_view(endpoint)
-    app.add_url_rule(url, defaults={pk: None},
+    api.add_url_rule(url, defaults={pk: None},
                      view_func=view_func, methods=['GET', ])
-    app.add_url_rule(url, view_func=view_func, methods=['POST', ])
-    app.add_url_rule('%s/<%s:%s>' % (url, pk_type, pk), view_func=view_func,
+    api.add_url_rule(url, view_func=view_func, methods=['POST', ])
+    api.add_url_rule('%s/<%s:%s>' % (url, pk_type, pk), view_func=view_func,
                      methods=['GET', 'PUT', 'DELETE'])
 
 register_api(ClientUserAPI, 'client_user_api', '/clients', pk='client_id')
 register_api(ExerciseAPI, 'exercises_api', '/exercises', pk='exercise_id')
 register_api(DaysAPI, 'days_api', '/days', pk='day_id')
 register_api(PlanAPI, 'plans_api', '/plans', pk='plan_id')
+
+api.add_url_rule('/clients/bulk', view_func=ClientBulkAPI.as_view('client_bulk_api'),
+                 methods=['POST', 'PUT', 'DELETE'])
+api.add_url_rule('/exercises/bulk', view_func=ExerciseBulkAPI.as_view('exercise_bulk_api'),
+                 methods=['POST', 'PUT', 'DELETE'])
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Size and time of each compression codec and level on a /plans payload
+(see benchmarks/bench_json.py), for picking COMPRESSION_LEVEL and
+COMPRESSION_BROTLI_QUALITY.
+
+    python benchmarks/bench_compression.py [plans] [days] [exercises] [repeat]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import bench_json  # noqa: E402
+from bench_json import app, best_of  # noqa: E402
+
+from app import compression, db, json_provider  # noqa: E402
+
+
+def main(plans=200, days=5, exercises=8, repeat=20):
+    with app.app_context():
+        db.create_all()
+        bench_json.add_plans(plans, days, exercises)
+        body = json_provider.dumps(bench_json.payload())
+
+    codecs = [('gzip', 'COMPRESSION_LEVEL', level) for level in (1, 6, 9)]
+    if compression.brotli is not None:
+        codecs += [('br', 'COMPRESSION_BROTLI_QUALITY', quality)
+                   for quality in (1, 4, 5, 9)]
+    print('%d bytes of JSON, best of %d' % (len(body), repeat))
+    print('%-8s %5s %10s %7s %9s' % ('codec', 'level', 'bytes', 'ratio', 'ms'))
+    for encoding, setting, level in codecs:
+        config = dict(app.config, **{setting: level})
+        size = len(compression.compress(body, encoding, config))
+        seconds = best_of(
+            repeat, lambda: compression.compress(body, encoding, config))
+        print('%-8s %5d %10d %6.1fx %9.2f' % (
+            encoding, level, size, len(body) / float(size), seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
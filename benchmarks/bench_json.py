@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""Encodes and decodes a large /plans payload with flask.json and with the
+JSON backends of json_provider.
+
+The payload is the plan list with its days and exercises, plus the
+created_on/updated_on datetimes of every plan.
+
+    python benchmarks/bench_json.py [plans] [days] [exercises] [repeat]
+
+Runs against an in-memory SQLite database unless DATABASE_URL is set.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Request, json as flask_json, \
+    jsonify as flask_jsonify  # noqa: E402
+from sqlalchemy.orm import subqueryload  # noqa: E402
+
+from app import create_app, db, json_provider  # noqa: E402
+from app.models import Plan, Day, Exercise  # noqa: E402
+from app.serializers import Serializer  # noqa: E402
+
+app = create_app()
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def add_plans(plans, days, exercises):
+    pool = [Exercise('exercise-%d' % i, ('strength', 'cardio', 'mobility')[i % 3])
+            for i in range(exercises * 4)]
+    for p in range(plans):
+        db.session.add(Plan('plan-%d' % p))
+    db.session.flush()
+    for p, plan in enumerate(Plan.query.all()):
+        plan.days = [Day('day-%d-%d' % (p, d), [
+            pool[(p + d + e) % len(pool)] for e in range(exercises)])
+            for d in range(days)]
+    db.session.commit()
+
+
+def payload():
+    serializer = Serializer(('id', 'name', 'created_on', 'updated_on'),
+                            days=Day.serializer)
+    plans = Plan.query.options(
+        subqueryload(Plan.days).subqueryload(Day.exercises)).all()
+    return {'plans': serializer.dump_many(plans)}
+
+
+def decode_time(repeat, request_class, body):
+    timings = []
+    for _ in range(repeat):
+        request = request_class.from_values(
+            '/plans', method='POST', data=body, content_type='application/json')
+        start = time.time()
+        request.get_json()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(plans=200, days=5, exercises=8, repeat=20):
+    with app.app_context():
+        db.create_all()
+        add_plans(plans, days, exercises)
+        data = payload()
+
+    modules = [('json', json_provider.json)]
+    try:
+        modules.append(('simplejson',
+                        json_provider._import_backend('simplejson')[0]))
+    except ImportError:
+        pass
+
+    results = []
+    with app.test_request_context('/plans'):
+        # the Flask 0.12 defaults: sorted keys, indented unless XHR
+        app.json_encoder = flask_json.JSONEncoder
+        app.json_decoder = flask_json.JSONDecoder
+        app.config.update(JSONIFY_PRETTYPRINT_REGULAR=True, JSON_SORT_KEYS=True)
+        results.append(('flask.jsonify, pretty, sorted',
+                        best_of(repeat, lambda: flask_jsonify(data)),
+                        len(flask_jsonify(data).get_data())))
+        app.config.update(JSONIFY_PRETTYPRINT_REGULAR=False, JSON_SORT_KEYS=False)
+        results.append(('flask.jsonify, compact',
+                        best_of(repeat, lambda: flask_jsonify(data)),
+                        len(flask_jsonify(data).get_data())))
+        for name, module in modules:
+            app.json_encoder = json_provider._encoder(module)
+            results.append(('json_provider.jsonify, %s' % name,
+                            best_of(repeat, lambda: json_provider.jsonify(data)),
+                            len(json_provider.jsonify(data).get_data())))
+
+        body = json_provider.jsonify(data).get_data()
+        results.append(('flask get_json',
+                        decode_time(repeat, Request, body), len(body)))
+        for name, module in modules:
+            json_provider.decoding = module
+            results.append(('JSONRequest.get_json, %s' % name,
+                            decode_time(repeat, json_provider.JSONRequest,
+                                        body), len(body)))
+
+    print('%d plans of %d days of %d exercises, best of %d' % (
+        plans, days, exercises, repeat))
+    for name, seconds, size in results:
+        print('%-36s %8.2f ms %9d bytes' % (name, seconds * 1000, size))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Login throughput for several hashing costs and hash pool sizes.
+
+Also reports the median latency of a cheap request (/logout) served while
+the logins run, which is what the hash pool protects.
+
+    python benchmarks/bench_login.py [threads] [logins_per_thread]
+
+Uses a temporary SQLite file unless DATABASE_URL is set.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'bench.db'))
+
+from app import create_app, db, hashing  # noqa: E402
+from app.models import User  # noqa: E402
+
+app = create_app()
+
+COSTS = ['pbkdf2:sha256:1000', 'pbkdf2:sha256:50000', 'pbkdf2:sha256:150000']
+POOL_SIZES = [0, 1, 2, 4]
+
+
+def run(threads, logins):
+    body = json.dumps({'username': 'bench', 'password': 'secret'})
+    done = threading.Event()
+    latencies = []
+
+    def bystander():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.time()
+            client.get('/logout')
+            latencies.append(time.time() - start)
+            time.sleep(0.005)
+
+    def worker():
+        client = app.test_client()
+        for _ in range(logins):
+            client.post('/login', data=body, content_type='application/json')
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    other = threading.Thread(target=bystander)
+    start = time.time()
+    other.start()
+    for each in workers:
+        each.start()
+    for each in workers:
+        each.join()
+    elapsed = time.time() - start
+    done.set()
+    other.join()
+    latencies.sort()
+    return threads * logins / elapsed, latencies[len(latencies) // 2]
+
+
+def main(threads=4, logins=20):
+    with app.app_context():
+        db.create_all()
+    print('%d threads x %d logins' % (threads, logins))
+    print('%-24s %5s %12s %16s' % ('method', 'pool', 'logins/s',
+                                   'other p50 (ms)'))
+    for method in COSTS:
+        app.config['PASSWORD_HASH_METHOD'] = method
+        for pool_size in POOL_SIZES:
+            app.config['PASSWORD_HASH_POOL_SIZE'] = pool_size
+            hashing.shutdown()
+            with app.app_context():
+                User.query.filter_by(username='bench').delete()
+                db.session.add(User('bench', 'secret'))
+                db.session.commit()
+            throughput, latency = run(threads, logins)
+            print('%-24s %5d %12.1f %16.2f' % (method, pool_size, throughput,
+                                               latency * 1000))
+    hashing.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
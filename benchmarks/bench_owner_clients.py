@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""GET /clients latency for one trainer while the number of trainers grows.
+
+Every trainer owns the same number of clients, so with the owner indexes
+the latency should stay flat whatever the size of the clients table; the
+second column drops them for comparison.
+
+    python benchmarks/bench_owner_clients.py [clients_per_owner] [repeat]
+
+Uses a temporary SQLite file unless DATABASE_URL is set.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('AUTH_MODE', 'jwt')
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from app import create_app, db, pagination  # noqa: E402
+from app.models import User, Client  # noqa: E402
+
+app = create_app()
+
+OWNERS = [10, 100, 1000, 5000]
+INDEXES = [index for index in Client.__table__.indexes
+           if 'owner_id' in index.columns]
+
+
+def add_owners(start, stop, per_owner):
+    db.session.execute(User.__table__.insert(), [
+        {'username': 'trainer%d' % i, 'password': 'x'}
+        for i in range(start, stop)])
+    owner_ids = dict(db.session.query(User.username, User.id))
+    db.session.execute(Client.__table__.insert(), [
+        {'email': 'client%d.%d@example.com' % (i, k), 'first_name': 'First',
+         'last_name': 'Last', 'owner_id': owner_ids['trainer%d' % i]}
+        for i in range(start, stop) for k in range(per_owner)])
+    db.session.commit()
+
+
+def latency(client, headers, repeat):
+    timings = []
+    for _ in range(repeat):
+        pagination._count_cache.clear()
+        start = time.time()
+        response = client.get('/clients?limit=50', headers=headers)
+        timings.append(time.time() - start)
+        assert response.status_code == 200, response.data
+    return sorted(timings)[len(timings) // 2]
+
+
+def main(per_owner=50, repeat=20):
+    with app.test_request_context('/'):
+        db.create_all()
+        add_owners(0, 1, per_owner)
+        headers = {'Authorization': 'Bearer ' + create_access_token(
+            identity='trainer0')}
+    client = app.test_client()
+    print('%d clients per trainer, median of %d' % (per_owner, repeat))
+    print('%8s %10s %12s %12s' % ('trainers', 'clients', 'indexed', 'no index'))
+    owners = 1
+    engine = db.get_engine(app)
+    for target in OWNERS:
+        with app.app_context():
+            add_owners(owners, target, per_owner)
+        owners = target
+        indexed = latency(client, headers, repeat)
+        for index in INDEXES:
+            index.drop(engine)
+        unindexed = latency(client, headers, repeat)
+        for index in INDEXES:
+            index.create(engine)
+        print('%8d %10d %9.2f ms %9.2f ms' % (
+            owners, owners * per_owner, indexed * 1000, unindexed * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""A credential stuffing burst against /login, with and without the rate
+limits, and the cost of one limit check per store.
+
+The burst is ``attempts`` wrong passwords for random existing usernames from
+``ips`` addresses. It reports the CPU time of the burst and how many
+attempts reached the password hash, hashed at a cost of 1000 iterations to
+keep the run short; real costs widen the gap.
+
+    python benchmarks/bench_rate_limit.py [attempts] [ips] [checks]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import config  # noqa: E402
+from app import auth, create_app, db, rate_limit  # noqa: E402
+from app.cache import FakeRedis  # noqa: E402
+from app.models import User  # noqa: E402
+
+
+class UnlimitedConfig(config.TestingConfig):
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+
+class LimitedConfig(UnlimitedConfig):
+    RATE_LIMIT_BACKEND = 'memory'
+    RATE_LIMIT_PROXIES = 1
+
+
+def burst(app, attempts, ips):
+    client = app.test_client()
+    rnd = random.Random(0)
+    hashed = [0]
+    verify = auth.verify_password
+
+    def counted(*args):
+        hashed[0] += 1
+        return verify(*args)
+
+    auth.verify_password = counted
+    start = time.clock()
+    try:
+        for i in range(attempts):
+            body = {'username': 'user%d' % rnd.randint(0, 19),
+                    'password': 'guess%d' % i}
+            client.post('/login', data=json.dumps(body),
+                        content_type='application/json',
+                        headers={'X-Forwarded-For': '10.0.0.%d' % (i % ips)})
+    finally:
+        auth.verify_password = verify
+    return time.clock() - start, hashed[0]
+
+
+def per_check(store, checks):
+    limiter = rate_limit.Limiter(store, {'auth.login': [('ip', 10 ** 9, 60)]})
+    app = create_app(LimitedConfig)
+    with app.test_request_context('/login', method='POST',
+                                  environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        start = time.time()
+        for _ in range(checks):
+            limiter.check('auth.login', 'auth')
+        return (time.time() - start) / checks
+
+
+def main(attempts=300, ips=4, checks=20000):
+    print('%d attempts from %d addresses' % (attempts, ips))
+    print('%-12s %10s %8s' % ('limits', 'cpu s', 'hashed'))
+    for name, settings in (('off', UnlimitedConfig),
+                           ('on', LimitedConfig)):
+        app = create_app(settings)
+        with app.app_context():
+            db.create_all()
+            User.query.delete()
+            db.session.add_all(User('user%d' % i, 'secret') for i in range(20))
+            db.session.commit()
+        seconds, hashed = burst(app, attempts, ips)
+        print('%-12s %10.2f %8d' % (name, seconds, hashed))
+
+    print('\n%-12s %10s' % ('store', 'us/check'))
+    for name, store in (('memory', rate_limit.MemoryStore()),
+                        ('fake redis', rate_limit.RedisStore(FakeRedis()))):
+        print('%-12s %10.1f' % (name, per_check(store, checks) * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
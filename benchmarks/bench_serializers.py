@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Compares the hand-built client dicts with the compiled serializers.
+
+    python benchmarks/bench_serializers.py [rows] [repeat]
+
+Runs against an in-memory SQLite database unless DATABASE_URL is set.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db  # noqa: E402
+from app.models import Client  # noqa: E402
+
+create_app().app_context().push()
+
+
+def per_field(clients):
+    data = []
+    for each_client in clients:
+        data.append(
+            {
+                'id': each_client.id,
+                'email': each_client.email,
+                'first_name': each_client.first_name,
+                'last_name': each_client.last_name,
+                'age': each_client.age,
+                'weight': each_client.weight,
+                'height': each_client.height,
+                'owner_id': each_client.owner_id,
+                'plan_id': each_client.plan_id
+            }
+        )
+    return data
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.time()
+        fn()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(rows=10000, repeat=5):
+    db.create_all()
+    db.session.bulk_insert_mappings(Client, [
+        {'email': 'client%d@example.com' % i, 'first_name': 'First',
+         'last_name': 'Last', 'age': 30, 'weight': 70, 'height': 170}
+        for i in range(rows)])
+    db.session.commit()
+    serializer = Client.serializer
+    clients = Client.query.all()
+
+    results = [
+        ('dump only, per field', best_of(repeat, lambda: per_field(clients))),
+        ('dump only, serializer',
+         best_of(repeat, lambda: serializer.dump_many(clients))),
+        ('orm query + per field',
+         best_of(repeat, lambda: per_field(Client.query.all()))),
+        ('orm query + serializer',
+         best_of(repeat, lambda: serializer.dump_many(Client.query.all()))),
+        ('column query + dump_rows',
+         best_of(repeat, lambda: serializer.dump_rows(
+             db.session.query(*serializer.columns(Client)).all()))),
+    ]
+    print('%d clients, best of %d' % (rows, repeat))
+    for name, seconds in results:
+        print('%-28s %8.2f ms' % (name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
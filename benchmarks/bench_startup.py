@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""Startup time: imports, the app factory and a cold worker boot.
+
+Every step runs in a fresh interpreter, ``runs`` times, and the median is
+reported. The cold boot (``create_app()`` and the first request) is checked
+against ``target_ms``; the script exits with status 1 above it. Then the
+slowest modules of the boot are listed by their own import time, like
+``python -X importtime`` does on Python 3.7+.
+
+    python benchmarks/bench_startup.py [runs] [target_ms]
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+_TIMED = '''
+import sys, time
+sys.path.insert(0, %r)
+start = time.time()
+%s
+sys.stdout.write('%%f' %% (time.time() - start))
+'''
+
+_BOOT = '''
+from app import create_app, db
+app = create_app()
+with app.app_context():
+    db.create_all()
+app.test_client().get('/health')
+'''
+
+STEPS = [
+    ('import app', 'import app'),
+    ('create_app()', 'from app import create_app; create_app()'),
+    ('cold worker boot', _BOOT),
+]
+
+COMMANDS = [
+    ('manage.py --help', ['manage.py', '--help']),
+    ('manage.py db --help', ['manage.py', 'db', '--help']),
+]
+
+# times every import that loads a module; a module's own time excludes the
+# modules it imports itself
+_PROFILE = '''
+import __builtin__, sys, time
+sys.path.insert(0, %r)
+_import = __builtin__.__import__
+stack, rows = [], []
+
+def profiled(*args, **kwargs):
+    # the bookkeeping is not counted in the importing module
+    start = time.time()
+    known = set(sys.modules)
+    if stack:
+        stack[-1] += time.time() - start
+    stack.append(0.0)
+    start = time.time()
+    try:
+        return _import(*args, **kwargs)
+    finally:
+        seconds = time.time() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += seconds
+        loaded = [name for name in sys.modules
+                  if name not in known and sys.modules[name] is not None]
+        if loaded:
+            # the module asked for, rather than one it imported
+            wanted = args[0].split('.')[-1]
+            names = [name for name in loaded
+                     if name.split('.')[-1] == wanted] or loaded
+            rows.append((seconds - nested, seconds, min(names, key=len)))
+
+__builtin__.__import__ = profiled
+%s
+__builtin__.__import__ = _import
+for own, total, name in sorted(rows, reverse=True)[:%d]:
+    sys.stdout.write('%%s %%f %%f\\n' %% (name, own, total))
+'''
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def timed(code, runs):
+    return median([float(subprocess.check_output(
+        [sys.executable, '-c', _TIMED % (ROOT, code)]))
+        for _ in range(runs)])
+
+
+def wall(argv, runs):
+    times = []
+    for _ in range(runs):
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable] + argv, cwd=ROOT,
+                                  stdout=devnull, stderr=devnull)
+        times.append(time.time() - start)
+    return median(times)
+
+
+def slowest(code, count=15):
+    output = subprocess.check_output(
+        [sys.executable, '-c', _PROFILE % (ROOT, code, count)])
+    return [(name, float(own), float(total)) for name, own, total in
+            (line.split() for line in output.splitlines())]
+
+
+def main(runs=5, target_ms=1500):
+    runs, target_ms = int(runs), float(target_ms)
+    print('%-24s %10s' % ('step', 'median ms'))
+    for name, code in STEPS:
+        print('%-24s %10.1f' % (name, timed(code, runs) * 1000))
+    # the interpreter start counts for the CLI, it is part of every call
+    for name, argv in COMMANDS:
+        print('%-24s %10.1f' % (name, wall(argv, runs) * 1000))
+
+    print('\n%-40s %9s %9s' % ('slowest imports of the boot', 'self ms',
+                               'total ms'))
+    for name, own, total in slowest(_BOOT):
+        print('%-40s %9.1f %9.1f' % (name, own * 1000, total * 1000))
+
+    boot = timed(_BOOT, runs) * 1000
+    print('\ncold worker boot %.1f ms, target %.0f ms' % (boot, target_ms))
+    return 1 if boot > target_ms else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Per-request access token verification with and without the token cache.
+
+access_token_required also checks revocation (REVOCATION_BACKEND) on each
+request, jwt_required does not.
+
+    python benchmarks/bench_token_cache.py [requests]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask_jwt_extended import jwt_required, create_access_token  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app import tokens  # noqa: E402
+from app.cache import TTLCache  # noqa: E402
+
+app = create_app()
+
+
+def per_request(decorator, token, requests):
+    view = decorator(lambda: None)
+    headers = {'Authorization': 'Bearer ' + token}
+    with app.test_request_context('/', headers=headers):
+        start = time.time()
+        for _ in range(requests):
+            view()
+        return (time.time() - start) / requests
+
+
+def main(requests=20000):
+    with app.app_context():
+        db.create_all()
+    tokens.token_cache = TTLCache(1000, 300)
+    with app.test_request_context('/'):
+        token = create_access_token(identity='bench')
+    plain = per_request(jwt_required, token, requests)
+    cached = per_request(tokens.access_token_required, token, requests)
+    print('%d requests with the same token' % requests)
+    print('%-32s %8.1f us' % ('jwt_required', plain * 1e6))
+    print('%-32s %8.1f us' % ('access_token_required (cached)', cached * 1e6))
+    print(tokens.token_cache.stats())
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
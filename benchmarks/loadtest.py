@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Load test of the serving modes.
+
+Starts the app in each mode on a fresh SQLite file (or DATABASE_URL), opens
+``slow`` connections that send half a request and hang, then runs
+``concurrency`` clients against GET /exercises for ``seconds``. Reports
+throughput and latency percentiles per mode.
+
+    python benchmarks/loadtest.py [concurrency] [seconds] [slow] [modes]
+
+modes is a comma separated list of dev, gthread and gevent (default all).
+gunicorn modes use WEB_WORKERS/WEB_THREADS, 2 workers of 4 threads unless set.
+"""
+import cookielib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib2
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('APP_SETTINGS', 'config.ProductionConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'loadtest.db'))
+os.environ.setdefault('WEB_WORKERS', '2')
+os.environ.setdefault('WEB_THREADS', '4')
+# every simulated client comes from the same address
+os.environ.setdefault('RATE_LIMIT_BACKEND', '')
+
+PORT = 8765
+BASE = 'http://127.0.0.1:%d' % PORT
+
+
+def server_command(mode):
+    if mode == 'dev':
+        return [sys.executable, '-c',
+                'from app import create_app; '
+                'create_app().run(port=%d, threaded=True)' % PORT]
+    # gunicorn 19 has no __main__ module
+    return [sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+            '-c', 'gunicorn.conf.py',
+            '--bind', '127.0.0.1:%d' % PORT, 'wsgi:app']
+
+
+def start(mode):
+    env = dict(os.environ, WEB_WORKER_CLASS=mode,
+               PYTHONPATH=os.pathsep.join(sys.path))
+    devnull = open(os.devnull, 'w')
+    process = subprocess.Popen(server_command(mode), cwd=ROOT, env=env,
+                               stdout=devnull, stderr=devnull)
+    for _ in range(100):
+        try:
+            urllib2.urlopen(BASE + '/health', timeout=1)
+            return process
+        except (urllib2.URLError, socket.error):
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('%s server did not start' % mode)
+
+
+def call(opener, method, path, data=None, token=None):
+    request = urllib2.Request(BASE + path, json.dumps(data) if data else None,
+                              {'Content-Type': 'application/json'})
+    request.get_method = lambda: method
+    if token:
+        request.add_header('Authorization', 'Bearer ' + token)
+    return json.loads(opener.open(request, timeout=30).read())
+
+
+def login():
+    """Auth headers of a trainer, and a few exercises to list."""
+    jar = cookielib.CookieJar()
+    opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(jar))
+    try:
+        call(opener, 'POST', '/sign_up', {'username': 'load', 'password': 'test'})
+    except urllib2.HTTPError:
+        pass  # already there
+    token = call(opener, 'POST', '/login',
+                 {'username': 'load', 'password': 'test'})['access_token']
+    for i in range(20):
+        try:
+            call(opener, 'POST', '/exercises',
+                 {'name': 'exercise%d' % i, 'activity': 'load'}, token)
+        except urllib2.HTTPError:
+            pass
+    # the login session, unless AUTH_MODE is jwt
+    cookie = '; '.join('%s=%s' % (c.name, c.value) for c in jar)
+    return {'Authorization': 'Bearer ' + token, 'Cookie': cookie}
+
+
+def hang(count):
+    """Connections that sent part of a request and wait."""
+    sockets = []
+    for _ in range(count):
+        s = socket.create_connection(('127.0.0.1', PORT))
+        s.sendall('GET /health HTTP/1.1\r\nHost: localhost\r\n')
+        sockets.append(s)
+    return sockets
+
+
+def client(headers, deadline, latencies, errors):
+    while time.time() < deadline:
+        start = time.time()
+        try:
+            urllib2.urlopen(urllib2.Request(
+                BASE + '/exercises?limit=20', headers=headers), timeout=30).read()
+            latencies.append(time.time() - start)
+        except (urllib2.URLError, socket.error):
+            errors.append(1)
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode, concurrency, seconds, slow):
+    process = start(mode)
+    try:
+        headers = login()
+        sockets = hang(slow)
+        latencies, errors = [], []
+        deadline = time.time() + seconds
+        threads = [threading.Thread(target=client,
+                                    args=(headers, deadline, latencies, errors))
+                   for _ in range(concurrency)]
+        for each in threads:
+            each.start()
+        for each in threads:
+            each.join()
+        for s in sockets:
+            s.close()
+    finally:
+        process.terminate()
+        process.wait()
+    latencies.sort()
+    print('%-8s %8.1f %9.1f %9.1f %9.1f %7d' % (
+        mode, len(latencies) / float(seconds),
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000,
+        percentile(latencies, 0.99) * 1000, len(errors)))
+
+
+def main(concurrency=20, seconds=10, slow=0, modes='dev,gthread,gevent'):
+    concurrency, seconds, slow = int(concurrency), int(seconds), int(slow)
+    from app import create_app, db
+    with create_app().app_context():
+        db.create_all()
+    print('%d clients for %ds, %d hanging connections' % (
+        concurrency, seconds, slow))
+    print('%-8s %8s %9s %9s %9s %7s' % (
+        'mode', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for mode in modes.split(','):
+        run(mode, concurrency, seconds, slow)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
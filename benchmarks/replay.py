@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""Replays a request trace (see benchmarks/traces.py) and reports per endpoint.
+
+    python benchmarks/replay.py trace.jsonl [options]
+
+Without ``--url`` the trace runs in process against the test client, on a
+temporary SQLite file seeded by benchmarks/seed.py unless DATABASE_URL is
+set. There the report also has the SQL queries and the allocated objects
+(net new objects tracked by the garbage collector, measured at
+``--concurrency 1`` only) per request. With ``--url`` it runs against a live
+server, e.g. one started with gunicorn; queries are reported when the server
+runs with INSTRUMENTATION=1, and it needs RATE_LIMIT_BACKEND='' as all the
+users come from one address.
+
+Users whose first request is not a /sign_up or /login are logged in with
+``--password`` before the clock starts. ``--output`` saves the report as
+JSON, ``--baseline`` compares the run with a saved report and exits with
+status 1 when an endpoint got slower by more than ``--tolerance``, or makes
+more queries.
+"""
+import argparse
+import cookielib
+import gc
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.ProductionConfig')
+# every simulated user comes from the same address
+os.environ.setdefault('RATE_LIMIT_BACKEND', '')
+
+import traces  # noqa: E402
+
+_STATEMENTS = re.compile(r'db;[^,]*desc="(\d+) statements')
+
+
+class TestClientTransport(object):
+    """Requests through the app's test client, counting queries and
+    allocations."""
+
+    def __init__(self, app, count_objects):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        self.app = app
+        self.count_objects = count_objects
+        self._queries = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._count_query)
+
+    def _count_query(self, *args):
+        self._queries.count = getattr(self._queries, 'count', 0) + 1
+
+    def client(self):
+        return self.app.test_client()
+
+    def request(self, client, method, path, body, headers):
+        self._queries.count = 0
+        if self.count_objects:
+            gc.disable()
+            objects = gc.get_count()[0]
+        try:
+            response = client.open(path, method=method, headers=headers,
+                                   data=body, content_type='application/json')
+            data = response.data
+        finally:
+            if self.count_objects:
+                objects = gc.get_count()[0] - objects
+                gc.enable()
+        return (response.status_code, data, self._queries.count,
+                objects if self.count_objects else None)
+
+
+def _statements(server_timing):
+    # the SQL statement count of an instrumented server
+    match = _STATEMENTS.search(server_timing or '')
+    return int(match.group(1)) if match else None
+
+
+class HttpTransport(object):
+    """Requests to a live server, one cookie jar per user."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def client(self):
+        return urllib2.build_opener(
+            urllib2.HTTPCookieProcessor(cookielib.CookieJar()))
+
+    def request(self, client, method, path, body, headers):
+        request = urllib2.Request(self.url + path, body, headers)
+        request.add_header('Content-Type', 'application/json')
+        request.get_method = lambda: method
+        try:
+            response = client.open(request, timeout=60)
+        except urllib2.HTTPError as e:
+            response = e
+        except urllib2.URLError:
+            return 0, '', None, None
+        return (response.getcode(), response.read(),
+                _statements(response.info().getheader('Server-Timing')), None)
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.queries = []
+        self.objects = []
+
+    def add(self, seconds, error, queries, objects):
+        self.latencies.append(seconds)
+        self.errors += error
+        if queries is not None:
+            self.queries.append(queries)
+        if objects is not None:
+            self.objects.append(objects)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1,
+                                 int(len(latencies) * p))] * 1000
+
+        def mean(values):
+            return float(sum(values)) / len(values) if values else None
+
+        return {'count': len(latencies), 'errors': self.errors,
+                'p50': percentile(0.5), 'p95': percentile(0.95),
+                'p99': percentile(0.99), 'queries': mean(self.queries),
+                'objects': mean(self.objects)}
+
+
+class User(object):
+    """Cookies, tokens and variables of one user of the trace."""
+
+    def __init__(self, transport, name, password):
+        self.transport = transport
+        self.client = transport.client()
+        self.variables = {'user': name, 'password': password}
+
+    def send(self, entry):
+        """status, seconds, queries, objects of the request of ``entry``."""
+        headers = {}
+        token = self.variables.get('%s_token' % entry.get('token', 'access'))
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        path = traces.substitute(entry['path'], self.variables)
+        body = entry.get('body')
+        if body is not None:
+            body = json.dumps(traces.substitute(body, self.variables))
+        start = time.time()
+        status, data, queries, objects = self.transport.request(
+            self.client, entry['method'], path, body, headers)
+        seconds = time.time() - start
+        try:
+            data = json.loads(data)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for name in ('access_token', 'refresh_token'):
+                if name in data:
+                    self.variables[name] = data[name]
+            if entry.get('save') and 'id' in data:
+                self.variables[entry['save']] = data['id']
+        return status, seconds, queries, objects
+
+    def login(self):
+        self.send({'method': 'POST', 'path': '/login', 'token': 'none',
+                   'body': {'username': '{user}', 'password': '{password}'}})
+
+
+def _is_error(entry, status):
+    if 'expect' in entry:
+        return status != entry['expect']
+    return not 200 <= status < 400
+
+
+def replay(trace, transport, concurrency=1, password='secret'):
+    """Replays ``trace``; endpoint -> Stats, and the elapsed seconds."""
+    users = {}
+    lanes = [[] for _ in range(concurrency)]
+    for entry in trace:
+        name = entry.get('user', 'anonymous')
+        if name not in users:
+            users[name] = User(transport, name, password)
+            if entry['path'].split('?')[0] not in ('/sign_up', '/login'):
+                users[name].login()
+            # a user stays on one thread, its requests in order
+            users[name].lane = len(users) % concurrency
+        lanes[users[name].lane].append((users[name], entry))
+    stats = dict((traces.endpoint(entry), Stats()) for entry in trace)
+    lock = threading.Lock()
+
+    def run(lane):
+        for user, entry in lane:
+            status, seconds, queries, objects = user.send(entry)
+            with lock:
+                stats[traces.endpoint(entry)].add(
+                    seconds, _is_error(entry, status), queries, objects)
+
+    threads = [threading.Thread(target=run, args=(lane,)) for lane in lanes]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.time() - start
+
+
+def _format(value, spec):
+    return '-' if value is None else spec % value
+
+
+def report(stats, elapsed, baseline=None, tolerance=0.2):
+    """Prints the report, returns it as a dict and the regressions."""
+    results = dict((name, each.summary()) for name, each in stats.items())
+    regressions = []
+    print('%-26s %6s %6s %8s %8s %8s %8s %8s%s' % (
+        'endpoint', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms',
+        'queries', 'objects', '  vs baseline' if baseline else ''))
+    for name in sorted(results):
+        result = results[name]
+        line = '%-26s %6d %6d %8.2f %8.2f %8.2f %8s %8s' % (
+            name, result['count'], result['errors'], result['p50'],
+            result['p95'], result['p99'], _format(result['queries'], '%.1f'),
+            _format(result['objects'], '%.0f'))
+        before = (baseline or {}).get('endpoints', {}).get(name)
+        if before:
+            change = result['p50'] / before['p50'] - 1 if before['p50'] else 0
+            line += '  %+6.0f%%' % (change * 100)
+            more_queries = result['queries'] is not None and \
+                before['queries'] is not None and \
+                result['queries'] > before['queries']
+            if change > tolerance or more_queries:
+                regressions.append(name)
+                line += ' REGRESSION'
+        print(line)
+    count = sum(result['count'] for result in results.values())
+    errors = sum(result['errors'] for result in results.values())
+    print('%d requests in %.2fs, %.1f req/s, %d errors' % (
+        count, elapsed, count / elapsed, errors))
+    return {'endpoints': results, 'requests': count, 'errors': errors,
+            'seconds': elapsed, 'throughput': count / elapsed}, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('trace')
+    parser.add_argument('--url', help='live server, e.g. http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', '-c', type=int, default=1)
+    parser.add_argument('--trainers', type=int, default=100,
+                        help='trainers to seed in process, 0 to skip')
+    parser.add_argument('--clients', type=int, default=50,
+                        help='clients per seeded trainer')
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--output', help='save the report as JSON')
+    parser.add_argument('--baseline', help='report to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='p50 increase counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.url:
+        transport = HttpTransport(args.url)
+    else:
+        os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+            tempfile.mkdtemp(), 'replay.db'))
+        import seed
+        app = seed.create_app()
+        if args.trainers:
+            with app.app_context():
+                seed.seed(args.trainers, args.clients)
+        transport = TestClientTransport(app, args.concurrency == 1)
+    stats, elapsed = replay(traces.read(args.trace), transport,
+                            args.concurrency, args.password)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results, regressions = report(stats, elapsed, baseline, args.tolerance)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
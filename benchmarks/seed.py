@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Synthetic dataset for the benchmarks.
+
+Seeds ``trainers`` users (``trainer0``, ``trainer1``... all with the password
+``secret``), each with ``clients`` clients, two plans per trainer of five
+days of six exercises, and assigns most clients to a plan. Names and emails
+are spread enough for the search filters to be selective.
+
+    python benchmarks/seed.py [trainers] [clients]
+
+Seeds DATABASE_URL, creating the tables if needed; other scripts import
+``seed()`` and call it in an app context.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('APP_SETTINGS', 'config.ProductionConfig')
+
+from app import create_app, db, plan_documents  # noqa: E402
+from app.models import User, Client, Plan, Day, Exercise, \
+    day_association_table, exercise_association_table  # noqa: E402
+from app.hashing import hash_password  # noqa: E402
+
+PASSWORD = 'secret'
+FIRST_NAMES = ['Ann', 'Bob', 'Carla', 'Dan', 'Eva', 'Frank', 'Gina', 'Hugo',
+               'Ines', 'Jon', 'Kate', 'Liam', 'Maya', 'Nils', 'Olga', 'Paul']
+LAST_NAMES = ['Smith', 'Jones', 'Brown', 'Garcia', 'Miller', 'Davis',
+              'Lopez', 'Wilson', 'Moore', 'Taylor', 'Martin', 'Lee']
+ACTIVITIES = ['strength', 'cardio', 'mobility', 'endurance', 'balance']
+PLANS_PER_TRAINER = 2
+DAYS_PER_PLAN = 5
+EXERCISES_PER_DAY = 6
+BATCH = 5000
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(table.insert(), rows[start:start + BATCH])
+
+
+def seed(trainers=100, clients=50, seed_value=0):
+    """Seeds the dataset and returns the usernames of the trainers."""
+    rnd = random.Random(seed_value)
+    db.create_all()
+    # one hash for everyone, hashing thousands of passwords takes minutes
+    password = hash_password(PASSWORD)
+    usernames = ['trainer%d' % i for i in range(trainers)]
+    _insert(User.__table__, [{'username': name, 'password': password}
+                             for name in usernames])
+    plans = trainers * PLANS_PER_TRAINER
+    days = plans * DAYS_PER_PLAN
+    exercises = max(300, days)
+    _insert(Exercise.__table__, [
+        {'name': 'exercise%d' % i, 'activity': rnd.choice(ACTIVITIES)}
+        for i in range(exercises)])
+    _insert(Day.__table__, [{'name': 'day%d' % i} for i in range(days)])
+    _insert(Plan.__table__, [{'name': 'plan%d' % i} for i in range(plans)])
+
+    ids = dict((model, [i for (i,) in db.session.query(model.id)
+                        .order_by(model.id)])
+               for model in (User, Plan, Day, Exercise))
+    _insert(exercise_association_table, [
+        {'day_id': day_id, 'exercise_id': exercise_id}
+        for day_id in ids[Day]
+        for exercise_id in rnd.sample(ids[Exercise], EXERCISES_PER_DAY)])
+    _insert(day_association_table, [
+        {'plan_id': plan_id, 'day_id': ids[Day][n * DAYS_PER_PLAN + k]}
+        for n, plan_id in enumerate(ids[Plan]) for k in range(DAYS_PER_PLAN)])
+    rows = []
+    for n, owner_id in enumerate(ids[User]):
+        own_plans = ids[Plan][n * PLANS_PER_TRAINER:(n + 1) * PLANS_PER_TRAINER]
+        for k in range(clients):
+            first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+            rows.append({
+                'email': '%s.%s.%d.%d@example.com' % (
+                    first.lower(), last.lower(), n, k),
+                'first_name': first,
+                'last_name': last,
+                'age': rnd.randint(16, 80),
+                'weight': rnd.randint(45, 130),
+                'height': rnd.randint(150, 205),
+                'owner_id': owner_id,
+                'plan_id': rnd.choice(own_plans) if rnd.random() < 0.7 else None,
+            })
+    _insert(Client.__table__, rows)
+    db.session.commit()
+    if plan_documents.enabled():
+        plan_documents.rebuild_all()
+    return usernames
+
+
+def main(trainers=100, clients=50):
+    with create_app().app_context():
+        seed(trainers, clients)
+    print('seeded %d trainers, %d clients, %d plans' % (
+        trainers, trainers * clients, trainers * PLANS_PER_TRAINER))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
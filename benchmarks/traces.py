@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""Request traces for benchmarks/replay.py.
+
+A trace is a JSONL file of requests, in the order they were made:
+
+    {"user": "trainer3", "method": "POST", "path": "/exercises",
+     "body": {"name": "squat-{user}", "activity": "strength"},
+     "save": "exercise"}
+    {"user": "trainer3", "method": "GET", "path": "/exercises/{exercise}"}
+
+- ``user`` -- every user has its own cookies, tokens and variables; the
+  requests of one user are replayed in order, users run concurrently
+- ``{name}`` in the path or body is replaced by a variable of the user: the
+  ``id`` of a response whose request has ``"save": "name"``, the last
+  ``access_token``/``refresh_token`` returned, ``user`` and ``password``.
+  A body value that is only ``"{name}"`` keeps the variable's type
+- ``token`` -- the token sent as ``Authorization: Bearer``, ``access``
+  (default), ``refresh`` or ``none``
+- ``endpoint`` -- the label of the request in the report, by default the
+  method and the path with ids replaced by ``<id>``
+- ``expect`` -- the expected status, otherwise 4xx/5xx count as errors
+
+    python benchmarks/traces.py generate trace.jsonl [sessions] [trainers] [new]
+    python benchmarks/traces.py record trace.jsonl [port]
+
+``generate`` writes synthetic sessions of the trainers of benchmarks/seed.py
+and of ``new`` users signing up: login, listing and searching every
+collection, creating, reading, updating and deleting an exercise, a day, a
+client and a plan, a token refresh and a logout. ``record`` serves the app
+on ``port`` and appends the requests it serves to the trace, passwords and
+refresh tokens are replaced by their variables.
+"""
+import base64
+import json
+import os
+import random
+import re
+import sys
+import threading
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+_VARIABLE = re.compile(r'\{(\w+)\}')
+_ID = re.compile(r'/(\d+|\{\w+\})(?=/|$)')
+
+
+def read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write(path, entries):
+    with open(path, 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def endpoint(entry):
+    """Report label of a trace entry, e.g. ``GET /clients/<id>``."""
+    if entry.get('endpoint'):
+        return entry['endpoint']
+    path = entry['path'].split('?')[0]
+    return '%s %s' % (entry['method'], _ID.sub('/<id>', path))
+
+
+def substitute(value, variables):
+    """``value`` with the ``{name}`` variables replaced, recursively."""
+    if isinstance(value, dict):
+        return dict((k, substitute(v, variables)) for k, v in value.items())
+    if isinstance(value, list):
+        return [substitute(v, variables) for v in value]
+    if not isinstance(value, basestring):
+        return value
+    whole = _VARIABLE.match(value)
+    if whole and whole.end() == len(value) and whole.group(1) in variables:
+        return variables[whole.group(1)]
+    return _VARIABLE.sub(
+        lambda m: unicode(variables.get(m.group(1), m.group(0))), value)
+
+
+def session(user, tag, new_user=False, reads=1):
+    """Requests of one session of ``user``, ``tag`` keeps names unique."""
+    credentials = {'username': '{user}', 'password': '{password}'}
+    entries = []
+    if new_user:
+        entries.append({'method': 'POST', 'path': '/sign_up',
+                        'body': credentials, 'token': 'none'})
+    entries.append({'method': 'POST', 'path': '/login',
+                    'body': credentials, 'token': 'none'})
+    for _ in range(reads):
+        entries += [
+            {'method': 'GET', 'path': '/clients?limit=50'},
+            {'method': 'GET', 'path': '/clients?q=ann&sort=last_name&limit=20',
+             'endpoint': 'GET /clients?q'},
+            {'method': 'GET', 'path': '/exercises?limit=100'},
+            {'method': 'GET', 'path': '/exercises?q=cardio&limit=20',
+             'endpoint': 'GET /exercises?q'},
+            {'method': 'GET', 'path': '/days?limit=20'},
+            {'method': 'GET', 'path': '/plans?limit=20'},
+        ]
+    entries += [
+        {'method': 'POST', 'path': '/exercises', 'save': 'exercise',
+         'body': {'name': 'exercise-%s' % tag, 'activity': 'strength'}},
+        {'method': 'GET', 'path': '/exercises/{exercise}'},
+        {'method': 'PUT', 'path': '/exercises/{exercise}',
+         'body': {'activity': 'cardio'}},
+        {'method': 'POST', 'path': '/days', 'save': 'day',
+         'body': {'name': 'day-%s' % tag, 'exercises': ['{exercise}']}},
+        {'method': 'GET', 'path': '/days/{day}'},
+        {'method': 'PUT', 'path': '/days/{day}',
+         'body': {'name': 'day-%s-2' % tag}},
+        {'method': 'POST', 'path': '/clients', 'save': 'client',
+         'body': {'email': 'client-%s@example.com' % tag, 'first_name': 'Ann',
+                  'last_name': 'Smith', 'age': 30}},
+        {'method': 'GET', 'path': '/clients/{client}'},
+        {'method': 'PUT', 'path': '/clients/{client}', 'body': {'weight': 70}},
+        {'method': 'POST', 'path': '/plans', 'save': 'plan',
+         'body': {'name': 'plan-%s' % tag, 'days': ['{day}'],
+                  'clients': ['{client}']}},
+        {'method': 'GET', 'path': '/plans/{plan}'},
+        {'method': 'PUT', 'path': '/plans/{plan}',
+         'body': {'name': 'plan-%s-2' % tag}},
+        {'method': 'GET', 'path': '/clients?plan_id={plan}',
+         'endpoint': 'GET /clients?plan_id'},
+        {'method': 'POST', 'path': '/refresh', 'token': 'refresh'},
+        {'method': 'DELETE', 'path': '/plans/{plan}'},
+        {'method': 'DELETE', 'path': '/days/{day}'},
+        {'method': 'DELETE', 'path': '/exercises/{exercise}'},
+        {'method': 'DELETE', 'path': '/clients/{client}'},
+        {'method': 'POST', 'path': '/logout',
+         'body': {'refresh_token': '{refresh_token}'}},
+    ]
+    for entry in entries:
+        entry['user'] = user
+    return entries
+
+
+def generate(sessions=100, trainers=20, new_users=5, seed_value=0):
+    """Sessions spread over the seeded trainers and ``new_users`` new users,
+    interleaved at random while each user's requests stay in order."""
+    rnd = random.Random(seed_value)
+    users = ['trainer%d' % i for i in range(trainers)] + \
+        ['new%d' % i for i in range(new_users)]
+    per_user = dict((user, []) for user in users)
+    for n in range(sessions):
+        user = users[n % len(users)]
+        per_user[user] += session(user, 's%d' % n,
+                                  new_user=user.startswith('new') and
+                                  not per_user[user],
+                                  reads=rnd.randint(1, 3))
+    queues = [entries for entries in per_user.values() if entries]
+    trace = []
+    while queues:
+        queue = rnd.choice(queues)
+        trace.append(queue.pop(0))
+        if not queue:
+            queues.remove(queue)
+    return trace
+
+
+def _claims(environ):
+    # the payload of the bearer token, not verified
+    parts = environ.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2 or parts[1].count('.') != 2:
+        return {}
+    payload = str(parts[1].split('.')[1])
+    try:
+        return json.loads(base64.urlsafe_b64decode(
+            payload + '=' * (-len(payload) % 4)))
+    except (TypeError, ValueError):
+        return {}
+
+
+class TraceRecorder(object):
+    """WSGI middleware appending the requests it serves to a trace file."""
+
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else ''
+        environ['wsgi.input'] = StringIO(body)
+        self._record(environ, body)
+        return self.app(environ, start_response)
+
+    def _record(self, environ, body):
+        claims = _claims(environ)
+        entry = {'method': environ['REQUEST_METHOD'],
+                 'path': environ.get('PATH_INFO', '/')}
+        if environ.get('QUERY_STRING'):
+            entry['path'] += '?' + environ['QUERY_STRING']
+        if claims.get('type') == 'refresh':
+            entry['token'] = 'refresh'
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for name in ('password', 'refresh_token'):
+                if name in data:
+                    data[name] = '{%s}' % name
+            entry['body'] = data
+        entry['user'] = claims.get('identity') or \
+            (data or {}).get('username') or 'anonymous'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def main(command, path, *args):
+    if command == 'generate':
+        trace = generate(*[int(arg) for arg in args])
+        write(path, trace)
+        print('%d requests' % len(trace))
+    elif command == 'record':
+        from werkzeug.serving import run_simple
+        from app import create_app
+        run_simple('127.0.0.1', int(args[0]) if args else 5000,
+                   TraceRecorder(create_app(), path), threaded=True)
+    else:
+        sys.exit(__doc__)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -10,12 +10,114 @@ class Config(object):
     CSRF_ENABLED = True
     SECRET_KEY = '@#$23456super-secret-key3456&*'
     SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
+    # GET requests read from the replica when set
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+    # connection pool, ignored for SQLite
+    SQLALCHEMY_POOL_SIZE = 10
+    SQLALCHEMY_MAX_OVERFLOW = 20
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    # below the server's idle timeout, in seconds
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    # test connections on checkout, survives failovers for a SELECT 1 each
+    SQLALCHEMY_POOL_PRE_PING = True
+    # processes serving the app, set by gunicorn.conf.py
+    WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 1))
     JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(seconds=300)
     JWT_REFRESH_TOKEN_EXPIRES = datetime.timedelta(seconds=600)
+    # 'session' needs the login session cookie and the JWT on every API call,
+    # 'jwt' trusts the user_id claim of the access token alone
+    AUTH_MODE = os.environ.get('AUTH_MODE', 'session')
+    # verified access tokens kept to skip the signature check, 0 disables
+    JWT_VERIFY_CACHE_SIZE = 0
+    JWT_VERIFY_CACHE_TTL = 300
+    # 'memory', 'sql', 'redis' or None to disable revocation
+    REVOCATION_BACKEND = 'sql'
+    REVOCATION_REDIS_URL = os.environ.get('REVOCATION_REDIS_URL')
+    # other processes' revocations can take this long to apply here
+    REVOCATION_SYNC_INTERVAL = 5
+    REVOCATION_BLOOM_CAPACITY = 100000
+    REVOCATION_BLOOM_ERROR_RATE = 0.001
+    # cached GET responses of exercises/days/plans, '' disables the cache.
+    # 'memory' keeps the table versions per process, so it is refused when
+    # WEB_WORKERS processes serve the app; they share 'redis'
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', '')
+    RESPONSE_CACHE_REDIS_URL = os.environ.get('RESPONSE_CACHE_REDIS_URL')
+    RESPONSE_CACHE_SIZE = 1000
+    RESPONSE_CACHE_TTL = 300
+    # keep a precomputed document per plan for single plan reads; writes
+    # pay for the rebuilds, run manage.py plan_documents when enabling
+    PLAN_DOCUMENTS = False
+    # notifications, 'file' appends to MAIL_OUTBOX_FILE, 'smtp' sends them
+    MAIL_TRANSPORT = 'file'
+    MAIL_OUTBOX_FILE = os.path.join(basedir, 'mail_outbox.log')
+    MAIL_SERVER = 'localhost'
+    MAIL_PORT = 1025
+    MAIL_SENDER = 'noreply@localhost'
+    OUTBOX_WORKERS = 2
+    OUTBOX_BATCH_SIZE = 100
+    OUTBOX_POLL_INTERVAL = 2
+    # a claimed batch comes due again when its worker died, in seconds
+    OUTBOX_CLAIM_TIMEOUT = 300
+    OUTBOX_MAX_ATTEMPTS = 8
+    OUTBOX_RETRY_BASE = 30
+    OUTBOX_RETRY_MAX = 3600
+    # collection endpoints
+    API_PAGE_SIZE = 100
+    API_MAX_PAGE_SIZE = 1000
+    API_COUNT_CACHE_TTL = 30
+    API_COUNT_CACHE_SIZE = 10000
+    API_STREAM_BATCH_SIZE = 1000
+    API_BULK_CHUNK_SIZE = 500
+    API_BULK_MAX_ROWS = 10000
+    # werkzeug 'pbkdf2:<hash>:<iterations>', stored hashes made with other
+    # settings are rehashed on the next successful login
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:50000'
+    PASSWORD_SALT_LENGTH = 8
+    # 0 hashes in the request thread
+    PASSWORD_HASH_POOL_SIZE = 2
+    PASSWORD_HASH_MAX_PENDING = 32
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 60
+    # Server-Timing headers, /metrics and slow request profiles
+    INSTRUMENTATION = os.environ.get('INSTRUMENTATION') == '1'
+    METRICS_PATH = '/metrics'
+    # a statement run this many times in one request is logged as an N+1
+    INSTRUMENTATION_REPEAT_THRESHOLD = 5
+    # cProfile dumps of the sampled requests slower than PROFILE_SLOW_MS
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    PROFILE_SAMPLE_RATE = 0.05
+    PROFILE_SLOW_MS = 500
+    # 'auto' uses simplejson when its C speedups are installed, or 'json'
+    JSON_BACKEND = 'auto'
+    # the C encoders only run for unsorted, unindented output
+    JSON_SORT_KEYS = False
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    # response compression, in order of preference; 'br' needs brotli
+    COMPRESSION_ENCODINGS = ('br', 'gzip')
+    COMPRESSION_MIMETYPES = ('application/json', 'application/x-ndjson')
+    # smaller bodies fit a packet or two anyway
+    COMPRESSION_MIN_SIZE = 1024
+    # zlib 1-9 for gzip, brotli 0-11; higher costs more CPU per byte
+    COMPRESSION_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4
+    # 'memory', 'redis' or '' to disable rate limiting
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL')
+    # reverse proxies adding X-Forwarded-For in front of the app
+    RATE_LIMIT_PROXIES = int(os.environ.get('RATE_LIMIT_PROXIES', 0))
+    # endpoint or blueprint -> (key, requests, seconds), 'ip' or 'username'
+    RATE_LIMITS = {
+        'auth.login': [('ip', 30, 60), ('username', 10, 300)],
+        'auth.sign_up': [('ip', 10, 3600)],
+        'auth.refresh': [('ip', 60, 60)],
+        'api': [('ip', 1200, 60)],
+    }
 
 
 class ProductionConfig(Config):
     DEBUG = False
+    SQLALCHEMY_POOL_SIZE = 20
+    SQLALCHEMY_MAX_OVERFLOW = 40
 
 
 class StagingConfig(Config):
@@ -26,7 +128,20 @@ class StagingConfig(Config):
 class DevelopmentConfig(Config):
     DEVELOPMENT = True
     DEBUG = True
+    SQLALCHEMY_POOL_SIZE = 5
+    SQLALCHEMY_MAX_OVERFLOW = 5
+    SQLALCHEMY_POOL_PRE_PING = False
+    RESPONSE_CACHE_BACKEND = 'memory'
+    JSONIFY_PRETTYPRINT_REGULAR = True
+    # local clients, compressing is not worth the CPU
+    COMPRESSION_MIN_SIZE = 64 * 1024
+    COMPRESSION_LEVEL = 1
+    COMPRESSION_BROTLI_QUALITY = 1
 
 
 class TestingConfig(Config):
-    TESTING = True
\ No newline at end of file
+    TESTING = True
+    RATE_LIMIT_BACKEND = None
+    PASSWORD_HASH_POOL_SIZE = 0
+    SQLALCHEMY_POOL_PRE_PING = False
+    RESPONSE_CACHE_BACKEND = 'memory'
\ No newline at end of file
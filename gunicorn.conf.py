@@ -0,0 +1,35 @@
+"""gunicorn.conf.py -- settings of ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+WEB_WORKER_CLASS picks the serving mode:
+
+- 'gthread' (default): WEB_WORKERS processes of WEB_THREADS threads, one
+  request per thread.
+- 'gevent': async mode, every worker runs up to WEB_WORKER_CONNECTIONS
+  requests on an event loop and psycopg2 waits cooperatively (psycogreen),
+  so slow clients and queries only hold a greenlet. They still share the
+  SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW connections of the worker.
+  Needs ``pip install gevent psycogreen``.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# the app refuses the per process caches when there are several workers
+os.environ['WEB_WORKERS'] = str(workers)
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# recycles the workers now and then, bounds slow leaks
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = os.environ.get('WEB_ACCESS_LOG')
+
+
+def worker_exit(server, worker):
+    from app import hashing
+    hashing.shutdown()
@@ -1,17 +1,51 @@
 #!/usr/bin/env python
 
-import os
-from flask.ext.script import Manager
-from flask_migrate import Migrate, MigrateCommand
+import sys
 
-from app import app, db
+from flask import current_app
+from flask_script import Command, Manager
 
-app.config.from_object(os.environ['APP_SETTINGS'])
+from app import create_app, db
 
-migrate = Migrate(app, db)
-manager = Manager(app)
+# Flask-Migrate pulls in alembic, only the db commands load it
+MIGRATIONS = 'db' in sys.argv[1:]
 
-manager.add_command('db', MigrateCommand)
+
+def _create_app(config=None):
+    app = create_app(config)
+    if MIGRATIONS:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    return app
+
+
+def _migrations():
+    """Database migrations, see ./manage.py db --help."""
+
+
+manager = Manager(_create_app)
+manager.add_option('-c', '--config', dest='config', required=False,
+                   help='config object, APP_SETTINGS by default')
+
+if MIGRATIONS:
+    from flask_migrate import MigrateCommand
+    manager.add_command('db', MigrateCommand)
+else:
+    manager.add_command('db', Command(_migrations))
+
+
+@manager.option('-w', '--workers', dest='workers', type=int, default=None)
+def outbox(workers):
+    """Delivers the queued notifications until interrupted."""
+    from app.outbox import run_workers
+    run_workers(workers or current_app.config['OUTBOX_WORKERS'])
+
+
+@manager.command
+def plan_documents():
+    """Rebuilds the document of every plan."""
+    from app.plan_documents import rebuild_all
+    print 'Rebuilt {} plan documents.'.format(rebuild_all())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,38 @@
+"""trigram search indexes
+
+Revision ID: d7e25b8c4a19
+Revises: a41f7c2d9b60
+Create Date: 2026-10-18 16:02:44.517730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e25b8c4a19'
+down_revision = 'a41f7c2d9b60'
+branch_labels = None
+depends_on = None
+
+SEARCHED = [
+    ('clients', 'email'),
+    ('clients', 'first_name'),
+    ('clients', 'last_name'),
+    ('exercises', 'name'),
+    ('exercises', 'activity'),
+]
+
+
+def upgrade():
+    # the trigram indexes serve LIKE/ILIKE with leading wildcards too
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in SEARCHED:
+        op.create_index('ix_{}_{}_trgm'.format(table, column), table, [column],
+                        unique=False, postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table, column in SEARCHED:
+        op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
@@ -0,0 +1,10 @@
+"""Tests, run from the repository root with
+
+    python -m unittest discover -s tests -t .
+
+They use an in-memory SQLite database unless DATABASE_URL is set.
+"""
+import os
+
+os.environ.setdefault('APP_SETTINGS', 'config.TestingConfig')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
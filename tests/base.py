@@ -0,0 +1,72 @@
+"""Test case of an app on a fresh database, with a logged in trainer."""
+import json
+import unittest
+
+from sqlalchemy import event
+
+import config
+from app import create_app, db
+from app.models import User
+
+
+class TestConfig(config.TestingConfig):
+    # cheap hashes, and nothing kept between requests but the session
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    REVOCATION_BACKEND = 'memory'
+    RESPONSE_CACHE_BACKEND = ''
+
+
+class AppTestCase(unittest.TestCase):
+    config = TestConfig
+
+    def setUp(self):
+        self.app = create_app(self.config)
+        self.client = self.app.test_client()
+        self.token = None
+        self.refresh_token = None
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def request(self, method, url, data=None):
+        headers = {}
+        if self.token:
+            headers['Authorization'] = 'Bearer ' + self.token
+        response = self.client.open(
+            url, method=method, headers=headers,
+            data=None if data is None else json.dumps(data),
+            content_type='application/json')
+        return response.status_code, json.loads(response.data or 'null')
+
+    def login(self, username='trainer', password='secret'):
+        """Signs up and logs in ``username``, returns their id. The session
+        cookie is only set when AUTH_MODE is 'session'."""
+        self.request('POST', '/sign_up',
+                     {'username': username, 'password': password})
+        status, body = self.request('POST', '/login',
+                                    {'username': username, 'password': password})
+        self.assertEqual(status, 200)
+        self.token = body['access_token']
+        self.refresh_token = body['refresh_token']
+        with self.app.app_context():
+            return User.query.filter_by(username=username).one().id
+
+    def count_statements(self, method, url, data=None):
+        """The response of the request and the SQL statements it ran."""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.request(method, url, data)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        return response, statements
@@ -0,0 +1,110 @@
+"""Logins, the user cache, and access with the bearer token alone when
+AUTH_MODE is 'jwt'."""
+from sqlalchemy import event
+
+from app import db
+from app.hashing import hash_password
+from app.models import User, find_user
+
+from tests.base import AppTestCase, TestConfig
+
+
+class UserCacheTest(AppTestCase):
+
+    def setUp(self):
+        super(UserCacheTest, self).setUp()
+        self.user_id = self.login()
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        super(UserCacheTest, self).tearDown()
+
+    def queries(self, fn, *args, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            return fn(*args, **kwargs), len(statements)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+    def test_lookups_are_cached(self):
+        user, queries = self.queries(find_user, username='trainer')
+        self.assertEqual((user.id, queries), (self.user_id, 0))
+        self.assertEqual(self.queries(find_user, user_id=self.user_id),
+                         (user, 0))
+        self.assertFalse(hasattr(user, 'password'))
+
+    def test_changes_invalidate_the_cache(self):
+        User.query.get(self.user_id).username = 'coach'
+        db.session.commit()
+        self.assertIsNone(find_user(username='trainer'))
+        self.assertEqual(find_user(user_id=self.user_id).username, 'coach')
+        db.session.delete(User.query.get(self.user_id))
+        db.session.commit()
+        self.assertIsNone(find_user(user_id=self.user_id))
+        self.assertIsNone(find_user(username='coach'))
+
+    def test_password_changes_apply_at_once(self):
+        # as another process would, without the listeners of this one
+        db.session.execute(User.__table__.update().values(
+            password=hash_password('changed')))
+        db.session.commit()
+        self.assertIsNotNone(find_user(username='trainer'))
+        self.context.pop()
+        try:
+            status, _ = self.request('POST', '/login', {
+                'username': 'trainer', 'password': 'secret'})
+            self.assertEqual(status, 401)
+            status, _ = self.request('POST', '/login', {
+                'username': 'trainer', 'password': 'changed'})
+            self.assertEqual(status, 200)
+        finally:
+            self.context.push()
+
+
+class JWTConfig(TestConfig):
+    AUTH_MODE = 'jwt'
+
+
+class JWTModeTest(AppTestCase):
+    config = JWTConfig
+
+    def setUp(self):
+        super(JWTModeTest, self).setUp()
+        self.user_id = self.login()
+
+    def test_bearer_token_alone(self):
+        with self.client.session_transaction() as session:
+            self.assertNotIn('user_id', session)
+        status, body = self.request('POST', '/clients', {
+            'email': 'a@example.com', 'first_name': 'A', 'last_name': 'A'})
+        self.assertEqual(status, 200)
+        status, body = self.request('GET', '/clients')
+        self.assertEqual([c['email'] for c in body['data']], ['a@example.com'])
+        self.token = None
+        self.assertEqual(self.request('GET', '/clients')[0], 401)
+
+    def test_owner_is_the_token_user(self):
+        self.request('POST', '/clients', {
+            'email': 'a@example.com', 'first_name': 'A', 'last_name': 'A'})
+        self.assertNotEqual(self.login('bob'), self.user_id)
+        status, body = self.request('GET', '/clients')
+        self.assertEqual(body['data'], [])
+
+    def test_refresh_token_is_no_access_token(self):
+        self.token = self.refresh_token
+        status, body = self.request('GET', '/clients')
+        self.assertEqual(status, 422)
+
+    def test_access_after_logout(self):
+        self.assertEqual(self.request('POST', '/logout')[0], 200)
+        self.assertEqual(self.request('GET', '/clients'),
+                         (401, {'msg': 'Token has been revoked'}))
@@ -0,0 +1,58 @@
+"""Rows and ids of the bulk endpoints are checked before anything is
+written."""
+from tests.base import AppTestCase
+
+
+class BulkValidationTest(AppTestCase):
+
+    def setUp(self):
+        super(BulkValidationTest, self).setUp()
+        self.login()
+        self.request('POST', '/clients/bulk', [
+            {'email': 'c%d@example.com' % i, 'first_name': 'C',
+             'last_name': 'L'} for i in range(2)])
+
+    def names(self):
+        status, body = self.request('GET', '/clients')
+        return [item['first_name'] for item in body['data']]
+
+    def assertInvalid(self, method, rows, indexes):
+        status, body = self.request(method, '/clients/bulk', rows)
+        self.assertEqual(status, 422)
+        self.assertEqual(sorted(set(e['index'] for e in body['errors'])),
+                         indexes)
+        self.assertEqual(self.names(), ['C', 'C'])
+
+    def test_booleans_are_not_ids(self):
+        self.assertInvalid('DELETE', [1, True], [1])
+        self.assertInvalid('PUT', [{'id': True, 'first_name': 'D'}], [0])
+
+    def test_ids_out_of_range(self):
+        self.assertInvalid('DELETE', [1, 2 ** 64], [1])
+        self.assertInvalid('PUT', [{'id': 1, 'first_name': 'D'},
+                                   {'id': -2 ** 63 - 1, 'first_name': 'D'}],
+                           [1])
+
+    def test_field_types(self):
+        rows = [{'email': 'd@example.com', 'first_name': 'D', 'last_name': 'L'},
+                {'email': {'a': 1}, 'first_name': 'D', 'last_name': 'L'},
+                {'email': 'e@example.com', 'first_name': ['D'], 'last_name': 'L'},
+                {'email': 'f@example.com', 'first_name': 'D', 'last_name': 'L',
+                 'age': 'old'},
+                {'email': 'g@example.com', 'first_name': 'D' * 81,
+                 'last_name': 'L'},
+                {'email': 'h@example.com', 'first_name': 'D', 'last_name': 'L',
+                 'age': 2 ** 40}]
+        self.assertInvalid('POST', rows, [1, 2, 3, 4, 5])
+        self.assertInvalid('PUT', [{'id': 1, 'email': ['x']},
+                                   {'id': 2, 'age': 'old'},
+                                   {'id': 2, 'weight': None}], [0, 1])
+
+    def test_valid_rows_are_written(self):
+        status, body = self.request('PUT', '/clients/bulk', [
+            {'id': 1, 'first_name': 'D', 'age': 30},
+            {'id': 2, 'first_name': u'\xc9', 'age': None}])
+        self.assertEqual(status, 200)
+        self.assertEqual(self.names(), ['D', u'\xc9'])
+        status, body = self.request('DELETE', '/clients/bulk', [1, 2, 3])
+        self.assertEqual((status, body['succeeded'], body['failed']), (200, 2, 1))
@@ -0,0 +1,60 @@
+"""Password hashes, their pool and their upgrade on login."""
+from werkzeug.security import generate_password_hash
+
+from app import db, hashing
+from app.models import User
+
+from tests.base import AppTestCase, TestConfig
+
+
+class RehashTest(AppTestCase):
+
+    def test_needs_rehash(self):
+        with self.app.app_context():
+            current = hashing.hash_password('secret')
+            self.assertFalse(hashing.needs_rehash(current))
+            for method, salt_length in (('pbkdf2:sha256:500', 8),
+                                        ('pbkdf2:sha1:1000', 8),
+                                        ('pbkdf2:sha256:1000', 16)):
+                self.assertTrue(hashing.needs_rehash(generate_password_hash(
+                    'secret', method, salt_length)))
+
+    def stored_hash(self):
+        with self.app.app_context():
+            return User.query.filter_by(username='trainer').one().password
+
+    def test_login_upgrades_the_hash(self):
+        self.login()
+        with self.app.app_context():
+            db.session.execute(User.__table__.update().values(
+                password=generate_password_hash('secret', 'pbkdf2:sha1:500')))
+            db.session.commit()
+        status, _ = self.request('POST', '/login', {
+            'username': 'trainer', 'password': 'wrong'})
+        self.assertEqual(status, 401)
+        self.assertTrue(self.stored_hash().startswith('pbkdf2:sha1:500$'))
+        self.login()
+        self.assertTrue(self.stored_hash().startswith('pbkdf2:sha256:1000$'))
+        upgraded = self.stored_hash()
+        self.login()
+        self.assertEqual(self.stored_hash(), upgraded)
+
+
+class PoolConfig(TestConfig):
+    PASSWORD_HASH_POOL_SIZE = 1
+
+
+class PoolTest(AppTestCase):
+    config = PoolConfig
+
+    def tearDown(self):
+        hashing.shutdown()
+        super(PoolTest, self).tearDown()
+
+    def test_pool_starts_with_the_app(self):
+        self.assertIsNotNone(hashing._pool)
+        self.login()
+        with self.app.app_context():
+            hashing.shutdown()
+            with self.assertRaises(RuntimeError):
+                hashing.hash_password('secret')
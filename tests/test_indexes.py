@@ -0,0 +1,127 @@
+"""The hot lookups of the API are served by indexes.
+
+Seeds a dataset and asserts that the plan of every lookup reads an index
+instead of scanning a whole table. On PostgreSQL (DATABASE_URL) sequential
+scans are disabled so that a missing index shows up whatever the size of the
+tables.
+"""
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from app.filters import include_object
+from app.models import User, Client, Plan, Day, Exercise, \
+    day_association_table, exercise_association_table
+
+from tests.base import AppTestCase
+
+days = day_association_table
+exercises = exercise_association_table
+
+
+LOOKUPS = [
+    ('clients of an owner',
+     db.select([Client.id]).where(Client.owner_id == 1)),
+    ('clients of plans',
+     db.select([Client.id]).where(Client.plan_id.in_([1, 2, 3]))),
+    ('days of a plan',
+     db.select([Day.name])
+     .select_from(days.join(Day, Day.id == days.c.day_id))
+     .where(days.c.plan_id == 1)),
+    ('plans of a day',
+     db.select([days.c.plan_id]).where(days.c.day_id == 1)),
+    ('exercises of a day',
+     db.select([Exercise.name])
+     .select_from(exercises.join(
+         Exercise, Exercise.id == exercises.c.exercise_id))
+     .where(exercises.c.day_id == 1)),
+    ('days of an exercise',
+     db.select([exercises.c.day_id]).where(exercises.c.exercise_id == 1)),
+]
+
+
+def seed(plans):
+    db.session.execute(User.__table__.insert(), [
+        {'username': 'trainer%d' % i, 'password': 'x'} for i in range(plans)])
+    for model in (Plan, Day, Exercise):
+        db.session.execute(model.__table__.insert(), [
+            {'name': '%s%d' % (model.__tablename__, i)} for i in range(plans)])
+    db.session.execute(days.insert(), [
+        {'plan_id': i + 1, 'day_id': (i + k) % plans + 1}
+        for i in range(plans) for k in range(3)])
+    db.session.execute(exercises.insert(), [
+        {'day_id': i + 1, 'exercise_id': (i + k) % plans + 1}
+        for i in range(plans) for k in range(5)])
+    db.session.execute(Client.__table__.insert(), [
+        {'email': 'client%d@example.com' % i, 'first_name': 'First',
+         'last_name': 'Last', 'owner_id': i % plans + 1,
+         'plan_id': i % plans + 1} for i in range(plans * 10)])
+    db.session.commit()
+
+
+def explain(statement):
+    """The lines of the query plan, and whether it scans a whole table.
+
+    The values are bound as parameters, as they are when the API runs the
+    statement; some plans only use an index for literals.
+    """
+    dialect = db.engine.dialect
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = [params[name] for name in compiled.positiontup]
+    cursor = db.session.connection().connection.cursor()
+    if dialect.name == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)
+        lines = [row[-1] for row in cursor.fetchall()]
+        # SCAN reads every row of the table, or every entry of an index
+        # (USING COVERING INDEX); SEARCH reads a range of an index
+        full_scan = any(line.startswith('SCAN') for line in lines)
+    else:
+        cursor.execute('EXPLAIN ' + str(compiled), params)
+        lines = [row[0] for row in cursor.fetchall()]
+        full_scan = any('Seq Scan' in line for line in lines)
+    return lines, full_scan
+
+
+class IndexTest(AppTestCase):
+
+    def setUp(self):
+        super(IndexTest, self).setUp()
+        self.context = self.app.app_context()
+        self.context.push()
+        seed(200)
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute('ANALYZE')
+            db.session.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        db.session.rollback()
+        self.context.pop()
+        super(IndexTest, self).tearDown()
+
+    def test_lookups_use_indexes(self):
+        scans = []
+        for name, statement in LOOKUPS:
+            lines, full_scan = explain(statement)
+            if full_scan:
+                scans.append('%s:\n    %s' % (name, '\n    '.join(lines)))
+        self.assertEqual(scans, [], 'full scans in\n' + '\n'.join(scans))
+
+    def test_prefix_search_uses_the_search_index(self):
+        criteria = Client.filters.criteria(
+            MultiDict([('email__startswith', u'Client1')]))
+        statement = db.select([Client.id]).where(db.and_(*criteria))
+        lines, full_scan = explain(statement)
+        self.assertFalse(full_scan, '\n'.join(lines))
+        if db.engine.dialect.name == 'sqlite':
+            self.assertIn('ix_clients_email_nocase', ''.join(lines))
+        self.assertEqual(len(db.session.execute(statement).fetchall()), 1111)
+
+    def test_autogenerate_keeps_the_search_indexes(self):
+        # the indexes are created by DDL, alembic sees them as dropped
+        context = MigrationContext.configure(
+            db.session.connection(),
+            opts={'include_object': include_object})
+        self.assertEqual(compare_metadata(context, db.metadata), [])
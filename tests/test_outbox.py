@@ -0,0 +1,98 @@
+"""Outbox batches go over one SMTP connection, to one worker."""
+import smtplib
+
+from app import db, outbox
+from app.models import Notification
+
+from tests.base import AppTestCase
+
+
+class FakeSMTP(object):
+    connections = []
+    refused = set()
+
+    def __init__(self, host, port):
+        self.sent = []
+        FakeSMTP.connections.append(self)
+
+    def sendmail(self, sender, to, message):
+        if to[0] in self.refused:
+            raise smtplib.SMTPRecipientsRefused({to[0]: (550, 'No such user')})
+        self.sent.extend(to)
+
+    def quit(self):
+        pass
+
+
+class OutboxTest(AppTestCase):
+
+    def setUp(self):
+        super(OutboxTest, self).setUp()
+        self.login()
+        for name in ('ann', 'bob', 'cid'):
+            self.request('POST', '/clients', {
+                'email': name + '@example.com', 'first_name': name,
+                'last_name': 'Lee'})
+        self.request('POST', '/plans', {'name': 'legs', 'clients': [1, 2, 3]})
+        FakeSMTP.connections = []
+        FakeSMTP.refused = set()
+        self.smtp, outbox.smtplib.SMTP = outbox.smtplib.SMTP, FakeSMTP
+        self.transport = outbox.SMTPTransport('localhost', 25, 'noreply@localhost')
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        outbox.smtplib.SMTP = self.smtp
+        super(OutboxTest, self).tearDown()
+
+    def test_batch_goes_over_one_connection(self):
+        self.assertEqual(outbox.drain(self.transport, 100), 3)
+        self.assertEqual(len(FakeSMTP.connections), 1)
+        self.assertEqual(sorted(FakeSMTP.connections[0].sent),
+                         ['ann@example.com', 'bob@example.com', 'cid@example.com'])
+        self.assertEqual(Notification.query.filter(
+            Notification.sent_at.is_(None)).count(), 0)
+
+    def test_failed_rows_are_retried_alone(self):
+        FakeSMTP.refused.add('bob@example.com')
+        outbox.drain(self.transport, 100)
+        failed = Notification.query.filter(Notification.sent_at.is_(None)).all()
+        self.assertEqual([row.attempts for row in failed], [1])
+        self.assertIn('SMTPRecipientsRefused', failed[0].last_error)
+
+    def test_claimed_rows_go_to_one_worker(self):
+        self.assertEqual(len(outbox.claim(100)), 3)
+        self.assertEqual(outbox.claim(100), [])
+
+    def test_rows_of_a_dead_worker_come_due_again(self):
+        self.app.config['OUTBOX_CLAIM_TIMEOUT'] = 0
+        first = [(row.id, row.claimed_by) for row in outbox.claim(100)]
+        self.assertEqual(len(first), 3)
+        again = [(row.id, row.claimed_by) for row in outbox.claim(100)]
+        self.assertEqual([i for i, _ in again], [i for i, _ in first])
+        self.assertNotEqual(again[0][1], first[0][1])
+
+    def test_plan_update_is_announced_once(self):
+        self.context.pop()
+        self.request('POST', '/days', {'name': 'squats'})
+        self.request('PUT', '/plans/1', {'name': 'legs'})
+        self.request('PUT', '/plans/1', {'name': 'lower body', 'days': [1]})
+        self.request('PUT', '/plans/1', {'days': [1]})
+        self.context.push()
+        self.assertEqual(Notification.query.filter_by(
+            kind='plan_updated').count(), 1)
+        self.assertEqual(outbox.drain(self.transport, 100), 4)
+        self.assertEqual(len(FakeSMTP.connections[0].sent), 6)
+
+    def test_partly_refused_rows_are_sent(self):
+        self.context.pop()
+        self.request('PUT', '/plans/1', {'name': 'lower body'})
+        self.context.push()
+        FakeSMTP.refused.add('bob@example.com')
+        outbox.drain(self.transport, 100)
+        failed = Notification.query.filter(Notification.sent_at.is_(None))
+        self.assertEqual([row.kind for row in failed], ['plan_assigned'])
+        self.assertEqual(sorted(FakeSMTP.connections[0].sent),
+                         ['ann@example.com'] * 2 + ['cid@example.com'] * 2)
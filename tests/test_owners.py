@@ -0,0 +1,48 @@
+"""Trainers only see and assign their own clients."""
+from tests.base import AppTestCase, TestConfig
+
+
+class PlanClientsTest(AppTestCase):
+
+    def setUp(self):
+        super(PlanClientsTest, self).setUp()
+        self.login('ann')
+        self.request('POST', '/clients', {'email': 'a@example.com',
+                                          'first_name': 'A', 'last_name': 'A'})
+        self.request('POST', '/plans', {'name': 'legs', 'clients': [1]})
+        self.login('bob')
+        self.request('POST', '/clients', {'email': 'b@example.com',
+                                          'first_name': 'B', 'last_name': 'B'})
+
+    def clients_of(self, url):
+        status, body = self.request('GET', url)
+        self.assertEqual(status, 200)
+        if 'data' in body:
+            return [[c['id'] for c in plan['clients']] for plan in body['data']]
+        return [c['id'] for c in body['clients']]
+
+    def test_other_owners_clients_are_missing(self):
+        status, body = self.request('PUT', '/plans/1', {'clients': [1, 2]})
+        self.assertEqual(body['missing'], {'clients': [1]})
+        self.assertEqual(self.clients_of('/plans/1'), [2])
+        self.login('ann')
+        # bob's update left ann's client in the plan
+        self.assertEqual(self.clients_of('/plans/1'), [1])
+
+    def test_plans_embed_own_clients_only(self):
+        self.request('PUT', '/plans/1', {'clients': [2]})
+        self.assertEqual(self.clients_of('/plans'), [[2]])
+        self.assertEqual(self.clients_of('/plans/1'), [2])
+        self.login('ann')
+        self.assertEqual(self.clients_of('/plans'), [[1]])
+        self.assertEqual(self.clients_of('/plans/1'), [1])
+
+
+class CachedConfig(TestConfig):
+    RESPONSE_CACHE_BACKEND = 'memory'
+    PLAN_DOCUMENTS = False
+
+
+class CachedPlanClientsTest(PlanClientsTest):
+    # per trainer cache entries, and plans read without their documents
+    config = CachedConfig
@@ -0,0 +1,83 @@
+"""Stored plan documents follow every change to plans, days and exercises."""
+from app import db
+from app import plan_documents
+from app.models import PlanDocument
+from tests.base import AppTestCase, TestConfig
+
+
+class DocumentsConfig(TestConfig):
+    PLAN_DOCUMENTS = True
+
+
+class PlanDocumentsTest(AppTestCase):
+    config = DocumentsConfig
+
+    def setUp(self):
+        super(PlanDocumentsTest, self).setUp()
+        self.login()
+        for name in ('squat', 'lunge', 'row'):
+            self.request('POST', '/exercises',
+                         {'name': name, 'activity': 'strength'})
+        self.request('POST', '/days', {'name': 'legs', 'exercises': [1, 2]})
+        self.request('POST', '/days', {'name': 'back', 'exercises': [3]})
+        self.request('POST', '/plans', {'name': 'a', 'days': [1]})
+        self.request('POST', '/plans', {'name': 'b', 'days': [1, 2]})
+
+    def assertDocumentsCurrent(self):
+        with self.app.app_context():
+            stored = dict((d.plan_id, plan_documents.json_provider.loads(
+                d.document)) for d in PlanDocument.query)
+            built = plan_documents.build_documents(db.session, [1, 2, 3])
+        self.assertEqual(stored, built)
+        return stored
+
+    def exercises(self, plan_id):
+        status, body = self.request('GET', '/plans/%d' % plan_id)
+        self.assertEqual(status, 200)
+        return [[e['name'] for e in day['exercises']] for day in body['days']]
+
+    def test_documents_are_built(self):
+        self.assertEqual(sorted(self.assertDocumentsCurrent()), [1, 2])
+        self.assertEqual(self.exercises(2), [['squat', 'lunge'], ['row']])
+
+    def test_exercise_rename_and_delete(self):
+        self.request('PUT', '/exercises/1', {'name': 'front squat'})
+        self.assertDocumentsCurrent()
+        self.assertEqual(self.exercises(1), [['front squat', 'lunge']])
+        self.request('DELETE', '/exercises/2')
+        self.assertDocumentsCurrent()
+        self.assertEqual(self.exercises(2), [['front squat'], ['row']])
+
+    def test_day_changes(self):
+        self.request('PUT', '/days/1', {'name': 'legs', 'exercises': [2]})
+        self.assertDocumentsCurrent()
+        self.assertEqual(self.exercises(1), [['lunge']])
+        self.request('DELETE', '/days/1')
+        self.assertDocumentsCurrent()
+        self.assertEqual(self.exercises(1), [])
+        self.assertEqual(self.exercises(2), [['row']])
+
+    def test_bulk_exercises(self):
+        status, _ = self.request('PUT', '/exercises/bulk',
+                                 [{'id': 3, 'name': 'pull'}])
+        self.assertEqual(status, 200)
+        self.assertDocumentsCurrent()
+        self.assertEqual(self.exercises(2), [['squat', 'lunge'], ['pull']])
+        status, _ = self.request('DELETE', '/exercises/bulk', [1, 3])
+        self.assertEqual(status, 200)
+        self.assertDocumentsCurrent()
+        self.assertEqual(self.exercises(2), [['lunge'], []])
+
+    def test_plan_changes(self):
+        self.request('PUT', '/plans/1', {'name': 'c', 'days': [2]})
+        self.assertEqual(self.assertDocumentsCurrent()[1]['name'], 'c')
+        self.assertEqual(self.exercises(1), [['row']])
+        self.request('DELETE', '/plans/1')
+        self.assertEqual(sorted(self.assertDocumentsCurrent()), [2])
+
+    def test_rebuild_all(self):
+        with self.app.app_context():
+            db.session.execute(PlanDocument.__table__.delete())
+            db.session.commit()
+            self.assertEqual(plan_documents.rebuild_all(batch_size=1), 2)
+        self.assertEqual(sorted(self.assertDocumentsCurrent()), [1, 2])
@@ -0,0 +1,59 @@
+"""The collection GETs run as many statements for 10x the rows."""
+from app import db
+from app.models import Client, Plan, Day, Exercise, \
+    day_association_table, exercise_association_table
+
+from tests.base import AppTestCase
+
+ROWS = 5
+
+
+def seed(rows, owner_id):
+    """``rows`` plans of 3 days of 5 exercises, ``rows`` clients of
+    ``owner_id`` spread over the plans."""
+    for model in (Plan, Day, Exercise):
+        db.session.execute(model.__table__.insert(), [
+            {'name': '%s%d' % (model.__tablename__, i)} for i in range(rows)])
+    db.session.execute(day_association_table.insert(), [
+        {'plan_id': i + 1, 'day_id': (i + k) % rows + 1}
+        for i in range(rows) for k in range(3)])
+    db.session.execute(exercise_association_table.insert(), [
+        {'day_id': i + 1, 'exercise_id': (i + k) % rows + 1}
+        for i in range(rows) for k in range(5)])
+    db.session.execute(Client.__table__.insert(), [
+        {'email': 'client%d@example.com' % i, 'first_name': 'First',
+         'last_name': 'Last', 'owner_id': owner_id, 'plan_id': i % rows + 1}
+        for i in range(rows)])
+    db.session.commit()
+
+
+class QueryCountTest(AppTestCase):
+
+    def statements(self, url, rows):
+        """The statements of GET ``url`` on a fresh database of ``rows``."""
+        self.tearDown()
+        self.setUp()
+        owner_id = self.login()
+        with self.app.app_context():
+            seed(rows, owner_id)
+        (status, body), statements = self.count_statements('GET', url)
+        self.assertEqual(status, 200)
+        # the whole collection fits the page
+        self.assertEqual(len(body['data']), rows)
+        return statements
+
+    def assertConstant(self, url):
+        few = self.statements(url, ROWS)
+        many = self.statements(url, 10 * ROWS)
+        self.assertEqual(len(few), len(many), '%d statements for %d rows, '
+                         '%d for %d:\n%s' % (len(few), ROWS, len(many),
+                                              10 * ROWS, '\n'.join(many)))
+
+    def test_plans(self):
+        self.assertConstant('/plans')
+
+    def test_days(self):
+        self.assertConstant('/days')
+
+    def test_clients(self):
+        self.assertConstant('/clients')
@@ -0,0 +1,98 @@
+"""Login attempts are limited per client IP and per username."""
+import json
+
+from app import auth, rate_limit
+
+from tests.base import AppTestCase, TestConfig
+
+
+class Clock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class MemoryConfig(TestConfig):
+    RATE_LIMIT_BACKEND = 'memory'
+    RATE_LIMITS = {'auth.login': [('ip', 3, 60), ('username', 2, 300)]}
+
+
+class MemoryStoreTest(AppTestCase):
+    config = MemoryConfig
+
+    def setUp(self):
+        super(MemoryStoreTest, self).setUp()
+        self.clock = Clock(6000.0)
+        self.time, rate_limit.time = rate_limit.time, self.clock
+        self.request('POST', '/sign_up',
+                     {'username': 'ann', 'password': 'secret'})
+        self.verified = []
+        self.verify = auth.verify_password
+
+        def verify_password(hashed, password):
+            self.verified.append(password)
+            return self.verify(hashed, password)
+        auth.verify_password = verify_password
+
+    def tearDown(self):
+        rate_limit.time = self.time
+        auth.verify_password = self.verify
+        super(MemoryStoreTest, self).tearDown()
+
+    def login(self, username, ip='10.0.0.1'):
+        response = self.client.post(
+            '/login', environ_base={'REMOTE_ADDR': ip},
+            data=json.dumps({'username': username, 'password': 'wrong'}),
+            content_type='application/json')
+        return response.status_code, response.headers.get('Retry-After')
+
+    def test_limited_before_the_database(self):
+        self.assertEqual(self.login('ann'), (401, None))
+        self.assertEqual(self.login('ann'), (401, None))
+        del self.verified[:]
+        (response, statements) = self.count_statements(
+            'POST', '/login', {'username': 'ann', 'password': 'secret'})
+        self.assertEqual(response[0], 429)
+        self.assertEqual(statements, [])
+        self.assertEqual(self.verified, [])
+
+    def test_retry_after(self):
+        self.login('ann')
+        self.login('ann')
+        self.clock.now += 60
+        self.assertEqual(self.login('ann'), (429, '240'))
+
+    def test_username_and_ip_keys(self):
+        self.login('ann')
+        self.login('ann')
+        self.assertEqual(self.login('ann', ip='10.0.0.2')[0], 429)
+        # other usernames from the same IP, up to the IP's limit
+        self.assertEqual(self.login('bob')[0], 401)
+        self.assertEqual(self.login('cid')[0], 429)
+        self.assertEqual(self.login('bob', ip='10.0.0.2')[0], 401)
+
+    def test_window_expiry(self):
+        self.login('ann')
+        self.login('ann')
+        self.assertEqual(self.login('ann')[0], 429)
+        # the rejected attempt still counted, and the previous window is
+        # weighted in while it overlaps
+        self.clock.now += 300
+        self.assertEqual(self.login('ann')[0], 429)
+        self.clock.now += 300
+        self.assertEqual(self.login('ann')[0], 401)
+
+
+class RedisConfig(MemoryConfig):
+    RATE_LIMIT_BACKEND = 'redis'
+    RATE_LIMIT_REDIS_URL = 'fake://'
+
+
+class RedisStoreTest(MemoryStoreTest):
+    config = RedisConfig
+
+    def test_store(self):
+        self.assertIsInstance(rate_limit.limiter.store, rate_limit.RedisStore)
@@ -0,0 +1,72 @@
+"""Cached GET responses."""
+import unittest
+
+from app import create_app
+
+from tests.base import AppTestCase, TestConfig
+
+
+class MemoryConfig(TestConfig):
+    RESPONSE_CACHE_BACKEND = 'memory'
+
+
+class MemoryBackendTest(AppTestCase):
+    config = MemoryConfig
+
+    def test_writes_invalidate_the_cached_response(self):
+        self.login()
+        self.request('POST', '/exercises', {'name': 'squat', 'activity': 'legs'})
+        (_, first), _ = self.count_statements('GET', '/exercises')
+        (_, cached), statements = self.count_statements('GET', '/exercises')
+        self.assertEqual(cached, first)
+        self.assertEqual(statements, [])
+        self.request('POST', '/exercises', {'name': 'lunge', 'activity': 'legs'})
+        status, body = self.request('GET', '/exercises')
+        self.assertEqual(len(body['data']), 2)
+
+
+class RedisConfig(TestConfig):
+    RESPONSE_CACHE_BACKEND = 'redis'
+    RESPONSE_CACHE_REDIS_URL = 'fake://'
+    COMPRESSION_MIN_SIZE = 0
+
+
+class RedisBackendTest(MemoryBackendTest):
+    config = RedisConfig
+
+    def test_entries_keep_every_encoding(self):
+        self.login()
+        self.request('POST', '/exercises', {'name': 'squat', 'activity': 'legs'})
+        first = self.client.get('/exercises', headers={
+            'Authorization': 'Bearer ' + self.token, 'Accept-Encoding': 'gzip'})
+        cached = self.client.get('/exercises', headers={
+            'Authorization': 'Bearer ' + self.token, 'Accept-Encoding': 'gzip'})
+        self.assertEqual(cached.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(cached.data, first.data)
+        self.assertEqual(cached.headers['ETag'], first.headers['ETag'])
+
+
+class ReplicaConfig(MemoryConfig):
+    # a database of its own without any table, a read from it fails
+    SQLALCHEMY_REPLICA_URI = 'sqlite://'
+
+
+class ReplicaTest(AppTestCase):
+    config = ReplicaConfig
+
+    def test_cached_reads_go_to_the_primary(self):
+        self.login()
+        self.request('POST', '/exercises', {'name': 'squat', 'activity': 'legs'})
+        status, body = self.request('GET', '/exercises')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data'][0]['name'], 'squat')
+
+
+class WorkersTest(unittest.TestCase):
+
+    def test_memory_is_refused_with_several_workers(self):
+        class Workers(MemoryConfig):
+            WEB_WORKERS = 3
+
+        with self.assertRaises(RuntimeError):
+            create_app(Workers)
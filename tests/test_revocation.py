@@ -0,0 +1,133 @@
+"""Revoked tokens, their stores and the Bloom filter in front of them."""
+import time
+import unittest
+
+from app import create_app, db, revocation
+from app.cache import FakeRedis
+from app.models import RevokedToken, User
+from app.revocation import MemoryStore, RedisStore, Revocations, SQLStore
+
+from tests.base import AppTestCase, TestConfig
+
+
+class Clock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class CountingStore(MemoryStore):
+
+    def __init__(self):
+        super(CountingStore, self).__init__()
+        self.lookups = []
+
+    def contains(self, jti):
+        self.lookups.append(jti)
+        return super(CountingStore, self).contains(jti)
+
+
+class RevocationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock(1000.0)
+        self.time, revocation.time = revocation.time, self.clock
+        self.store = CountingStore()
+        self.revocations = self.process()
+
+    def tearDown(self):
+        revocation.time = self.time
+
+    def process(self):
+        return Revocations(self.store, 100, 0.001, sync_interval=5,
+                           max_age=600)
+
+    def test_bloom_filter_spares_the_store(self):
+        self.revocations.revoke('a', 1060)
+        self.assertFalse(self.revocations.is_revoked('b'))
+        self.assertEqual(self.store.lookups, [])
+        self.assertTrue(self.revocations.is_revoked('a'))
+        self.assertEqual(self.store.lookups, ['a'])
+
+    def test_sync_pulls_other_processes_revocations(self):
+        self.assertFalse(self.revocations.is_revoked('a'))
+        other = self.process()
+        self.clock.now += 1
+        other.revoke('a', 1060)
+        # until the next sync this process does not look for it
+        self.assertFalse(self.revocations.is_revoked('a'))
+        self.clock.now += 5
+        self.assertTrue(self.revocations.is_revoked('a'))
+
+    def test_rebuild_forgets_purged_tokens(self):
+        self.revocations.revoke('a', 1060)
+        self.revocations.revoke('b', 2000)
+        self.clock.now += 600
+        self.assertTrue(self.revocations.is_revoked('b'))
+        self.assertEqual(self.store.active(), ['b'])
+        self.assertEqual(self.store.since(0), ['b'])
+        self.assertNotIn('a', self.revocations.bloom)
+
+
+class MemoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+
+    def test_add(self):
+        now = time.time()
+        self.store.add('a', now + 60, now - 10)
+        self.store.add('b', now + 60, now)
+        self.assertTrue(self.store.contains('a'))
+        self.assertFalse(self.store.contains('c'))
+        self.assertEqual(self.store.since(now - 5), ['b'])
+        self.assertEqual(sorted(self.store.active()), ['a', 'b'])
+
+    def test_purge(self):
+        now = time.time()
+        self.store.add('expired', now - 1, now - 60)
+        self.store.add('jti', now + 60, now)
+        self.assertFalse(self.store.contains('expired'))
+        self.store.purge(now)
+        self.assertEqual(self.store.since(0), ['jti'])
+
+
+class RedisStoreTest(MemoryStoreTest):
+
+    def setUp(self):
+        self.store = RedisStore(FakeRedis())
+        self.app = create_app(TestConfig)
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_purge(self):
+        # the keys expire by themselves, the log keeps the revocations of
+        # tokens that may still be valid
+        now = time.time()
+        self.store.add('old', now + 1, now - 601)
+        self.store.add('jti', now + 60, now)
+        self.store.purge(now)
+        self.assertEqual(self.store.since(0), ['jti'])
+
+
+class LogoutTest(AppTestCase):
+
+    def test_tokens_are_revoked_on_logout(self):
+        self.login()
+        old_token, refresh_token = self.token, self.refresh_token
+        self.assertEqual(self.request('GET', '/exercises')[0], 200)
+        self.request('POST', '/logout', {'refresh_token': refresh_token})
+        self.login()
+        self.assertEqual(self.request('GET', '/exercises')[0], 200)
+        self.token = old_token
+        self.assertEqual(self.request('GET', '/exercises'),
+                         (401, {'msg': 'Token has been revoked'}))
+        self.token = refresh_token
+        self.assertEqual(self.request('POST', '/refresh'),
+                         (401, {'msg': 'Token has been revoked'}))
@@ -0,0 +1,62 @@
+"""Field projections share one serializer per subset of the fields."""
+import unittest
+
+from app.serializers import Serializer
+
+from tests.base import AppTestCase
+
+
+class OnlyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.serializer = Serializer(('id', 'name', 'activity'),
+                                     days=Serializer(('id',)))
+
+    def test_order_and_repeats_share_a_variant(self):
+        variant = self.serializer.only(('id', 'name'))
+        self.assertIs(self.serializer.only(('name', 'id', 'name')), variant)
+        self.assertEqual(variant.fields, ('id', 'name'))
+        self.assertEqual(len(self.serializer._only), 1)
+
+    def test_unknown_names_are_ignored(self):
+        variant = self.serializer.only(('id', 'days', 'nope'))
+        self.assertIs(self.serializer.only(('days', 'id')), variant)
+        self.assertEqual(variant.fields, ('id',))
+        self.assertEqual(list(variant.nested), ['days'])
+
+    def test_dump_many_falls_back_per_object(self):
+        class Obj(object):
+            def __init__(self, **attrs):
+                self.__dict__.update(attrs)
+
+        class Expired(Obj):
+            # as the ORM loads an expired attribute
+            name = property(lambda self: 'loaded')
+
+        objs = [Obj(id=1, name='a', activity='x'), Expired(id=2, activity='y')]
+        self.assertEqual(
+            Serializer(('id', 'name', 'activity')).dump_many(iter(objs)),
+            [{'id': 1, 'name': 'a', 'activity': 'x'},
+             {'id': 2, 'name': 'loaded', 'activity': 'y'}])
+
+
+class FieldsTest(AppTestCase):
+
+    def setUp(self):
+        super(FieldsTest, self).setUp()
+        self.login()
+        self.request('POST', '/clients', {'email': 'ann@example.com',
+                                          'first_name': 'Ann',
+                                          'last_name': 'Lee'})
+
+    def test_fields_are_deduplicated_in_a_fixed_order(self):
+        status, body = self.request(
+            'GET', '/clients?fields=last_name,email,last_name')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(body['data'][0]),
+                         ['email', 'id', 'last_name'])
+
+    def test_unknown_fields_are_rejected(self):
+        status, body = self.request('GET', '/clients?fields=email,password')
+        self.assertEqual(status, 422)
+        self.assertEqual(body['message'], 'Unknown field(s): password.')
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+"""wsgi.py -- production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+see gunicorn.conf.py for the serving modes.
+"""
+import os
+
+if os.environ.get('WEB_WORKER_CLASS') == 'gevent' and \
+        os.environ['DATABASE_URL'].startswith('postgres'):
+    # gunicorn's gevent worker patched the standard library before loading
+    # us; psycopg2 is a C extension and needs its own wait callback
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+from app import create_app  # noqa: E402
+
+app = create_app()